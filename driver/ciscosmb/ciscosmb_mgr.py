@@ -32,6 +32,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         while True:
@@ -99,24 +101,35 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
     # Configuration
     # ########################################################################
 
-    def configure(self, config_lines, save_running_config=False, callback=None):
+    def configure(self, config_lines, save_running_config=False, callback=None, pipeline=False):
         """
         Reconfigure device
+        If pipeline is True, lines are streamed and checked for errors, see configure_pipelined()
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         ret = []
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
+        error = None
         self.em.writeln("configure")
         self.wait_for_prompt()
-        for config_line in config_lines:
-            self.em.writeln(config_line)
-            ret = self.wait_for_prompt()
-            if ret:
-                ret += self.em.before
-            # time.sleep(1)
+        if pipeline:
+            error = self.configure_pipelined(config_lines)
+            ret = True
+        else:
+            for config_line in config_lines:
+                self.em.writeln(config_line)
+                ret = self.wait_for_prompt()
+                if ret:
+                    ret += self.em.before
+                # time.sleep(1)
         self.em.writeln("end")
         self.wait_for_prompt()
+        if error:
+            raise self.ElementException(error)
         if save_running_config:
             self.save_running_config()
         return ret
@@ -127,8 +140,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         returns a list
         """
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("show running-config")
+        self.fetch_running_config("show running-config", refresh=refresh)
         
         if filter_ is None:
             return self.running_config
@@ -145,6 +157,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Store running-config as startup-config
         """
+        if self.transaction_save():
+            return True
         if callback:
             callback("Save running-config as startup-config, hostname %s" % self.hostname)
         self.connect()
@@ -294,35 +308,21 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def vlan_interface_get(self, interface=None):
         """
         Get all VLANs on an interface
-        Returns a dict, key is vlan ID
+        Returns an emtypes.VLANS
         """
-        vlans = AttrDict()
+        vlans = emtypes.VLANS()
         untagged_vlan = None
         cmd = "show running-config interface %s" % interface
-        lines = self.run(cmd)
+        lines = self.get_interface_config(interface, cmd)
         for line in lines:
             line = line.strip()
             # print("line", line)
             if line.startswith("switchport trunk allowed vlan "):
-                tmp = line[30:]
-                if tmp.startswith("add "):
-                    tmp = tmp[4:]
-                for t1 in tmp.split(","):
-                    t2 = t1.split("-")
-                    vid1 = int(t2[0])
-                    if len(t2) > 1:
-                        vid2 = int(t2[1])
-                        for t3 in range(vid1, vid2+1):
-                            vlans[t3] = self.VLAN(id=t3)
-                    else:
-                        vlans[vid1] = self.VLAN(id=vid1)
+                vlans.add_range(line[30:])
             elif line.startswith("switchport trunk native vlan "):
                 untagged_vlan = int(line[29:].strip())
         if untagged_vlan:
-            if untagged_vlan in vlans:
-                vlans[untagged_vlan].tagged = False
-            else:
-                vlans[untagged_vlan] = self.VLAN(id=untagged_vlan, tagged=False)
+            vlans.add(untagged_vlan, tagged=False)
         return vlans
 
     def vlan_interface_create(self, interface, vlan, tagged=True):
@@ -367,7 +367,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         # lets parse names, we ignore a bunch of names and directories
         sw_list = []
         if filter_ is None:
-            filter_ = self.get_definition("firmware_filter")
+            filter_ = self.get_definition("firmware_filter", None)
         if filter_:
             r = re.compile(filter_)
         for line in msg.split("\r\n"):
@@ -517,13 +517,13 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.sw_delete(f)
                 if f in bootflash:
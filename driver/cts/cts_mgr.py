@@ -30,6 +30,8 @@ class CTS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
 
@@ -114,9 +116,12 @@ class CTS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Reconfigure device
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
         self.em.writeln("configure")
         match = self.wait_for_prompt()
         if match is None:
@@ -137,8 +142,7 @@ class CTS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         self.connect()
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("display current-config", timeout=60)
+        self.fetch_running_config("display current-config", refresh=refresh, timeout=60)
         
         if filter_ is None:
             return self.running_config
@@ -156,6 +160,8 @@ class CTS_Manager(emmgr.lib.basedriver.BaseDriver):
         Store current-config as startup-config
         status: Todo
         """
+        if self.transaction_save():
+            return True
         self.connect()
         log.debug("------------------- save_running_config() -------------------")
         if callback:
@@ -423,13 +429,13 @@ class CTS_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.swDelete(f)
                 if f in bootflash:
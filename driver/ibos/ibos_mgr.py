@@ -19,6 +19,7 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def __init__(self, **kwargs):
         if not hasattr(self, 'model'):
             self.model = "ibos"
+        self._boot_image = None     # Cached sw_get_boot(), per session
         super().__init__(**kwargs)
 
     # ########################################################################
@@ -32,6 +33,8 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         while True:
@@ -71,7 +74,7 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Disconnect from the element
         """
-        log.debug("------------------- disconnect(%s) -------------------" % self.hostname)
+        log.debug("------------------- disconnect(%s) -------------------", self.hostname)
         if self.transport:
             log.debug("------------------- disconnect() -------------------")
             # self.em.writeln("logout")
@@ -105,12 +108,87 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         self.connect()
         log.debug("------------------- run() -------------------")
         self.em.writeln(cmd)
-        self.wait_for_prompt()
+        self.wait_for_prompt(timeout=timeout)
         output = self.em.before.split("\r\n")
         if len(output) > 1:
            output = output[1:-1]
         return self.filter_(output, filter_)
 
+    # ########################################################################
+    # Generic, asyncio
+    # ########################################################################
+
+    async def async_connect(self):
+        """
+        Connect to the element using telnet or ssh
+        login, go to enable mode
+        """
+        if self.async_em:
+            return
+        await super().async_connect()
+
+        while True:
+            match = await self.async_em.expect({
+                "failed":   r"Login incorrect",
+                "username": r"sername:",
+                "password": r"assword:",
+                "disable": r">",
+                "enable": r"#",
+                })
+            if match == "username":
+                await self.async_em.writeln(self.username)
+                continue
+            elif match == "password":
+                await self.async_em.writeln(self.password)
+                continue
+            elif match in ["disable", "enable"]:
+                break
+            elif match == "failed":
+                raise self.ElementException("Invalid username/password", errno=self.USERNAME_PASSWORD_INVALID)
+
+            raise self.ElementException("Error logging in, no username/password prompt")
+
+        if match == 'disable':
+            await self.async_em.writeln("enable")
+            await self.async_em.expect(r"assword:")
+            await self.async_em.writeln(self.enable_password)
+            await self.async_wait_for_prompt()
+
+        await self.async_em.writeln("terminal no pager")
+        await self.async_wait_for_prompt()
+
+    async def async_run(self, cmd=None, filter_=None, timeout=None, callback=None):
+        """
+        Run a command on element
+        returns a list with configuration lines, optionally filtering lines with a regex
+        """
+        await self.async_connect()
+        log.debug("------------------- async_run() -------------------")
+        await self.async_em.writeln(cmd)
+        await self.async_wait_for_prompt(timeout=timeout)
+        output = self.async_em.before.split("\r\n")
+        if len(output) > 1:
+           output = output[1:-1]
+        return self.filter_(output, filter_)
+
+    async def async_configure(self, config_lines=None, save_running_config=False, callback=None):
+        """
+        Reconfigure device
+        """
+        await self.async_connect()
+        log.debug("------------------- async_configure() -------------------")
+        config_lines = self.str_to_lines(config_lines)
+        await self.async_em.writeln("configure terminal")
+        await self.async_em.expect("\(config\)#")
+        for config_line in config_lines:
+            await self.async_em.writeln(config_line)
+            await self.async_em.expect("\)#")
+        await self.async_em.writeln("end")
+        await self.async_wait_for_prompt()
+        if save_running_config:
+            await self.async_run("copy running-config startup-config")
+        return True
+
     def license_get(self):
         # Check if there is a license
         cmd = "show license"
@@ -174,25 +252,35 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
     # Configuration
     # ########################################################################
 
-    def configure(self, config_lines=None, save_running_config=False, callback=None):
+    def configure(self, config_lines=None, save_running_config=False, callback=None, pipeline=False):
         """
         Reconfigure device
-        todo: trigger on  '%-ERR: <error description>'
+        If pipeline is True, lines are streamed and checked for errors, see configure_pipelined()
+        todo: trigger on  '%-ERR: <error description>' when not pipelined
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
+        error = None
         self.em.writeln("configure terminal")
         match = self.em.expect("\(config\)#")
         if match is None:
             raise self.ElementException("Error Could not enter configuration mode")
-        for config_line in config_lines:
-            self.em.writeln(config_line)
-            match = self.em.expect("\)#")
-            if match is None:
-                raise self.ElementException("Error waiting for next configuration prompt")
+        if pipeline:
+            error = self.configure_pipelined(config_lines)
+        else:
+            for config_line in config_lines:
+                self.em.writeln(config_line)
+                match = self.em.expect("\)#")
+                if match is None:
+                    raise self.ElementException("Error waiting for next configuration prompt")
         self.em.writeln("end")
         self.wait_for_prompt()
+        if error:
+            raise self.ElementException(error)
         if save_running_config:
             self.save_running_config()
         return True
@@ -203,8 +291,7 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         returns a list with lines, optionally filtering lines with a regex
         """
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("show running-config")
+        self.fetch_running_config("show running-config", refresh=refresh)
 
         if filter_ is None:
             return self.running_config
@@ -221,6 +308,8 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Save running-config as startup-config
         """
+        if self.transaction_save():
+            return True
         if callback:
             callback("Save running-config as startup-config, hostname %s" % self.hostname)
         self.run("copy running-config startup-config")
@@ -240,23 +329,49 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         iBOS does not have any command to reset interface config 
         Get all interface config and try to remove them
-        """
-        for i in range(1,3):
-            cmd = "show running-config context interface %s" % interface
-            lines = self.run(cmd)
-            if len(lines) < 4:
+        The first round uses the running-config, if already fetched
+        """
+        return self.interfaces_clear_config(interfaces=[interface], save_running_config=save_running_config, callback=callback)
+
+    def interfaces_clear_config(self, interfaces=None, save_running_config=False, callback=None):
+        """
+        Clear config on a list of interfaces, in one configure session for each round
+        With more than one interface, the running-config is fetched once
+        instead of asking for the config of each interface
+        In a transaction the config is not sent until the end, so there
+        is only one round
+        """
+        interfaces = self.interface_list(interfaces)
+        rounds = 1 if self._transaction is not None else 2
+        for i in range(rounds):
+            if len(interfaces) > 1:
+                self.get_running_config()
+            cmd = []
+            for interface in interfaces:
+                lines = self.get_interface_config(interface, "show running-config context interface %s" % interface)
+                cmd += self._interface_clear_lines(interface, lines)
+            if not cmd:
                 break
+            self.configure(config_lines=cmd, callback=callback)
+        if save_running_config:
+            self.save_running_config()
+        return True
 
-            cmd = ["interface %s" % interface]
-            for line in lines:
-                if line and line[0] != "!" and not line.startswith("interface "):
-                    line = line.strip()
-                    if line.startswith("no "):
-                        cmd.append(line[3:])
-                    else:
-                        cmd.append("no %s" % line)
-            
-            lines = self.configure(config_lines=cmd, save_running_config=save_running_config, callback=callback)
+    def _interface_clear_lines(self, interface, lines):
+        """
+        Returns config lines that removes the interface config in lines
+        """
+        cmd = []
+        for line in lines:
+            if line and line[0] != "!" and not line.startswith("interface "):
+                line = line.strip()
+                if line.startswith("no "):
+                    cmd.append(line[3:])
+                else:
+                    cmd.append("no %s" % line)
+        if cmd:
+            cmd.insert(0, "interface %s" % interface)
+        return cmd
 
     def interface_get_admin_state(self, interface=None):
         """
@@ -331,6 +446,21 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
 
         return peers
 
+    re_mac_table = re.compile(r"^\s*(?P<vlan>\d+)\s+(?P<mac>[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s+\S+\s+(?P<interface>\S+)")
+
+    def mac_table_get(self, interface=None, vlan=None):
+        """
+        Returns the MAC address table, as an emtypes.MACTable
+        """
+        cmd = "show mac-address-table"
+        if interface:
+            cmd += " interface %s" % interface
+        if vlan:
+            cmd += " vlan %s" % vlan
+        table = emtypes.MACTable()
+        table.parse_lines(self.run(cmd), self.re_mac_table)
+        return table
+
     # ########################################################################
     # VLAN management
     # ########################################################################
@@ -385,29 +515,19 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def vlan_interface_get(self, interface=None):
         """
         Get all VLANs on an interface
-        Returns a dict, key is vlan ID
+        Returns an emtypes.VLANS
         """
-        res = AttrDict()
+        res = emtypes.VLANS()
         cmd = "show running-config context interface %s" % interface
-        lines = self.run(cmd)
+        lines = self.get_interface_config(interface, cmd)
         for line in lines:
             line = line.strip()
             # print("line", line)
             if line.startswith("vlan member "):
-                tmp = line[12:]
-                for t1 in tmp.split(","):
-                    t2 = t1.split("-")
-                    vid1 = int(t2[0])
-                    if len(t2) > 1:
-                        vid2 = int(t2[1])
-                        for t3 in range(vid1, vid2+1):
-                            res[t3] = self.VLAN(id=t3)
-                    else:
-                        res[vid1] = self.VLAN(id=vid1)
+                res.add_range(line[12:])
             elif line.startswith("vlan untagged "):
                 tmp = line[14:].strip()
-                vid = int(tmp)
-                res[vid].tagged = False
+                res.add(int(tmp), tagged=False)
         return res
         
     def vlan_interface_create(self, interface=None, vlan=None, tagged=True):
@@ -438,30 +558,34 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
     # File management
     # ########################################################################
 
-    def file_list(self, filter_=None, callback=None):
+    def flash_dir_fetch(self):
         """
-        List all files on the element
+        List the files in flash, returns an emtypes.FlashDir
         """
-        if filter_:
-            r = re.compile(filter_)
         msg = self.run("ls flash:")
         state = 1
-        file_list = []
+        flash_dir = emtypes.FlashDir(device="flash:")
         for line in msg:
             if state == 1:
                 if line.startswith("---"):
                     state = 2
             elif state == 2:
                 tmp = line.split()
-                if len(tmp) < 1:
-                    return file_list
-                f = tmp[4]
-                if filter_:
-                    if r.search(f):
-                        file_list.append(f)
-                else:
-                    file_list.append(f)
-        return file_list
+                if len(tmp) < 5:
+                    break
+                size = int(tmp[1]) if tmp[1].isdigit() else None
+                flash_dir.add(tmp[4], size)
+        return flash_dir
+
+    def invalidate_flash_dir(self):
+        super().invalidate_flash_dir()
+        self._boot_image = None
+
+    def file_list(self, filter_=None, callback=None):
+        """
+        List all files on the element
+        """
+        return self.get_flash_dir().list(filter_)
 
     def file_copy_to(self, mgr=None, filename=None, dest_filename=None, callback=None):
         """
@@ -505,12 +629,24 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
                     callback(block)     # todo, use match
                 continue
             elif match == "done":
+                size = self._transferred_bytes(self.em.match)
                 if callback:
                     callback("Copying done, copied %s block" % block)
                 break
             elif match == "error":
                 raise self.ElementException("File transfer did not start. search buffer: %s" % self.em.before)
         self.wait_for_prompt()
+        self.flash_dir_add(dest_filename or filename, size)
+
+    @staticmethod
+    def _transferred_bytes(line):
+        """
+        Returns size from "Transferred 561821 bytes successfully in 5 seconds"
+        """
+        match = re.search(r"Transferred (\d+) bytes", line)
+        if match:
+            return int(match.group(1))
+        return None
 
     def file_copy_from(self, mgr=None, filename=None, callback=None):
         """
@@ -542,8 +678,11 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def sw_get_boot(self):
         """
         Get firmware image that will be loaded next reboot
+        The result is cached for the session
         """
         self.connect()
+        if self._boot_image is not None:
+            return self._boot_image
         lines = self.run("show boot")
         if len(lines) < 1:
             raise self.ElementException("Can't find boot image")
@@ -552,14 +691,15 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
             raise self.ElementException("Can't find boot image")
         if tmp[0] != 'boot':
             raise self.ElementException("Can't find boot image")
-        return tmp[1]
+        self._boot_image = tmp[1]
+        return self._boot_image
 
     def sw_list(self, filter_=None, callback=None):
         """
         Get a list of all firmware in the element
         """
         if filter_ is None:
-            filter_ = self.get_definition("firmware_filter")
+            filter_ = self.get_definition("firmware_filter", None)
         return self.file_list(filter_=filter_)
 
     def sw_copy_to(self, mgr=None, filename=None, dest_filename=None, callback=None):
@@ -600,12 +740,15 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
                         callback("Copied %s of %s bytes" % (copied_bytes, tmp.group(2)))
                 continue
             elif match == "done":
+                size = self._transferred_bytes(self.em.match)
                 if callback:
                     callback("Copying done, copied %s bytes" % copied_bytes)
                 break
             elif match == "error":
                 raise self.ElementException("File transfer did not start. search buffer: %s" % self.em.before)
         self.wait_for_prompt()
+        if filename != "bootloader":
+            self.flash_dir_add(filename, size)
 
     def sw_copy_from(self, mgr=None, filename=None, callback=None):
         """Copy software from the element"""
@@ -624,17 +767,12 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
             raise self.ElementException("Error cant change boot software, filename %s does not exist" % filename)
 
         # Get current boot sw
-        lines = self.run("show boot")
-        if len(lines) < 1:
-            raise self.ElementException("Can't find current bootfile")
-        tmp = lines[0].split("=")
-        if len(tmp) != 2:
-            raise self.ElementException("Can't find current bootfile")
-        if filename == tmp[1]:
+        if filename == self.sw_get_boot():
             return True
 
         cmd = "boot system flash:%s" % filename
         self.configure(cmd)
+        self.when_applied(setattr, self, "_boot_image", filename)
         return True
 
     def sw_delete(self, filename, callback=None):
@@ -651,6 +789,7 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
 
         cmd = "delete flash:%s" % filename
         self.run(cmd)
+        self.flash_dir_remove(filename)
 
     def sw_delete_unneeded(self, callback=None):
         """
@@ -666,7 +805,7 @@ class IBOS_Manager(emmgr.lib.basedriver.BaseDriver):
         
         for f in files:
             if f != bootimg:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.sw_delete(f)
         return deleted
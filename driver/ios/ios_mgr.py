@@ -32,6 +32,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         # % Authentication failed
@@ -63,6 +65,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
             if match is None:
                 raise self.ElementException("Error waiting for prompt after enable")
             self.em.writeln(self.enable_password)
+            self.wait_for_prompt()
             
         self.em.writeln("terminal length 0")
         self.wait_for_prompt()
@@ -73,7 +76,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Disconnect from the element
         """
-        log.debug("------------------- disconnect(%s) -------------------" % self.hostname)
+        log.debug("------------------- disconnect(%s) -------------------", self.hostname)
         if self.transport:
             # self.em.writeln("logout")
             self.em = None
@@ -96,7 +99,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
                     "reloading2": "closed by foreign host", 
                     "reloading3": "Reload command.", 
                     })
-            log.debug("Reload match: %s" % match)
+            log.debug("Reload match: %s", match)
             if match == "reloading":
                 self.em.writeln("y")
 
@@ -122,30 +125,133 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         self.connect()
         log.debug("------------------- run() -------------------")
         self.em.writeln(cmd)
-        self.wait_for_prompt()
+        self.wait_for_prompt(timeout=timeout)
         output = self.em.before.split("\r\n")
         if len(output) > 1:
             output = output[1:-1]
         return self.filter_(output, filter_)
 
+    # ########################################################################
+    # Generic, asyncio
+    # ########################################################################
+
+    async def async_connect(self):
+        """
+        Connect to the element using telnet or ssh
+        login, go to enable mode
+        """
+        if self.async_em:
+            return
+        await super().async_connect()
+
+        while True:
+            match = await self.async_em.expect({
+                "failed":   r"Authentication failed",
+                "username": r"sername:",
+                "password": r"assword:",
+                "disable": r">",
+                "enable": r"#",
+                })
+            if match == "username":
+                await self.async_em.writeln(self.username)
+                continue
+            elif match == "password":
+                await self.async_em.writeln(self.password)
+                continue
+            elif match in ["disable", "enable"]:
+                break
+            elif match == "failed":
+                raise self.ElementException("Invalid username/password", errno=self.USERNAME_PASSWORD_INVALID)
+
+            raise self.ElementException("Error logging in, no username/password prompt")
+
+        if match == "disable":
+            await self.async_em.writeln("enable")
+            await self.async_em.expect(r"assword:")
+            await self.async_em.writeln(self.enable_password)
+            await self.async_wait_for_prompt()
+
+        await self.async_em.writeln("terminal length 0")
+        await self.async_wait_for_prompt()
+        await self.async_em.writeln("terminal width 0")
+        await self.async_wait_for_prompt()
+
+    async def async_run(self, cmd=None, filter_=None, timeout=None, callback=None):
+        """
+        Run a command on element
+        returns a list with configuration lines, optionally filtering lines with a regex
+        """
+        await self.async_connect()
+        log.debug("------------------- async_run() -------------------")
+        await self.async_em.writeln(cmd)
+        await self.async_wait_for_prompt(timeout=timeout)
+        output = self.async_em.before.split("\r\n")
+        if len(output) > 1:
+            output = output[1:-1]
+        return self.filter_(output, filter_)
+
+    async def async_configure(self, config_lines, save_running_config=False, callback=None):
+        """
+        Reconfigure device
+        """
+        await self.async_connect()
+        log.debug("------------------- async_configure() -------------------")
+        config_lines = self.str_to_lines(config_lines)
+        await self.async_em.writeln("configure terminal")
+        await self.async_wait_for_prompt()
+        self.invalidate_running_config()
+        for config_line in config_lines:
+            await self.async_em.writeln(config_line)
+            await self.async_wait_for_prompt()
+        await self.async_em.writeln("end")
+        await self.async_wait_for_prompt()
+        if save_running_config:
+            await self.async_save_running_config()
+        return True
+
+    async def async_save_running_config(self, callback=None):
+        """
+        Store running-config as startup-config
+        """
+        if callback:
+            callback("Save running-config as startup-config, hostname %s" % self.hostname)
+        await self.async_connect()
+        await self.async_em.writeln("copy running-config startup-config")
+        await self.async_em.expect("startup-config")
+        await self.async_em.writeln("")
+        await self.async_em.expect("[OK]")
+        await self.async_wait_for_prompt()
+        return True
+
     # ########################################################################
     # Configuration
     # ########################################################################
 
 
-    def configure(self, config_lines, save_running_config=False, callback=None):
+    def configure(self, config_lines, save_running_config=False, callback=None, pipeline=False):
         """
         Reconfigure device
+        If pipeline is True, lines are streamed and checked for errors, see configure_pipelined()
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
+        error = None
         self.em.writeln("configure terminal")
         self.wait_for_prompt()
-        for config_line in config_lines:
-            self.em.writeln(config_line)
+        if pipeline:
+            error = self.configure_pipelined(config_lines)
+        else:
+            for config_line in config_lines:
+                self.em.writeln(config_line)
+                self.wait_for_prompt()
         self.em.writeln("end")
         self.wait_for_prompt()
+        if error:
+            raise self.ElementException(error)
         if save_running_config:
             self.save_running_config()
         return True
@@ -156,8 +262,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         returns a list
         """
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("show running-config")
+        self.fetch_running_config("show running-config", refresh=refresh)
         
         if filter_ is None:
             return self.running_config
@@ -174,6 +279,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Store running-config as startup-config
         """
+        if self.transaction_save():
+            return True
         if callback:
             callback("Save running-config as startup-config, hostname %s" % self.hostname)
         self.connect()
@@ -293,7 +400,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
             if peer.local_if:
                 peers.add(peer)
             else:
-                log.warning("Cannot add peer, no local_if. %s" % peer)
+                log.warning("Cannot add peer, no local_if. %s", peer)
         
         # ----- CDP -----
         if interface:
@@ -324,12 +431,27 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
                 if not peers.exists(peer):
                     peers.add(peer)
                 else:
-                    log.warning("Peer %s already added, through LLDP" % peer)
+                    log.warning("Peer %s already added, through LLDP", peer)
             else:
-                log.warning("Cannot add peer, no local_if. %s" % peer)
+                log.warning("Cannot add peer, no local_if. %s", peer)
 
         return peers
 
+    re_mac_table = re.compile(r"^\s*(?P<vlan>\d+|All)\s+(?P<mac>[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4})\s+\S+\s+(?P<interface>\S+)")
+
+    def mac_table_get(self, interface=None, vlan=None):
+        """
+        Returns the MAC address table, as an emtypes.MACTable
+        """
+        cmd = "show mac address-table"
+        if interface:
+            cmd += " interface %s" % interface
+        if vlan:
+            cmd += " vlan %s" % vlan
+        table = emtypes.MACTable()
+        table.parse_lines(self.run(cmd), self.re_mac_table)
+        return table
+
     # ########################################################################
     # VLAN management
     # ########################################################################
@@ -381,35 +503,21 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def vlan_interface_get(self, interface=None):
         """
         Get all VLANs on an interface
-        Returns a dict, key is vlan ID
+        Returns an emtypes.VLANS
         """
-        vlans = AttrDict()
+        vlans = emtypes.VLANS()
         untagged_vlan = None
         cmd = "show running-config interface %s" % interface
-        lines = self.run(cmd)
+        lines = self.get_interface_config(interface, cmd)
         for line in lines:
             line = line.strip()
             # print("line", line)
             if line.startswith("switchport trunk allowed vlan "):
-                tmp = line[30:]
-                if tmp.startswith("add "):
-                    tmp = tmp[4:]
-                for t1 in tmp.split(","):
-                    t2 = t1.split("-")
-                    vid1 = int(t2[0])
-                    if len(t2) > 1:
-                        vid2 = int(t2[1])
-                        for t3 in range(vid1, vid2+1):
-                            vlans[t3] = self.VLAN(id=t3)
-                    else:
-                        vlans[vid1] = self.VLAN(id=vid1)
+                vlans.add_range(line[30:])
             elif line.startswith("switchport trunk native vlan "):
                 untagged_vlan = int(line[29:].strip())
         if untagged_vlan:
-            if untagged_vlan in vlans:
-                vlans[untagged_vlan].tagged = False
-            else:
-                vlans[untagged_vlan] = self.VLAN(id=untagged_vlan, tagged=False)
+            vlans.add(untagged_vlan, tagged=False)
         return vlans
 
     def vlan_interface_create(self, interface, vlan, tagged=True):
@@ -440,39 +548,45 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
     # Software management
     # ########################################################################
     
-    def sw_list(self, filter_=None, callback=None):
+    def flash_dir_fetch(self):
         """
-        Get a list of all firmware in the element
+        List the files in flash, returns an emtypes.FlashDir
         """
+        device = self.get_definition("firmware_device", "flash:")
         self.connect()
-        self.em.writeln("dir flash:")
+        self.em.writeln("dir %s" % device)
         self.em.expect(r"Directory of .*\r\n")
-        self.em.expect("bytes free")
+        self.em.expect(r"bytes free\)?")
         msg = self.em.before
         self.wait_for_prompt()
 
         # lets parse names, we ignore a bunch of names and directories
-        sw_list = []
-        if filter_ is None:
-            filter_ = self.get_definition("firmware_filter")
-        if filter_:
-            r = re.compile(filter_)
+        flash_dir = emtypes.FlashDir(device=device)
         for line in msg.split("\r\n"):
-            if line:
-                tmp = line.split()
-                if tmp[1:3] == ['bytes', 'total']:
-                    break 
-                if "d" in tmp[1]:    # directory?
-                    continue
-                f = tmp[-1]
-                if filter_:
-                    if r.search(f):
-                        sw_list.append(f)
-                else:
-                    sw_list.append(f)
-        return sw_list
+            tmp = line.split()
+            if len(tmp) < 3:
+                continue
+            if tmp[1:3] == ['bytes', 'total']:
+                # 122185728 bytes total (96385024 bytes free)
+                flash_dir.total = int(tmp[0])
+                if len(tmp) > 3 and tmp[3].startswith("("):
+                    flash_dir.free = int(tmp[3][1:])
+                break 
+            if "d" in tmp[1]:    # directory?
+                continue
+            size = int(tmp[2]) if tmp[2].isdigit() else None
+            flash_dir.add(tmp[-1], size)
+        return flash_dir
 
-    def sw_copy_to(self, mgr=None, filename=None, dest_filename="bootflash:", callback=None):
+    def sw_list(self, filter_=None, callback=None):
+        """
+        Get a list of all firmware in the element
+        """
+        if filter_ is None:
+            filter_ = self.get_definition("firmware_filter", None)
+        return self.get_flash_dir().list(filter_)
+
+    def sw_copy_to(self, mgr=None, filename=None, dest_filename=None, callback=None):
         """
         Copy software to the element
         """
@@ -483,6 +597,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         if self.sw_exist(filename):
             return  # already on device
          
+        if not dest_filename:
+            dest_filename = self.get_definition("firmware_device", "flash:")
         cmd = "copy %s/%s %s" % (mgr, filename, dest_filename)
         self.em.writeln(cmd)
         match = self.em.expect(r"Destination filename.*\?")
@@ -506,7 +622,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
                 callback("Copying file to element, block %s" % block)
             match = self.em.expect({
                                 "copying": r'!', 
-                                "done":    r'bytes copied', 
+                                "done":    r'\d+ bytes copied', 
                                 "error":   r"%Error.*\r\n"})
             if match is None:
                 raise self.ElementException("File transfer finished incorrect, self.before=%s" % self.em.before )
@@ -517,12 +633,14 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
                     print("!", end="")
                 continue
             elif match == "done":
+                size = int(self.em.match.split()[0])
                 if callback:
                     callback("Copying done, copied %s block" % block)
                 break
             elif match == "error":
                 raise self.ElementException("File transfer did not start. search buffer: %s" % self.em.before)
         self.wait_for_prompt()
+        self.flash_dir_add(filename, size)
 
     
     def sw_copy_from(self, mgr=None, filename=None, callback=None):
@@ -565,6 +683,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
 
         self.em.write("y")            # confirm deletion
         self.wait_for_prompt()
+        self.flash_dir_remove(filename)
 
     def sw_delete_unneeded(self, callback=None):
         """
@@ -578,7 +697,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         files = self.sw_list()
 
         # Get the boot flash image
-        lines = self.getRunningConfig(filter_="^boot system flash")
+        lines = self.get_running_config(filter_="^boot system flash")
         for line in lines:
             filename = line[18:].strip()
             if filename in files:
@@ -588,7 +707,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
             bootflash[filename] = line
         
         # Check the currently running firmware
-        lines = self.getCommandOutput("show version", filter_="^System image file is")
+        lines = self.run("show version", filter_="^System image file is")
         if len(lines) < 1:
             raise self.ElementException("Unexpected state, can't find command that selects operating system (1)")
         line = lines[0].strip()
@@ -604,13 +723,13 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.sw_delete(f)
                 if f in bootflash:
@@ -627,15 +746,15 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
             raise self.ElementException("Error cant change boot software, filename %s does not exist" % filename)
         
         # remove old boot system flash commands
-        lines = self.getRunningConfig(filter_="^boot system flash ")
-        for line in lines[1:]:
-            print("   no " + line)
-            self.configure("no " + line)
+        config_lines = []
+        lines = self.get_running_config(filter_="^boot system flash ")
+        for line in lines:
+            log.debug("Removing %s", line)
+            config_lines.append("no " + line)
 
         # set new boot system flash        
-        cmd = "boot system flash %s" % filename
-        self.configure(cmd)
-        self.wait_for_prompt()
+        config_lines.append("boot system flash %s" % filename)
+        self.configure(config_lines)
 
     def sw_upgrade(self, mgr=None, filename=None, setboot=True, callback=None):
         """
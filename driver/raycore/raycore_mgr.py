@@ -9,6 +9,7 @@ from orderedattrdict import AttrDict
 
 import emmgr.lib.log as log
 import emmgr.lib.comm as comm
+import emmgr.lib.emtypes as emtypes
 import emmgr.lib.basedriver
 
 
@@ -31,6 +32,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         while True:
@@ -131,9 +134,12 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         Reconfigure device
         Raycore has no configuration mode, everything is commands, as in run
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
         self.em.writeln("configure")
         self.wait_for_prompt()
         for config_line in config_lines:
@@ -150,8 +156,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         returns a list
         """
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("show running-config")
+        self.fetch_running_config("show running-config", refresh=refresh)
         
         if filter_ is None:
             return self.running_config
@@ -169,6 +174,8 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         Store running-config as startup-config
         Raycore always commits directly to startup-config, this is an no-op
         """
+        if self.transaction_save():
+            return True
         if callback:
             callback("Save running-config as startup-config, hostname %s" % self.hostname)
         # self.connect()
@@ -325,35 +332,21 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
     def vlan_interface_get(self, interface=None):
         """
         Get all VLANs on an interface
-        Returns a dict, key is vlan ID
+        Returns an emtypes.VLANS
         """
-        vlans = AttrDict()
+        vlans = emtypes.VLANS()
         untagged_vlan = None
         cmd = "show running-config interface %s" % interface
-        lines = self.run(cmd)
+        lines = self.get_interface_config(interface, cmd)
         for line in lines:
             line = line.strip()
             # print("line", line)
             if line.startswith("switchport trunk allowed vlan "):
-                tmp = line[30:]
-                if tmp.startswith("add "):
-                    tmp = tmp[4:]
-                for t1 in tmp.split(","):
-                    t2 = t1.split("-")
-                    vid1 = int(t2[0])
-                    if len(t2) > 1:
-                        vid2 = int(t2[1])
-                        for t3 in range(vid1, vid2+1):
-                            vlans[t3] = self.VLAN(id=t3)
-                    else:
-                        vlans[vid1] = self.VLAN(id=vid1)
+                vlans.add_range(line[30:])
             elif line.startswith("switchport trunk native vlan "):
                 untagged_vlan = int(line[29:].strip())
         if untagged_vlan:
-            if untagged_vlan in vlans:
-                vlans[untagged_vlan].tagged = False
-            else:
-                vlans[untagged_vlan] = self.VLAN(id=untagged_vlan, tagged=False)
+            vlans.add(untagged_vlan, tagged=False)
         return vlans
 
     def vlan_interface_create(self, interface, vlan, tagged=True):
@@ -398,7 +391,7 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         # lets parse names, we ignore a bunch of names and directories
         sw_list = []
         if filter_ is None:
-            filter_ = self.get_definition("firmware_filter")
+            filter_ = self.get_definition("firmware_filter", None)
         if filter_:
             r = re.compile(filter_)
         for line in msg.split("\r\n"):
@@ -548,13 +541,13 @@ class IOS_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.sw_delete(f)
                 if f in bootflash:
@@ -8,6 +8,7 @@ import re
 
 import emmgr.lib.log as log
 import emmgr.lib.comm as comm
+import emmgr.lib.emtypes as emtypes
 import emmgr.lib.basedriver
 
 
@@ -29,6 +30,8 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         if not self.use_ssh:
@@ -105,22 +108,32 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
     # Configuration
     # ########################################################################
 
-    def configure(self, config_lines, save_running_config=False, callback=None):
+    def configure(self, config_lines, save_running_config=False, callback=None, pipeline=False):
         """
         Reconfigure device
+        If pipeline is True, lines are streamed and checked for errors, see configure_pipelined()
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
+        error = None
         self.em.writeln("system")
         match = self.wait_for_prompt()
         if match is None:
             raise self.ElementException("Error Could not enter configuration mode")
-        for config_line in config_lines:
-            self.em.writeln(config_line)
-            self.wait_for_prompt()
+        if pipeline:
+            error = self.configure_pipelined(config_lines)
+        else:
+            for config_line in config_lines:
+                self.em.writeln(config_line)
+                self.wait_for_prompt()
         self.em.writeln("return")
         self.wait_for_prompt()
+        if error:
+            raise self.ElementException(error)
         if save_running_config:
             self.save_running_config()
         return True
@@ -132,8 +145,7 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         self.connect()
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("display current-config", timeout=60)
+        self.fetch_running_config("display current-config", refresh=refresh, timeout=60)
         
         if filter_ is None:
             return self.running_config
@@ -151,6 +163,8 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
         Store current-config as startup-config
         status: Todo
         """
+        if self.transaction_save():
+            return True
         self.connect()
         log.debug("------------------- save_running_config() -------------------")
         if callback:
@@ -201,6 +215,21 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         raise ElementException("Not implemented")
 
+    re_mac_table = re.compile(r"^(?P<mac>[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4})\s+(?P<vlan>\d+)\S*\s+(?:-\s+)*(?P<interface>[A-Za-z]\S*)")
+
+    def mac_table_get(self, interface=None, vlan=None):
+        """
+        Returns the MAC address table, as an emtypes.MACTable
+        """
+        cmd = "display mac-address"
+        if interface:
+            cmd += " interface %s" % interface
+        if vlan:
+            cmd += " vlan %s" % vlan
+        table = emtypes.MACTable()
+        table.parse_lines(self.run(cmd), self.re_mac_table)
+        return table
+
     # ########################################################################
     # VLAN management
     # ########################################################################
@@ -417,13 +446,13 @@ class VRP_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.swDelete(f)
                 if f in bootflash:
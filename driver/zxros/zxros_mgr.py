@@ -29,6 +29,8 @@ class ZXROS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         if self.em:
             return
+        if self.connect_pooled():
+            return
         super().connect()
 
         if not self.use_ssh:
@@ -110,9 +112,12 @@ class ZXROS_Manager(emmgr.lib.basedriver.BaseDriver):
         """
         Reconfigure device
         """
+        if self.transaction_add(config_lines, save_running_config):
+            return True
         self.connect()
         log.debug("------------------- configure() -------------------")
         config_lines = self.str_to_lines(config_lines)
+        self.invalidate_running_config()
         self.em.writeln("configure terminal")
         match = self.wait_for_prompt()
         if match is None:
@@ -131,8 +136,7 @@ class ZXROS_Manager(emmgr.lib.basedriver.BaseDriver):
         returns a list
         """
         log.debug("------------------- get_running_config() -------------------")
-        if not refresh and self.running_config is None:
-            self.running_config = self.run("show running-config", timeout=60)
+        self.fetch_running_config("show running-config", refresh=refresh, timeout=60)
         
         if filter_ is None:
             return self.running_config
@@ -150,6 +154,8 @@ class ZXROS_Manager(emmgr.lib.basedriver.BaseDriver):
         Store current-config as startup-config
         status: Todo
         """
+        if self.transaction_save():
+            return True
         log.debug("------------------- save_running_config() -------------------")
         if callback:
             callback("Save current-config as startup-config, hostname %s" % self.hostname)
@@ -415,13 +421,13 @@ class ZXROS_Manager(emmgr.lib.basedriver.BaseDriver):
         if filename in files:
             keep[filename] = ""
         else:
-            log.warning("Host %s running firmware (%s) does not exist in flash" % (self.hostname, filename))
+            log.warning("Host %s running firmware (%s) does not exist in flash", self.hostname, filename)
 
         for f in files:
             if f in keep:
-                log.debug("Keeping file %s" % f)
+                log.debug("Keeping file %s", f)
             else:
-                log.debug("Deleting file %s" % f)
+                log.debug("Deleting file %s", f)
                 deleted.append(f)
                 self.swDelete(f)
                 if f in bootflash:
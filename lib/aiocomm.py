@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+'''
+Functionality to communicate with remote nodes, in a Expect like way,
+using asyncio. One event loop can drive thousands of connections.
+
+Supports ssh (needs the asyncssh module) and telnet
+'''
+
+import asyncio
+import functools
+import importlib.util
+
+import emmgr.lib.log as log
+import emmgr.lib.metrics as metrics
+from emmgr.lib.comm import CommException, Matcher, TranscriptWriter, prompt_reset_re
+
+
+# Telnet protocol
+IAC  = 255
+DONT = 254
+DO   = 253
+WONT = 252
+WILL = 251
+SB   = 250
+SE   = 240
+
+
+class AsyncTelnet_Connection:
+    """
+    A minimal telnet client, refuses all telnet options (like telnetlib does)
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self._iac = b""         # Incomplete telnet command, from previous read
+        self._sb = False        # True if inside subnegotiation
+
+    async def connect(self, host, port=None, username=None, password=None, timeout=None):
+        """
+        Open a telnet connection
+        """
+        if port is None:
+            port = 23
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(str(host), port), timeout)
+        except (OSError, asyncio.TimeoutError) as err:
+            raise CommException(1, "Timeout connecting to %s" % host)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def read(self, length=4096):
+        try:
+            data = await self.reader.read(length)
+        except OSError as err:
+            raise CommException(1, str(err))
+        if not data:
+            return None     # disconnected
+        return self._process_iac(data)
+
+    async def write(self, data):
+        try:
+            self.writer.write(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+            await self.writer.drain()
+        except OSError as err:
+            raise CommException(1, str(err))
+
+    def _process_iac(self, data):
+        """
+        Remove telnet commands from data, and answer option negotiations
+        """
+        data = self._iac + data
+        self._iac = b""
+        res = bytearray()
+        reply = bytearray()
+        ix = 0
+        while ix < len(data):
+            c = data[ix]
+            if c != IAC:
+                if not self._sb:
+                    res.append(c)
+                ix += 1
+                continue
+            if ix + 1 >= len(data):
+                self._iac = data[ix:]
+                break
+            cmd = data[ix + 1]
+            if cmd == IAC:
+                if not self._sb:
+                    res.append(IAC)
+                ix += 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if ix + 2 >= len(data):
+                    self._iac = data[ix:]
+                    break
+                opt = data[ix + 2]
+                if cmd in (DO, DONT):
+                    reply += bytes([IAC, WONT, opt])
+                else:
+                    reply += bytes([IAC, DONT, opt])
+                ix += 3
+            elif cmd == SB:
+                self._sb = True
+                ix += 2
+            elif cmd == SE:
+                self._sb = False
+                ix += 2
+            else:
+                ix += 2
+        if reply:
+            self.writer.write(bytes(reply))
+        return bytes(res)
+
+
+@functools.lru_cache(maxsize=None)
+def ssh_available():
+    """
+    Returns True if the asyncssh module is installed, needed for async ssh
+    """
+    return importlib.util.find_spec("asyncssh") is not None
+
+
+class AsyncSSH_Connection:
+    """
+    A Wrapper for a SSH connection, using asyncssh
+    """
+    def __init__(self):
+        self.conn = None
+        self.process = None
+
+    async def connect(self, host, port=None, username=None, password=None, timeout=None):
+        """
+        Open a SSH connection, authenticate and start a shell
+        """
+        try:
+            import asyncssh
+        except ImportError:
+            raise CommException(1, "Async ssh needs the asyncssh module")
+        if port is None:
+            port = 22
+        try:
+            self.conn = await asyncio.wait_for(
+                asyncssh.connect(str(host), port=port, username=username, password=password,
+                                 known_hosts=None),
+                timeout)
+            self.process = await self.conn.create_process(term_type="dumb", encoding=None)
+        except (OSError, asyncssh.Error, asyncio.TimeoutError) as err:
+            raise CommException(1, "Cannot connect using ssh, err: %s" % err)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    async def read(self, length=4096):
+        try:
+            data = await self.process.stdout.read(length)
+        except OSError as err:
+            raise CommException(1, str(err))
+        if not data:
+            return None     # disconnected
+        return data
+
+    async def write(self, data):
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+
+class AsyncRemoteConnection:
+    """
+    Open a telnet or ssh connection, asyncio version of comm.RemoteConnection
+
+    - handles the decode/encode between string and bytes
+    - ensures that all newlines follows unix style "\n"
+    """
+
+    def __init__(self, codec="utf8", timeout=10, method=None, newline=None, record=None):
+        self._codec = codec
+        self._timeout = timeout
+        self._method = method
+        self._record = record       # Filename or TranscriptWriter, all sent and received data is saved here
+        self.transcript = None
+
+        self._buffer = b""
+        if newline:
+            self.newline = newline
+        else:
+            self.newline = "\n"
+        self.conn = None
+
+    async def connect(self, host, port=None, username=None, password=None):
+        if self._method == "ssh":
+            self.conn = AsyncSSH_Connection()
+        elif self._method == "telnet":
+            self.conn = AsyncTelnet_Connection()
+        else:
+            raise CommException(1, "Unknown connection method %s" % self._method)
+        with metrics.span("connect"):
+            await self.conn.connect(host, port=port, username=username, password=password, timeout=self._timeout)
+        if isinstance(self._record, TranscriptWriter):
+            self.transcript = self._record      # Owned by the caller
+        elif self._record:
+            self.transcript = TranscriptWriter(self._record)
+
+    def disconnect(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+        if self.transcript:
+            if self.transcript is not self._record:
+                self.transcript.close()
+            self.transcript = None
+
+    def unread(self, data):
+        """
+        Return data to beginning of buffer
+        """
+        self._buffer = data.encode(self._codec) + self._buffer
+
+    async def read(self, length=4096, timeout=None):
+        """
+        read from connection
+        length is maximum number of bytes to read
+        Returns None on timeout or disconnect
+        """
+        if not self._buffer:
+            try:
+                data = await asyncio.wait_for(self.conn.read(length), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if data is None:
+                return None  # disconnected
+            if self.transcript:
+                self.transcript.record(b"r", data)
+            self._buffer = data
+        data = self._buffer[:length]
+        self._buffer = self._buffer[length:]
+        return data.decode(self._codec, errors="ignore")
+
+    async def write(self, line):
+        data = line.encode(self._codec)
+        await self.conn.write(data)
+        if self.transcript:
+            self.transcript.record(b"w", data)
+
+    async def writeln(self, msg=None):
+        if msg:
+            await self.write(msg + self.newline)
+        else:
+            await self.write(self.newline)
+
+
+class AsyncExpect:
+    """
+    Implements expect functionality, asyncio version of comm.Expect
+    """
+
+    def __init__(self, transport=None, lookbehind=None):
+        self.transport = transport
+        self.lookbehind = lookbehind
+        self.before = ''
+        self.match = None        # result from last match
+        self.prompt = None       # comm.Prompt, learned prompt of the session
+
+    async def expect(self, matches, timeout=20):
+        """
+        Wait until match or timeout
+        If match, returns key of which regex matched
+        if no match (timeout), raises CommException
+        """
+        with metrics.span("expect"):
+            return await self._expect(matches, timeout)
+
+    async def _expect(self, matches, timeout):
+        self.before = ''
+        self.match = None
+        matcher = Matcher(matches, lookbehind=self.lookbehind)
+
+        while True:
+            c = await self.transport.read(timeout=timeout)
+            if c is None:
+                break
+            key = matcher.feed(c)
+            if key is not None:
+                self.before = matcher.before
+                self.match = matcher.match
+                if log.isEnabledFor(log.DEBUG):
+                    log.debug("  async expect, matched pattern: '%s' %s", key, matcher.regex)
+                if len(matcher.after):
+                    self.transport.unread(matcher.after)  # text after match is returned to transport
+                return key
+        self.before = matcher.get_data()
+        raise CommException(1, "  async expect, timeout, self.before: %s" % self.before)
+
+    async def write(self, msg=None):
+        if msg == None: msg = ""
+        log.debug("------------------- write('%s') -------------------", msg)
+        await self.transport.write(msg)
+
+    async def writeln(self, msg=None):
+        if msg == None: msg = ""
+        log.debug("------------------- writeln('%s') -------------------", msg)
+        if self.prompt and prompt_reset_re.match(msg):
+            self.prompt = None   # Learned again at the next prompt
+        await self.transport.writeln(msg)
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+'''
+Use elements from asyncio
+
+Drivers that implements the async_* methods (see basedriver.py) are
+used natively. For all other methods, for drivers without async
+support, and for ssh if asyncssh is not installed, the synchronous
+driver method is run in a thread.
+'''
+
+import asyncio
+import functools
+import concurrent.futures
+
+import emmgr.lib.log as log
+import emmgr.lib.metrics as metrics
+import emmgr.lib.aiocomm as aiocomm
+from emmgr.lib.basedriver import BaseDriver
+
+_executor = None
+
+def get_executor(max_workers=None):
+    """
+    Returns the thread pool used to run synchronous drivers
+    """
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    return _executor
+
+
+class AsyncElement:
+    """
+    Async adapter for an Element (or a driver instance)
+
+    await element.run(cmd="show version")
+    """
+
+    native_methods = ["connect", "disconnect", "run", "configure"]
+
+    def __init__(self, element, executor=None):
+        self.element = element
+        self.driver = getattr(element, "_driver", element)
+        if executor is None:
+            executor = get_executor()
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, mgr_cls=None, executor=None, **kwargs):
+        """
+        Create an element, in a thread since it does DNS lookups and file loading
+        """
+        if mgr_cls is None:
+            from emmgr.lib.element import Element as mgr_cls
+        if executor is None:
+            executor = get_executor()
+        loop = asyncio.get_running_loop()
+        element = await loop.run_in_executor(executor, functools.partial(mgr_cls, **kwargs))
+        return cls(element, executor=executor)
+
+    def is_native(self, attr):
+        """
+        Returns True if the driver has its own async implementation of attr
+        Without the asyncssh module, ssh elements use the threaded driver
+        """
+        if attr not in self.native_methods:
+            return False
+        if self.driver.use_ssh and not aiocomm.ssh_available():
+            return False
+        name = "async_" + attr
+        return getattr(type(self.driver), name, None) is not getattr(BaseDriver, name)
+
+    async def call(self, attr, *args, **kwargs):
+        """
+        Call a driver method, natively or in a thread
+        """
+        if self.is_native(attr):
+            tags = getattr(self.element, "_metrics_tags", None) or dict(hostname=self.driver.hostname, model=self.driver.model)
+            with metrics.span("method", command=attr, **tags):
+                if self.driver._trace:
+                    with log.trace(self.driver._trace):
+                        return await getattr(self.driver, "async_" + attr)(*args, **kwargs)
+                return await getattr(self.driver, "async_" + attr)(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        func = getattr(self.element, attr)
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def close(self, discard=False):
+        """
+        Close both the async and the sync connection, if any
+        Use discard if an operation failed, a pooled session is then closed
+        """
+        await self.driver.async_disconnect()
+        if self.driver.em:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, functools.partial(self.driver.release, discard=discard))
+        if self.driver._trace:
+            self.driver._trace.close()
+
+    def __getattr__(self, attr):
+        return functools.partial(self.call, attr)
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
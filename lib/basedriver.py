@@ -7,16 +7,32 @@ Implements common functionality
 import os
 import re
 import yaml
+import inspect
+import functools
+import contextlib
 
 import emmgr.lib.config as config
 import emmgr.lib.log as log
 import emmgr.lib.util as util
 import emmgr.lib.comm as comm
-
-import jinja2
+import emmgr.lib.metrics as metrics
+import emmgr.lib.configtree as configtree
 
 dummy = object()        # Used to differentiate between dummy and None
 
+jinja_env = None        # Shared by all templates in the definitions, see get_jinja_env()
+
+
+def get_jinja_env():
+    """
+    Returns the jinja2 environment, jinja2 is imported on first use
+    """
+    global jinja_env
+    if jinja_env is None:
+        import jinja2
+        jinja_env = jinja2.Environment()
+    return jinja_env
+
 
 class ElementException(Exception):
     def __init__(self, msg, errno=1):
@@ -33,6 +49,9 @@ class BaseDriver:
 
     ElementException = ElementException
 
+    _flat_definitions = {}      # model -> (definitions, flattened definitions), shared by all instances
+    _templates = {}             # (model, attr) -> (source, compiled template), shared by all instances
+
     def __init__(self,
                  hostname=None,
                  ipaddr_mgmt=None,
@@ -44,9 +63,17 @@ class BaseDriver:
                  use_ssh=True,
                  definitions=None,
                  newline=None,
+                 pool=None,
+                 config_cache=None,
+                 record=None,
+                 replay=None,
+                 replay_speed=None,
+                 trace=None,
                  **kwargs                   # Ignore any additional parameters
                  ):
         self.hostname = hostname
+        if model is not None or not hasattr(self, "model"):
+            self.model = model      # drivers can set a default model
         self.port = port
         self.ipaddr_mgmt = ipaddr_mgmt
 
@@ -56,6 +83,12 @@ class BaseDriver:
         self.use_ssh = use_ssh    # If true use ssh instead of telnet
         self.kwargs = kwargs
         self.newline = newline
+        self.pool = pool          # ConnectionPool, if sessions should be reused
+        self.config_cache = config_cache  # ConfigCache, if running-config should be persisted
+        self.record = record      # Filename, save a transcript of the session
+        self.replay = replay      # Filename, replay a transcript instead of connecting
+        self.replay_speed = replay_speed
+        self.trace = trace        # Filename, save transcript and all log messages for this element
 
         if self.ipaddr_mgmt:
             self.hostname = self.ipaddr_mgmt
@@ -63,20 +96,35 @@ class BaseDriver:
         # ----
         self.transport = None
         self.em = None
+        self.async_transport = None
+        self.async_em = None
         self.running_config = None
+        self._config_tree = None
+        self._transaction = None        # Buffered config lines, when in a transaction
+        self._transaction_save = False
+        self._transaction_applied = []  # Called when the buffered config is applied, see when_applied()
+        self._flash_dir = None          # emtypes.FlashDir, fetched once per session
+        self._trace = comm.TranscriptWriter(trace) if trace else None
         
         if definitions == None:
             self._definitions = self.load_definitions(self.model)
         else:
             self._definitions = definitions
+        self._flat = self.get_flat_definitions(self.model, self._definitions)
 
         self._wait_for_prompt = self.get_definition("config.wait_for_prompt", None)    # cache for performance
+        self._learn_prompt = self.get_definition("config.learn_prompt", False)
 
         if self.use_ssh:
             self.method = "ssh"
         else:
             self.method="telnet"
-        self.transport = comm.RemoteConnection(timeout=10, method=self.method, newline=self.newline)
+        self.transport = self._new_transport()
+
+    def _new_transport(self):
+        if self.replay:
+            return comm.ReplayConnection(self.replay, timeout=10, newline=self.newline, speed=self.replay_speed)
+        return comm.RemoteConnection(timeout=10, method=self.method, newline=self.newline, record=self.record or self._trace)
        
     @classmethod
     def load_definitions(cls, model=None):
@@ -98,28 +146,82 @@ class BaseDriver:
                 if model in loaded_models:
                     break
             except yaml.YAMLError as err:
-                raise self.ElementException("Cannot load element configuration %s, err: %s" % (def_file, err))
+                raise cls.ElementException("Cannot load element configuration %s, err: %s" % (def_file, err))
         return definitions
 
+    @staticmethod
+    def flatten_definitions(definitions):
+        """
+        Merge the yaml files into one dict, with dotted keys
+        The first file that has an attribute wins, so a specific model
+        overrides the generic one
+        """
+        flat = {}
+
+        def walk(prefix, data):
+            for key, value in data.items():
+                key = "%s%s" % (prefix, key)
+                flat.setdefault(key, value)
+                if isinstance(value, dict):
+                    walk(key + ".", value)
+
+        for data in definitions:
+            if isinstance(data, dict):
+                walk("", data)
+        return flat
+
+    @classmethod
+    def get_flat_definitions(cls, model, definitions):
+        """
+        Returns the flattened definitions, cached per model
+        """
+        if definitions is None:
+            return {}
+        cached = cls._flat_definitions.get(model)
+        if cached is not None and (cached[0] is definitions or cached[0] == definitions):
+            return cached[1]
+        flat = cls.flatten_definitions(definitions)
+        cls._flat_definitions[model] = (definitions, flat)
+        return flat
+
     def get_definition(self, attr, default=dummy):
         """
-        Walk through each yaml file until we find the specified attribute
+        Returns the specified attribute from the yaml files
         Attributes can be specified hierarchically with dot as separator
         """
-        if self._definitions is not None:
-            attr = attr.split(".")
-            for f in self._definitions:
-                try:
-                    for a in attr:
-                        f = getattr(f, a)
-                    return f
-                except (KeyError, AttributeError):
-                    pass
+        try:
+            return self._flat[attr]
+        except KeyError:
+            pass
         if default is not dummy:
             return default
         raise KeyError("Unknown attribute %s" % attr)
 
 
+    def get_template(self, attr):
+        """
+        Returns the definition attr as a compiled jinja2 template
+        Templates are compiled once per model, raises KeyError if attr is not defined
+        """
+        source = self.get_definition(attr)
+        key = (self.model, attr)
+        cached = self._templates.get(key)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        template = get_jinja_env().from_string(source)
+        self._templates[key] = (source, template)
+        return template
+
+    def render_definition(self, attr, **kwargs):
+        """
+        Render the template in definition attr, returns a list of lines
+        """
+        try:
+            template = self.get_template(attr)
+        except KeyError:
+            raise self.ElementException("Not implemented")
+        return template.render(**kwargs).split("\n")
+
     def filter_(self, lines, filter_):
         """
         Accept a list
@@ -152,13 +254,47 @@ class BaseDriver:
         raise self.ElementException("Not implemented")
         
     def connect(self):
-        log.debug("------------------- connect(%s, use_ssh=%s) -------------------" % (self.hostname, self.use_ssh))
+        log.debug("------------------- connect(%s, use_ssh=%s) -------------------", self.hostname, self.use_ssh)
+        self.invalidate_flash_dir()
+        if self.transport is None:
+            self.transport = self._new_transport()
         try:
             self.transport.connect(self.hostname, port=self.port, username=self.username, password=self.password)
         except comm.CommException as err:
             raise self.ElementException(err)
         self.em = comm.Expect(self.transport)
 
+    def pool_key(self):
+        return (self.hostname, self.port, self.method, self.username)
+
+    def connect_pooled(self):
+        """
+        Reuse an authenticated session from the connection pool
+        Returns True if a session was reused
+        """
+        if self.pool is None:
+            return False
+        session = self.pool.acquire(self.pool_key(), self._wait_for_prompt)
+        if session is None:
+            return False
+        self.transport, self.em = session
+        return True
+
+    def release(self, discard=False):
+        """
+        Return the session to the connection pool
+        If no pool is used, or discard is True, disconnect from the element.
+        Use discard if an operation failed, the session can be out of sync
+        """
+        if self.em is None:
+            return
+        if self.pool is None or discard:
+            self.disconnect()
+            return
+        self.pool.release(self.pool_key(), self.transport, self.em)
+        self.em = None
+        self.transport = None
+
     def disconnect(self):
         raise self.ElementException("Not implemented")
 
@@ -168,6 +304,47 @@ class BaseDriver:
     def run(self, cmd=None, filter_=None, callback=None):
         raise self.ElementException("Not implemented")
 
+    # ########################################################################
+    # Generic, asyncio
+    # Drivers that implements these can be used natively from asyncio,
+    # other drivers are run in a thread, see aiodriver.py
+    # ########################################################################
+
+    async def async_connect(self):
+        import emmgr.lib.aiocomm as aiocomm
+        log.debug("------------------- async_connect(%s, use_ssh=%s) -------------------", self.hostname, self.use_ssh)
+        self.async_transport = aiocomm.AsyncRemoteConnection(timeout=10, method=self.method, newline=self.newline,
+                                                             record=self.record or self._trace)
+        try:
+            await self.async_transport.connect(self.hostname, port=self.port, username=self.username, password=self.password)
+        except comm.CommException as err:
+            raise self.ElementException(err)
+        self.async_em = aiocomm.AsyncExpect(self.async_transport)
+
+    async def async_disconnect(self):
+        if self.async_transport:
+            self.async_em = None
+            self.async_transport.disconnect()
+            self.async_transport = None
+
+    async def async_wait_for_prompt(self, timeout=None):
+        log.debug("------------------- async_wait_for_prompt(%s) -------------------", self.hostname)
+        if not self._wait_for_prompt:
+            raise self.ElementException("Not implemented")
+        em = self.async_em
+        if timeout is None:
+            match = await em.expect(self._prompt_patterns(em))
+        else:
+            match = await em.expect(self._prompt_patterns(em), timeout=timeout)
+        self._prompt_matched(em)
+        return match
+
+    async def async_run(self, cmd=None, filter_=None, timeout=None, callback=None):
+        raise self.ElementException("Not implemented")
+
+    async def async_configure(self, config_lines=None, save_running_config=False, callback=None):
+        raise self.ElementException("Not implemented")
+
 
     # ########################################################################
     # License
@@ -184,16 +361,208 @@ class BaseDriver:
     # Configuration
     # ########################################################################
 
-    def wait_for_prompt(self):
-        log.debug("------------------- wait_for_prompt(%s) -------------------" % self.hostname)
+    def wait_for_prompt(self, timeout=None):
+        log.debug("------------------- wait_for_prompt(%s) -------------------", self.hostname)
         if not self._wait_for_prompt:
             raise self.ElementException("Not implemented")
-        match = self.em.expect(self._wait_for_prompt)
+        em = self.em
+        with metrics.span("wait_for_prompt"):
+            if timeout is None:
+                match = em.expect(self._prompt_patterns(em))
+            else:
+                match = em.expect(self._prompt_patterns(em), timeout=timeout)
+        self._prompt_matched(em)
         return match
 
+    def _prompt_patterns(self, em):
+        """
+        Returns the patterns for wait_for_prompt, the learned prompt if known
+        """
+        if em.prompt:
+            return em.prompt.patterns
+        return self._wait_for_prompt
+
+    def _prompt_matched(self, em):
+        """
+        Called after a prompt is matched. If config.learn_prompt is set the
+        exact prompt is learned from the first prompt, and the mode is updated
+        from each prompt, see comm.Prompt
+        """
+        if not self._learn_prompt:
+            return
+        if em.prompt:
+            em.prompt.update(em.match)
+            return
+        em.prompt = comm.Prompt.learn(em.before, em.match, self._wait_for_prompt)
+        if em.prompt:
+            log.debug("learned prompt %s, mode '%s'", em.prompt.name, em.prompt.mode)
+
+    @property
+    def prompt_mode(self):
+        """
+        Mode of the learned prompt, "" in exec mode, for example "config" or
+        "config-if" in config mode. None if the prompt is not learned
+        """
+        em = self.em or self.async_em
+        if em and em.prompt:
+            return em.prompt.mode
+        return None
+
     def configure(self, config_lines=None, save_running_config=False):
         raise self.ElementException("Not implemented")
 
+    @contextlib.contextmanager
+    def transaction(self, save_running_config=False, pipeline=False, callback=None):
+        """
+        Buffer configuration from all methods, until the end of the with block
+
+            with element.transaction():
+                element.vlan_create(vlan=10)
+                element.vlan_interface_create(interface="Gi0/1", vlan=10)
+
+        On exit all buffered lines are sent in one configure session,
+        and running-config is saved once, if any method asked for it.
+        If the block raises an exception, nothing is sent
+        Nested transactions are part of the outermost one
+        """
+        if self._transaction is not None:
+            if save_running_config:
+                self._transaction_save = True
+            yield self
+            return
+        self._transaction = []
+        self._transaction_save = save_running_config
+        self._transaction_applied = []
+        try:
+            yield self
+        except BaseException:
+            self._transaction = None
+            raise
+        config_lines = self._transaction
+        save_running_config = self._transaction_save
+        applied = self._transaction_applied
+        self._transaction = None
+        self._transaction_applied = []
+        if config_lines:
+            self.configure(config_lines, save_running_config=save_running_config, callback=callback,
+                           **self.pipeline_kwargs(pipeline))
+        elif save_running_config:
+            self.save_running_config(callback=callback)
+        for func in applied:
+            func()
+
+    def when_applied(self, func, *args):
+        """
+        Call func(*args) when configuration sent with configure() is applied
+        In a transaction that is at the end, if the configuration is sent
+        without errors, otherwise now
+        Used to update cached element state
+        """
+        if self._transaction is None:
+            func(*args)
+        else:
+            self._transaction_applied.append(functools.partial(func, *args))
+
+    def transaction_add(self, config_lines, save_running_config=False):
+        """
+        Called by configure(). If in a transaction, the lines are buffered
+        Returns True if buffered
+        """
+        if self._transaction is None:
+            return False
+        self._transaction += self.str_to_lines(config_lines)
+        if save_running_config:
+            self._transaction_save = True
+        return True
+
+    def transaction_save(self):
+        """
+        Called by save_running_config(). If in a transaction, the save is done at the end
+        Returns True if postponed
+        """
+        if self._transaction is None:
+            return False
+        self._transaction_save = True
+        return True
+
+    def pipeline_kwargs(self, pipeline):
+        """
+        Returns the arguments to configure() for a pipelined configuration
+        Drivers whose configure() has no pipeline argument get none, the
+        lines are then sent one at a time
+        """
+        if not pipeline:
+            return {}
+        if "pipeline" not in inspect.signature(self.configure).parameters:
+            log.info("%s, driver %s does not support pipelined configuration, sending one line at a time",
+                     self.hostname, self.model)
+            return {}
+        return {"pipeline": True}
+
+    def configure_pipelined(self, config_lines, window=None):
+        """
+        Send configuration lines without waiting for the prompt after each line
+        Must be called when the element is in configuration mode
+
+        Up to window lines are in flight. For each configuration prompt
+        received one more line is sent, so large configurations are limited
+        by bandwidth instead of round trip time. The output of each line is
+        checked for the error markers in definition config.error_marker.
+        On error no more lines are sent, lines in flight are drained.
+        A line that can return to exec mode, matching definition
+        config.exit_pattern (default "end"), is the last line sent until
+        its prompt is received. If it returned to exec mode no more lines
+        are sent, it is an error if there are more lines after it
+
+        Returns None if ok, otherwise a message with the failed line
+        """
+        log.debug("------------------- configure_pipelined(%s) -------------------", self.hostname)
+        if self.em.prompt:
+            prompts = {"config": self.em.prompt.config_pattern, "exec": self.em.prompt.exec_pattern}
+        else:
+            # Checked after config, the generic prompt also matches config prompts
+            prompts = {"config": self.get_definition("config.config_prompt"),
+                       "exec": "|".join(comm.Matcher.normalize(self._wait_for_prompt).values())}
+        error_marker = self.get_definition("config.error_marker", None)
+        if error_marker:
+            error_marker = re.compile(error_marker)
+        if window is None:
+            window = self.get_definition("config.pipeline_window", 64)
+        exit_pattern = re.compile(self.get_definition("config.exit_pattern", r"^\s*end\s*$"))
+        newline = self.transport.newline
+
+        lines = self.str_to_lines(config_lines)
+        sent = 0        # Number of lines sent
+        done = 0        # Number of lines acknowledged by a prompt
+        barrier = 0     # No more lines are sent until this many lines are acknowledged
+        error = None
+        stop = False    # True when no more lines should be sent
+        while done < sent or (not stop and sent < len(lines)):
+            if not stop and sent < len(lines) and sent - done <= window // 2 and done >= barrier:
+                end = min(len(lines), done + window)
+                for ix in range(sent, end):
+                    if exit_pattern.search(lines[ix]):
+                        end = barrier = ix + 1
+                        break
+                self.em.write("".join(line + newline for line in lines[sent:end]))
+                sent = end
+            try:
+                key = self.em.expect(prompts)
+            except comm.CommException as err:
+                raise self.ElementException("Configuration line %d '%s' not acknowledged: %s" %
+                                            (done + 1, lines[done], err.message))
+            if error is None and error_marker and error_marker.search(self.em.before):
+                error = "Error in configuration line %d '%s': %s" % (done + 1, lines[done], self.em.before.strip())
+                log.error(error)
+                stop = True
+            elif key == "exec" and not stop:
+                if done + 1 < len(lines):
+                    error = "Configuration line %d '%s' left configuration mode" % (done + 1, lines[done])
+                    log.error(error)
+                stop = True
+            done += 1
+        return error
+
     def enable_ssh(self):
         raise self.ElementException("Not implemented")
 
@@ -203,6 +572,79 @@ class BaseDriver:
         """
         raise self.ElementException("Not implemented")
 
+    def get_config_change_marker(self):
+        """
+        Returns output of the command in definition config.change_marker_cmd
+        The output changes when the running configuration changes.
+        Returns None if the driver has no such command
+        """
+        cmd = self.get_definition("config.change_marker_cmd", None)
+        if not cmd:
+            return None
+        marker = "\n".join(self.run(cmd)).strip()
+        if not marker:
+            return None
+        return marker
+
+    def fetch_running_config(self, cmd, refresh=False, timeout=None):
+        """
+        Load self.running_config, using cmd to get it from the element
+
+        If a config cache is used and the element change marker is the same
+        as when the config was cached, the cached config is used instead of
+        fetching the whole config from the element.
+        If refresh is True, the config is always fetched from the element
+        """
+        if self.running_config is not None and not refresh:
+            return self.running_config
+
+        marker = None
+        if self.config_cache:
+            marker = self.get_config_change_marker()
+            if not refresh and marker is not None:
+                entry = self.config_cache.get(self.hostname)
+                if entry and entry.marker == marker:
+                    log.debug("Using cached running-config for %s, fetched %s", self.hostname, entry.timestamp)
+                    self.running_config = entry.lines
+                    return self.running_config
+
+        if timeout is None:
+            self.running_config = self.run(cmd)
+        else:
+            self.running_config = self.run(cmd, timeout=timeout)
+        if self.config_cache:
+            self.config_cache.put(self.hostname, self.running_config, marker=marker)
+        return self.running_config
+
+    def invalidate_running_config(self):
+        """
+        Forget the fetched running-config, called when the config is changed
+        """
+        self.running_config = None
+        self._config_tree = None
+
+    def get_config_tree(self, refresh=False):
+        """
+        Returns the running-config parsed into a configtree.ConfigTree
+        The tree is built once for each fetched running-config
+        """
+        lines = self.get_running_config(refresh=refresh)
+        if self._config_tree is None or self._config_tree.config_lines is not lines:
+            self._config_tree = configtree.ConfigTree(lines)
+        return self._config_tree
+
+    def get_interface_config(self, interface, cmd):
+        """
+        Returns the configuration lines for an interface
+        If the running-config already is fetched the lines are taken from
+        it, otherwise cmd is run on the element
+        """
+        if self.running_config is not None:
+            node = self.get_config_tree().interface(interface)
+            if node is not None:
+                return node.lines()
+        return self.run(cmd)
+
     def save_running_config(self, callback=None):
         """
         Save running configuration as startup configuration
@@ -225,13 +667,26 @@ class BaseDriver:
         This default driver is used if there is a CLI command for this defined, 
         and method isn't overridden
         """
-        try:
-            cmd_template = self.get_definition("config.interface.clear_config.cmd")
-        except KeyError:
-            raise self.ElementException("Not implemented")
-        t = jinja2.Template(cmd_template)
-        cmd = t.render(interface_name=interface)
-        cmd = cmd.split('\n')
+        return self.interfaces_clear_config(interfaces=[interface], save_running_config=save_running_config, callback=callback)
+
+    def interface_list(self, interfaces):
+        """
+        Check the interfaces argument of the interfaces_* methods
+        A single interface name is accepted, returns a list
+        """
+        if isinstance(interfaces, str):
+            interfaces = [interfaces]
+        if not interfaces or None in interfaces:
+            raise self.ElementException("No interface specified")
+        return list(interfaces)
+
+    def interfaces_clear_config(self, interfaces=None, save_running_config=False, callback=None):
+        """
+        Reset a list of interfaces to default configuration, in one configure session
+        """
+        cmd = []
+        for interface in self.interface_list(interfaces):
+            cmd += self.render_definition("config.interface.clear_config.cmd", interface_name=interface)
         return self.configure(config_lines=cmd, save_running_config=save_running_config, callback=callback)
 
     def interface_get_admin_state(self, interface=None):
@@ -247,17 +702,19 @@ class BaseDriver:
         This default driver is used if there is a CLI command for this defined, 
         and method isn't overridden
         """
+        return self.interfaces_set_admin_state(interfaces=[interface], state=state, save_running_config=save_running_config, callback=callback)
+
+    def interfaces_set_admin_state(self, interfaces=None, state=None, save_running_config=False, callback=None):
+        """
+        Enable/disable a list of interfaces, in one configure session
+        """
         if state:
             attr = "config.interface.enable.cmd"
         else:
             attr = "config.interface.disable.cmd"
-        try:
-            cmd_template = self.get_definition(attr)
-        except KeyError:
-            raise self.ElementException("Not implemented")
-        t = jinja2.Template(cmd_template)
-        cmd = t.render(interface_name=interface)
-        cmd = cmd.split('\n')
+        cmd = []
+        for interface in self.interface_list(interfaces):
+            cmd += self.render_definition(attr, interface_name=interface)
         return self.configure(config_lines=cmd, save_running_config=save_running_config, callback=callback)
     
         
@@ -271,6 +728,12 @@ class BaseDriver:
         """
         raise self.ElementException("Not implemented")
 
+    def mac_table_get(self, interface=None, vlan=None):
+        """
+        Returns the MAC address table, as an emtypes.MACTable
+        """
+        raise self.ElementException("Not implemented")
+
     # ########################################################################
     # VLAN management
     # ########################################################################
@@ -323,6 +786,42 @@ class BaseDriver:
     # File management
     # ########################################################################
 
+    def get_flash_dir(self, refresh=False):
+        """
+        Returns the files in flash, as an emtypes.FlashDir
+        The listing is fetched once per session, and updated by the
+        drivers own copy and delete operations
+        """
+        if self._flash_dir is None or refresh:
+            self._flash_dir = self.flash_dir_fetch()
+        return self._flash_dir
+
+    def flash_dir_fetch(self):
+        """
+        List the files in flash on the element, returns an emtypes.FlashDir
+        """
+        raise self.ElementException("Not implemented")
+
+    def flash_dir_add(self, filename, size=None):
+        """
+        Add a copied file to the flash listing, if it is fetched
+        """
+        if self._flash_dir is not None:
+            self._flash_dir.add(filename, size)
+
+    def flash_dir_remove(self, filename):
+        """
+        Remove a deleted file from the flash listing, if it is fetched
+        """
+        if self._flash_dir is not None:
+            self._flash_dir.remove(filename)
+
+    def invalidate_flash_dir(self):
+        """
+        Forget the flash listing, called when a new session is started
+        """
+        self._flash_dir = None
+
     def file_exist(self, filename, callback=None):
         """
         Returns true if filename exist on element
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+'''
+Run operations on many elements, with bounded parallelism
+
+Elements are read from an inventory file, YAML or CSV, with at least the
+columns hostname and model. Optional columns, such as ipaddr_mgmt and
+username, are passed on to the element.
+
+Results are returned as each element finishes.
+'''
+
+import os
+import csv
+import time
+import asyncio
+import concurrent.futures
+
+import emmgr.lib.log as log
+import emmgr.lib.util as util
+from emmgr.lib.aiodriver import AsyncElement
+
+
+class BatchException(Exception):
+    pass
+
+
+def load_inventory(filename):
+    """
+    Load an inventory file
+    YAML: a list of elements, or a dict with the list in key "elements"
+    CSV: first row is the column names
+    Returns a list of dicts
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".csv":
+        elements = []
+        with open(filename, newline="") as f:
+            for row in csv.DictReader(f):
+                row = {key.strip(): val.strip() for key, val in row.items() if key and val}
+                elements.append(row)
+    else:
+        try:
+            elements = util.yaml_load(filename)
+        except util.UtilException as err:
+            raise BatchException(err)
+        if isinstance(elements, dict):
+            elements = elements.get("elements", [])
+    if not isinstance(elements, list):
+        raise BatchException("Inventory %s does not contain a list of elements" % filename)
+    for element in elements:
+        if "hostname" not in element or "model" not in element:
+            raise BatchException("Inventory %s, element without hostname/model: %s" % (filename, element))
+    return elements
+
+
+def error_message(err):
+    """
+    Returns the message of an exception, ElementException has msg and
+    CommException message, an ElementException can wrap a CommException
+    """
+    for attr in ("msg", "message"):
+        msg = getattr(err, attr, None)
+        if isinstance(msg, Exception):
+            return error_message(msg)
+        if msg is not None:
+            return str(msg)
+    return str(err)
+
+
+class BatchRunner:
+    """
+    Execute an operation on a list of elements, at most concurrency
+    elements at a time, each element limited to timeout seconds
+    """
+
+    def __init__(self, concurrency=50, timeout=300, mgr_cls=None, **defaults):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.mgr_cls = mgr_cls
+        self.defaults = defaults    # Used for element parameters not in inventory
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    def _abort(self, element):
+        """
+        Abort the connections, so an operation that is still running in a thread fails fast
+        Async operations are already cancelled by wait_for()
+        """
+        try:
+            if element.driver.async_transport:
+                element.driver.async_transport.disconnect()
+            if element.driver.transport:
+                element.driver.transport.abort()
+        except Exception as err:
+            log.debug("batch, error aborting %s: %s", element.driver.hostname, err)
+
+    async def _run_element(self, semaphore, kwargs, operation):
+        """
+        Run operation on one element, returns a result dict
+        """
+        async with semaphore:
+            res = dict(hostname=kwargs["hostname"], model=kwargs["model"], status="ok")
+            start = time.time()
+            element = None
+            try:
+                args = dict(self.defaults)
+                args.update(kwargs)
+                element = await asyncio.wait_for(
+                    AsyncElement.create(mgr_cls=self.mgr_cls, executor=self.executor, **args),
+                    self.timeout)
+                res["result"] = await asyncio.wait_for(operation(element), self.timeout - (time.time() - start))
+            except asyncio.TimeoutError:
+                res["status"] = "timeout"
+                res["error"] = "Timeout after %s seconds" % self.timeout
+                if element:
+                    self._abort(element)
+            except Exception as err:
+                res["status"] = "error"
+                res["error"] = error_message(err)
+            finally:
+                if element:
+                    try:
+                        await element.close(discard=res["status"] != "ok")
+                    except Exception as err:
+                        log.debug("batch, error closing %s: %s", kwargs["hostname"], err)
+            res["elapsed"] = round(time.time() - start, 3)
+            return res
+
+    async def run(self, elements, operation):
+        """
+        Run operation on all elements
+        operation is a coroutine function, called with an AsyncElement
+        Async generator, yields a result dict for each element as it finishes
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._run_element(semaphore, kwargs, operation)) for kwargs in elements]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+
+def run_commands(elements, commands, output, **kwargs):
+    """
+    Run a list of commands on all elements, write the result to output
+    as JSON lines, one line for each element as it finishes
+    Returns number of elements that failed
+    """
+    async def operation(element):
+        res = {}
+        for cmd in commands:
+            res[cmd] = await element.run(cmd=cmd)
+        return res
+
+    async def runner():
+        failed = 0
+        batch = BatchRunner(**kwargs)
+        async for res in batch.run(elements, operation):
+            if res["status"] != "ok":
+                failed += 1
+            output.write(util.json_dumps(res) + "\n")
+            output.flush()
+        return failed
+
+    return asyncio.run(runner())
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
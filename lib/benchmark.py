@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+'''
+Startup time benchmark for the emmgr CLI
+
+Runs a CLI command, default "em list_models", in new processes and
+measures the wall clock time. Fails if the median time is over the
+budget, or if one of the lazy_modules is imported by the command.
+'''
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+import emmgr.lib.config as config
+
+# Modules that are imported on first use, not when the CLI starts
+lazy_modules = ["ssh2", "telnetlib", "jinja2", "asyncio", "pprint"]
+
+
+def cli_path():
+    return os.path.join(config.basedir, "emmgr", "cli", "emmgr")
+
+
+def startup_times(args, runs=20, warmup=2):
+    """
+    Run "emmgr <args>" runs times, returns list of seconds for each run
+    The warmup runs fills the OS cache and are not included
+    """
+    cmd = [sys.executable, cli_path()] + args
+    times = []
+    for ix in range(warmup + runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        if ix >= warmup:
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def imported_modules(args):
+    """
+    Returns dict, top level module name -> cumulative import time in microseconds,
+    for the modules imported by "emmgr <args>"
+    """
+    cmd = [sys.executable, "-X", "importtime", cli_path()] + args
+    res = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    modules = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        cols = line[12:].split("|")
+        if len(cols) != 3 or not cols[1].strip().isdigit():
+            continue    # Header
+        name = cols[2].strip()
+        if "." not in name:
+            modules[name] = int(cols[1])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time of the emmgr CLI")
+    parser.add_argument("--runs",
+                        type=int,
+                        default=20,
+                        help="Number of measured runs")
+    parser.add_argument("--budget",
+                        type=float,
+                        default=0.15,
+                        help="Max median time in seconds")
+    parser.add_argument("--top",
+                        type=int,
+                        default=10,
+                        help="Show the slowest top level imports")
+    parser.add_argument("command",
+                        nargs="*",
+                        help="CLI command to measure, default: em list_models")
+    args = parser.parse_args()
+    command = args.command or ["em", "list_models"]
+
+    try:
+        times = startup_times(command, runs=args.runs)
+        modules = imported_modules(command)
+    except (OSError, subprocess.CalledProcessError) as err:
+        print("Error: cannot run emmgr %s, err: %s" % (" ".join(command), err))
+        sys.exit(2)
+
+    median = statistics.median(times)
+    print("emmgr %s, %d runs" % (" ".join(command), len(times)))
+    print("  min %.3f  median %.3f  max %.3f seconds, budget %.3f" % (min(times), median, max(times), args.budget))
+    print("Slowest imports (cumulative):")
+    for name, usec in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print("  %-30s %7.1f ms" % (name, usec / 1000))
+
+    failed = False
+    eager = [name for name in lazy_modules if name in modules]
+    if eager:
+        print("Error: imported at startup, should be lazy: %s" % ", ".join(eager))
+        failed = True
+    if median > args.budget:
+        print("Error: median startup time %.3f is over budget %.3f" % (median, args.budget))
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,17 @@
 Common CLI for classes and drivers
 '''
 
+import os
 import sys
 import re
+import atexit
 
 import emmgr.lib.config as config
 import emmgr.lib.log as log
+import emmgr.lib.metrics as metrics
 import emmgr.lib.util as util
 import emmgr.lib.comm as comm
+import emmgr.lib.emtypes as emtypes
 
 hostconfig = config.em.scriptaccount
 
@@ -19,6 +23,8 @@ class BaseCLI(util.BaseCLI):
     Common parametrars for all CLI classes
     """
     
+    keep_loglevel = False       # Set by the daemon, the log level is process wide
+
     def __init__(self, **kwargs):
         self.mgr_cls = kwargs.pop("mgr_cls")
         super().__init__(**kwargs)
@@ -29,9 +35,30 @@ class BaseCLI(util.BaseCLI):
                                  help='Hostname of element')
         self.parser.add_argument('-i', '--ipaddr_mgmt',
                                  help='Management IP address of element')
+        self.parser.add_argument('--port',
+                                 type=int,
+                                 help='TCP port, if not the default for telnet/ssh')
         self.parser.add_argument('-m', '--model',
                                  required=True,
                                  help='Element model')
+        self.add_login_arguments()
+        self.add_loglevel_argument()
+        self.parser.add_argument('--record',
+                                 help='Save a transcript of the session to this file')
+        self.parser.add_argument('--replay',
+                                 help='Replay a transcript file instead of connecting to the element')
+        self.parser.add_argument('--replay_speed',
+                                 type=float,
+                                 help='Replay speed relative to the recording, default as fast as possible')
+        self.parser.add_argument('--metrics',
+                                 help='Write latency metrics to this file, Prometheus text format or JSON if the name ends with .json')
+        self.parser.add_argument('--trace',
+                                 help='Save a transcript of the session and all log messages, at all levels, to this file')
+
+    def add_login_arguments(self):
+        """
+        Credentials and transport, for commands that connect to elements
+        """
         self.parser.add_argument('-u', '--username',
                                  default=hostconfig['username'],
                                  help='Username for connecting',)
@@ -46,16 +73,63 @@ class BaseCLI(util.BaseCLI):
                                  help='Use Telnet',
                                  dest='use_ssh',
                                  default=True)
+
+    def add_loglevel_argument(self, default='info'):
+        """
+        Commands that handle many elements default to a quieter level
+        """
         self.parser.add_argument('--loglevel',
                                  choices=['info', 'warning', 'error', 'debug'],
                                  help='Set loglevel, one of info, warning, error or debug',
-                                 default='info' )
+                                 default=default)
+
+    def add_concurrency_arguments(self, concurrency=50, timeout=300,
+                                  timeout_help='Max time in seconds for each element'):
+        """
+        Parallelism and per element timeout, for commands that handle many elements
+        """
+        self.parser.add_argument('--concurrency',
+                                 type=int,
+                                 default=concurrency,
+                                 help='Max number of elements to handle in parallel',
+                                 )
+        self.parser.add_argument('--timeout',
+                                 type=int,
+                                 default=timeout,
+                                 help=timeout_help,
+                                 )
+
+    def login_kwargs(self):
+        """
+        Arguments for creating elements, from add_login_arguments()
+        """
+        return dict(mgr_cls=self.mgr_cls,
+                    username=self.args.username,
+                    password=self.args.password,
+                    enable_password=self.args.enable_password,
+                    use_ssh=self.args.use_ssh)
+
+    def set_loglevel(self):
+        """
+        Set the log level from --loglevel, unless keep_loglevel is set
+        """
+        if not self.keep_loglevel:
+            log.setLevel(self.args.loglevel)
+
+    def enable_metrics(self):
+        """
+        If --metrics is set, measure driver operations and write the metrics at exit
+        """
+        if getattr(self.args, "metrics", None):
+            metrics.enable()
+            atexit.register(metrics.registry.write, self.args.metrics)
 
     def run(self):
         if self.args.hostname is None and self.args.ipaddr_mgmt is None:
             util.die('Error: You need to specify -H/--hostname or -i/--ipaddr_mgmt')
 
-        log.setLevel(self.args.loglevel)
+        self.set_loglevel()
+        self.enable_metrics()
         self.mgr = self.mgr_cls(**vars(self.args))
 
 
@@ -63,6 +137,35 @@ class BaseCLI(util.BaseCLI):
 # Generic
 # ########################################################################
 
+class CLI_transcript_show(BaseCLI):
+    """
+    Show a transcript or trace file, saved with --record or --trace
+    """
+
+    def add_arguments(self):
+        self.parser.add_argument('-f', '--file',
+                                 required=True,
+                                 help='Transcript file')
+        self.parser.add_argument('-k', '--kind',
+                                 choices=['r', 'w', 'l'],
+                                 action="append",
+                                 help='Only show records of this kind, r=received, w=sent, l=log')
+
+    def run(self):
+        try:
+            records = comm.read_transcript(self.args.file)
+        except (OSError, comm.CommException) as err:
+            util.die("Error: %s" % getattr(err, "message", err))
+        for kind, timestamp, data in records:
+            kind = kind.decode()
+            if self.args.kind and kind not in self.args.kind:
+                continue
+            text = data.decode("utf8", "replace")
+            if kind != "l":
+                text = repr(text)
+            print("%9.3f %s %s" % (timestamp, kind, text))
+
+
 class CLI_list_models(BaseCLI):
     
     def add_arguments(self):
@@ -107,7 +210,7 @@ class CLI_run(BaseCLI):
         try:
             super().run()
             for cmd in self.args.command:
-                log.debug("cmd: %s" % cmd)
+                log.debug("cmd: %s", cmd)
                 lines = self.mgr.run(cmd=cmd)
                 if lines:
                     ix = 0
@@ -119,6 +222,186 @@ class CLI_run(BaseCLI):
             print("Error: %s" % err)
 
 
+class CLI_batch_run(BaseCLI):
+    """
+    Run commands on all elements in an inventory file, output JSON lines
+    """
+
+    def add_arguments(self):
+        """Elements are specified in the inventory, not by default arguments"""
+        self.parser.add_argument('-f', '--inventory',
+                                 required=True,
+                                 help='Inventory file, YAML or CSV with hostname, model and optional ipaddr_mgmt',
+                                 )
+        self.parser.add_argument('-c', '--command',
+                                 required=True,
+                                 action="append",
+                                 help='Command to run',
+                                 )
+        self.add_concurrency_arguments(timeout=300)
+        self.add_login_arguments()
+        self.add_loglevel_argument(default='warning')
+        self.parser.add_argument('--metrics',
+                                 help='Write latency metrics to this file, Prometheus text format or JSON if the name ends with .json')
+        self.parser.add_argument('--trace',
+                                 action="append",
+                                 default=[],
+                                 help='Hostname of element to trace, transcript and all log messages are saved to <trace_dir>/<hostname>.trace',
+                                 )
+        self.parser.add_argument('--trace_dir',
+                                 default='.',
+                                 help='Directory for trace files',
+                                 )
+
+    def run(self):
+        import emmgr.lib.batch as batch
+        self.set_loglevel()
+        self.enable_metrics()
+        try:
+            elements = batch.load_inventory(self.args.inventory)
+        except batch.BatchException as err:
+            util.die("Error: %s" % err)
+        for element in elements:
+            if element["hostname"] in self.args.trace:
+                element["trace"] = os.path.join(self.args.trace_dir, "%s.trace" % element["hostname"])
+        failed = batch.run_commands(elements, self.args.command, sys.stdout,
+                                    concurrency=self.args.concurrency,
+                                    timeout=self.args.timeout,
+                                    **self.login_kwargs())
+        if failed:
+            sys.exit(1)
+
+
+class CLI_sw_upgrade_batch(BaseCLI):
+    """
+    Upgrade firmware on all elements in an inventory file, in waves
+    """
+
+    def add_arguments(self):
+        """Elements are specified in the inventory, not by default arguments"""
+        self.parser.add_argument('-f', '--inventory',
+                                 required=True,
+                                 help='Inventory file, YAML or CSV with hostname, model and optional firmware, firmware_server',
+                                 )
+        self.parser.add_argument('--server',
+                                 help='File server URL, for example tftp://10.10.16.50',
+                                 )
+        self.parser.add_argument('--image',
+                                 action="append",
+                                 default=[],
+                                 help='Firmware for a model, as model=filename. Can be repeated',
+                                 )
+        self.parser.add_argument('--firmware_dir',
+                                 help='Directory with firmware, newest file matching firmware_filter is used',
+                                 )
+        self.parser.add_argument('--serve',
+                                 action='store_true',
+                                 default=False,
+                                 help='Serve firmware_dir with the built-in TFTP/HTTP server, used if --server is not set',
+                                 )
+        self.parser.add_argument('--state',
+                                 help='State file, used to continue an interrupted upgrade',
+                                 )
+        self.parser.add_argument('--wave_size',
+                                 type=int,
+                                 default=100,
+                                 help='Number of elements in each wave',
+                                 )
+        self.parser.add_argument('--max_failures',
+                                 type=int,
+                                 help='Stop if more elements than this fails in a wave',
+                                 )
+        self.parser.add_argument('--per_server',
+                                 type=int,
+                                 default=10,
+                                 help='Max number of parallel copies from each file server',
+                                 )
+        self.parser.add_argument('--no_set_boot',
+                                 action='store_false',
+                                 dest='set_boot',
+                                 default=True,
+                                 help='Only copy firmware, do not set boot firmware',
+                                 )
+        self.parser.add_argument('--delete_unneeded',
+                                 action='store_true',
+                                 default=False,
+                                 help='Delete unneeded firmware before copying',
+                                 )
+        self.parser.add_argument('--reload',
+                                 action='store_true',
+                                 default=False,
+                                 help='Reload elements after boot firmware is set',
+                                 )
+        self.parser.add_argument('--reload_interval',
+                                 type=float,
+                                 default=0,
+                                 help='Seconds between reloads in a wave',
+                                 )
+        self.add_concurrency_arguments(timeout=3600,
+                                       timeout_help='Max time in seconds for each element and step')
+        self.add_login_arguments()
+        self.add_loglevel_argument(default='warning')
+
+    def run(self):
+        import emmgr.lib.batch as batch
+        import emmgr.lib.upgrade as upgrade
+        self.set_loglevel()
+        images = {}
+        for image in self.args.image:
+            if "=" not in image:
+                util.die("Error: --image must be model=filename, got %s" % image)
+            model, filename = image.split("=", 1)
+            images[model] = filename
+        try:
+            elements = batch.load_inventory(self.args.inventory)
+        except batch.BatchException as err:
+            util.die("Error: %s" % err)
+
+        def progress(hostname, step, status, msg):
+            print("%-30s %-7s %-8s %s" % (hostname, step, status, msg or ""))
+            sys.stdout.flush()
+
+        fwserver = None
+        if self.args.serve:
+            import emmgr.lib.fwserver as fws
+            fwconfig = getattr(config, "fwserver", {})
+            try:
+                fwserver = fws.FirmwareServer(directory=self.args.firmware_dir or fwconfig.get("directory"),
+                                              host=fwconfig.get("host", "0.0.0.0"),
+                                              address=fwconfig.get("address"),
+                                              tftp_port=fwconfig.get("tftp_port", 69),
+                                              http_port=fwconfig.get("http_port", 8080),
+                                              bandwidth=fwconfig.get("bandwidth"),
+                                              client_bandwidth=fwconfig.get("client_bandwidth"),
+                                              max_transfers=fwconfig.get("max_transfers"))
+            except fws.FirmwareServerException as err:
+                util.die("Error: %s" % err)
+
+        try:
+            summary = upgrade.upgrade(elements,
+                                      server=self.args.server,
+                                      images=images,
+                                      firmware_dir=self.args.firmware_dir,
+                                      state_file=self.args.state,
+                                      wave_size=self.args.wave_size,
+                                      max_failures=self.args.max_failures,
+                                      concurrency=self.args.concurrency,
+                                      per_server=self.args.per_server,
+                                      set_boot=self.args.set_boot,
+                                      delete_unneeded=self.args.delete_unneeded,
+                                      reload=self.args.reload,
+                                      reload_interval=self.args.reload_interval,
+                                      timeout=self.args.timeout,
+                                      callback=progress,
+                                      fwserver=fwserver,
+                                      **self.login_kwargs())
+        except upgrade.UpgradeException as err:
+            util.die("Error: %s" % err)
+        print("Summary:", ", ".join("%s %d" % (key, val) for key, val in sorted(summary.items())))
+        if set(summary) - {"done"}:
+            sys.exit(1)
+
+
 # ########################################################################
 # Configuration
 # ########################################################################
@@ -139,6 +422,11 @@ class CLI_configure(BaseCLI):
                                  action="store_true",
                                  help='File with configuration commands',
                                  )
+        self.parser.add_argument('--pipeline',
+                                 default=False,
+                                 action="store_true",
+                                 help='Stream configuration lines without waiting for each prompt',
+                                 )
 
     def run(self):
         if not (self.args.config or self.args.file):
@@ -152,7 +440,8 @@ class CLI_configure(BaseCLI):
                         lines.append(line.strip())
             else:
                 lines = self.args.config
-            res =  self.mgr.configure(config_lines=lines, save_running_config=self.args.save_running_config)
+            kwargs = self.mgr.pipeline_kwargs(self.args.pipeline)
+            res =  self.mgr.configure(config_lines=lines, save_running_config=self.args.save_running_config, **kwargs)
             print("Result :", res)
         except self.mgr_cls.ElementException as err:
             print("Error: %s" % err)
@@ -160,10 +449,24 @@ class CLI_configure(BaseCLI):
 
 class CLI_get_running_config(BaseCLI):
 
+    def add_arguments(self):
+        super().add_arguments()
+        self.parser.add_argument('--cache',
+                                 action='store_true',
+                                 help='Use the persistent config cache, only fetch config if element reports a change',
+                                 default=False)
+        self.parser.add_argument('--refresh',
+                                 action='store_true',
+                                 help='Always fetch the config from the element',
+                                 default=False)
+
     def run(self):
         try:
+            if self.args.cache:
+                from emmgr.lib.configcache import ConfigCache
+                self.args.config_cache = ConfigCache()
             super().run()
-            lines = self.mgr.get_running_config()
+            lines = self.mgr.get_running_config(refresh=self.args.refresh)
             print("Running configuration:")
             if lines:
                 for line in lines:
@@ -206,13 +509,18 @@ class CLI_interface_clear_config(BaseCLI):
     def add_arguments(self):
         super().add_arguments()
         self.parser.add_argument("--interface",
-                                 help='Interface to clear',
+                                 help='Interface to clear, comma separated list for several interfaces',
+                                 required=True,
                                  )
 
     def run(self):
         try:
             super().run()
-            res = self.mgr.interface_clear_config(interface=self.args.interface)
+            interfaces = self.args.interface.split(",")
+            if len(interfaces) > 1:
+                res = self.mgr.interfaces_clear_config(interfaces=interfaces)
+            else:
+                res = self.mgr.interface_clear_config(interface=self.args.interface)
             print("Result :", res)
         except self.mgr_cls.ElementException as err:
             print("Error: %s" % err)
@@ -240,7 +548,7 @@ class CLI_interface_set_admin_state(BaseCLI):
     def add_arguments(self):
         super().add_arguments()
         self.parser.add_argument("--interface",
-                                 help='Interface to modify',
+                                 help='Interface to modify, comma separated list for several interfaces',
                                  required=True,
                                  )
         self.parser.add_argument("-s", "--state",
@@ -252,8 +560,13 @@ class CLI_interface_set_admin_state(BaseCLI):
     def run(self):
         try:
             super().run()
-            res = self.mgr.interface_set_admin_state(interface=self.args.interface,
-                                                    state=self.args.state)
+            interfaces = self.args.interface.split(",")
+            if len(interfaces) > 1:
+                res = self.mgr.interfaces_set_admin_state(interfaces=interfaces,
+                                                         state=self.args.state)
+            else:
+                res = self.mgr.interface_set_admin_state(interface=self.args.interface,
+                                                        state=self.args.state)
             print("Result :", res)
         except self.mgr_cls.ElementException as err:
             print("Error: %s" % err)
@@ -285,6 +598,129 @@ class CLI_l2_peers(BaseCLI):
             print("Error: %s" % err)
 
 
+class CLI_mac_table_get(BaseCLI):
+
+    def add_arguments(self):
+        super().add_arguments()
+        self.parser.add_argument("--interface",
+                                 help='Only get MAC addresses on this interface',
+                                 )
+        self.parser.add_argument("--vlan",
+                                 type=int,
+                                 help='Only get MAC addresses in this VLAN',
+                                 )
+        self.parser.add_argument("--count",
+                                 action="store_true",
+                                 default=False,
+                                 help='Print number of MAC addresses per interface',
+                                 )
+
+    def run(self):
+        try:
+            super().run()
+            table = self.mgr.mac_table_get(interface=self.args.interface, vlan=self.args.vlan)
+            if self.args.count:
+                for interface, count in table.count_by_interface().items():
+                    print("    %-20s %d" % (interface, count))
+            else:
+                for mac, vlan, interface in table:
+                    print("    %s  %4d  %s" % (emtypes.MAC_Address.format(mac), vlan, interface))
+            print("Total %d MAC addresses" % len(table))
+        except self.mgr_cls.ElementException as err:
+            print("Error: %s" % err)
+
+
+class CLI_l2_topology(BaseCLI):
+    """
+    Discover the L2 topology, starting from seed elements
+    """
+
+    def add_arguments(self):
+        """Seed elements are specified with -H/-m or an inventory"""
+        self.parser.add_argument('-H', '--hostname',
+                                 action="append",
+                                 help='Seed element, can be repeated',
+                                 )
+        self.parser.add_argument('-m', '--model',
+                                 help='Model of seed elements given with -H',
+                                 )
+        self.parser.add_argument('-f', '--inventory',
+                                 help='Inventory file, all elements are seeds. Also used to find model and address of discovered elements',
+                                 )
+        self.parser.add_argument('--model_map',
+                                 help='YAML file, list of {match: <regex on peer description>, model: <model>}',
+                                 )
+        self.parser.add_argument('--default_model',
+                                 help='Model for discovered elements not in the inventory or model map',
+                                 )
+        self.parser.add_argument('--include',
+                                 help='Only crawl elements with hostname matching this regex',
+                                 )
+        self.parser.add_argument('--max_depth',
+                                 type=int,
+                                 help='Max number of hops from the seeds',
+                                 )
+        self.parser.add_argument('--domain',
+                                 help='Default domain for hostnames',
+                                 )
+        self.parser.add_argument('--format',
+                                 choices=['json', 'graphml'],
+                                 default='json',
+                                 )
+        self.parser.add_argument('-o', '--output',
+                                 help='Output file, default stdout',
+                                 )
+        self.add_concurrency_arguments(timeout=120)
+        self.add_login_arguments()
+        self.add_loglevel_argument(default='warning')
+
+    def run(self):
+        import emmgr.lib.batch as batch
+        import emmgr.lib.topology as topology
+        self.set_loglevel()
+        inventory = []
+        seeds = []
+        try:
+            if self.args.inventory:
+                inventory = batch.load_inventory(self.args.inventory)
+                seeds += inventory
+            model_map = []
+            if self.args.model_map:
+                model_map = util.yaml_load(self.args.model_map)
+        except (batch.BatchException, util.UtilException) as err:
+            util.die("Error: %s" % err)
+        for hostname in self.args.hostname or []:
+            if not self.args.model:
+                util.die("Error: You need to specify -m/--model for seeds given with -H")
+            seeds.append(dict(hostname=hostname, model=self.args.model))
+        if not seeds:
+            util.die("Error: You need to specify seeds with -H/--hostname or -f/--inventory")
+
+        def progress(res):
+            log.info("topology, %s %s", res["hostname"], res["status"])
+
+        topo = topology.crawl(seeds,
+                              callback=progress,
+                              concurrency=self.args.concurrency,
+                              timeout=self.args.timeout,
+                              max_depth=self.args.max_depth,
+                              inventory=inventory,
+                              model_map=model_map,
+                              default_model=self.args.default_model,
+                              include=self.args.include,
+                              domain=self.args.domain,
+                              **self.login_kwargs())
+        if self.args.format == "graphml":
+            output = topo.to_graphml()
+        else:
+            output = topo.to_json()
+        if self.args.output:
+            with open(self.args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+
+
 # ########################################################################
 # VLAN management
 # ########################################################################
@@ -358,7 +794,6 @@ class CLI_vlan_interface_get(BaseCLI):
     def run(self):
         """
         Get all VLANs on an interface
-        Returns a dict, key is vlan ID
         """
         try:
             super().run()
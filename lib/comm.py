@@ -2,30 +2,47 @@
 '''
 Functionality to communicate with remote nodes, in a Expect like way
 
-Supports ssh and telnet
+Supports ssh and telnet. The ssh2 and telnetlib modules are imported
+when the first connection using them is opened
 '''
 
 import os.path
 import re
-import telnetlib
+import time
+import struct
+import functools
+try:
+    import re._parser as sre_parse      # Python 3.11+
+except ImportError:
+    import sre_parse
 import socket
 import selectors
-import ssh2.session
 
 import emmgr.lib.log as log
+import emmgr.lib.metrics as metrics
 
+ssh2 = None             # ssh2 module, see import_ssh2()
+ssh_exceptions = ()     # All ssh base exceptions, see import_ssh2()
 
-# All ssh base exceptions
-ssh_exceptions = (
-    ssh2.exceptions.SSH2Error,
-    ssh2.exceptions.AgentError,
-    ssh2.exceptions.AuthenticationError,
-    ssh2.exceptions.SessionError,
-    ssh2.exceptions.PublicKeyError,
-    ssh2.exceptions.ChannelError,
-    ssh2.exceptions.SFTPError,
-    ssh2.exceptions.KnownHostError
-)
+
+def import_ssh2():
+    """
+    Import the ssh2 module, on first use
+    """
+    global ssh2, ssh_exceptions
+    if ssh2 is None:
+        import ssh2.session
+        import ssh2.exceptions
+        ssh_exceptions = (
+            ssh2.exceptions.SSH2Error,
+            ssh2.exceptions.AgentError,
+            ssh2.exceptions.AuthenticationError,
+            ssh2.exceptions.SessionError,
+            ssh2.exceptions.PublicKeyError,
+            ssh2.exceptions.ChannelError,
+            ssh2.exceptions.SFTPError,
+            ssh2.exceptions.KnownHostError
+        )
 
 class CommException(Exception):
     def __init__(self, errno, message):
@@ -33,6 +50,62 @@ class CommException(Exception):
         self.message = message
 
 
+# Transcript file format, see TranscriptWriter
+transcript_magic = b"EMTR1\n"
+transcript_header = struct.Struct("<cdI")
+
+
+class TranscriptWriter:
+    """
+    Writes all data sent and received on a connection to a file
+
+    The file starts with transcript_magic, followed by records with
+    a header (kind, seconds since start, length) and the data
+    kind is b"r" for received and b"w" for sent data, and b"l" for
+    log messages when used as a trace sink, see log.trace()
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.f = open(filename, "wb")
+        self.f.write(transcript_magic)
+        self.start = time.monotonic()
+
+    def record(self, kind, data):
+        if self.f is None:
+            return
+        self.f.write(transcript_header.pack(kind, time.monotonic() - self.start, len(data)))
+        self.f.write(data)
+
+    def flush(self):
+        if self.f:
+            self.f.flush()
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+
+
+def read_transcript(filename):
+    """
+    Read a transcript file
+    Returns a list of (kind, timestamp, data)
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if not data.startswith(transcript_magic):
+        raise CommException(1, "%s is not a transcript file" % filename)
+    records = []
+    pos = len(transcript_magic)
+    while pos + transcript_header.size <= len(data):
+        kind, timestamp, length = transcript_header.unpack_from(data, pos)
+        pos += transcript_header.size
+        records.append((kind, timestamp, data[pos:pos + length]))
+        pos += length
+    return records
+
+
 class Telnet_Connection:
     """
     A Wrapper for a telnet connection
@@ -41,10 +114,12 @@ class Telnet_Connection:
         """
         Open a telnet connection
         """
+        import telnetlib
         if port is None: 
             port = 23
         try:
-            self.tn = telnetlib.Telnet(host=str(host), port=port, timeout=timeout)
+            with metrics.span("tcp_connect"):
+                self.tn = telnetlib.Telnet(host=str(host), port=port, timeout=timeout)
         except (ConnectionError, socket.error, EOFError) as err:
             raise CommException(1, "Timeout connecting to %s" % host)
         self.fd = self.tn.fileno()
@@ -76,29 +151,32 @@ class SSH_Connection:
         """
         Open a SSH connection and authenticate
         """
+        import_ssh2()
         if port is None:
             port = 22
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         if timeout:
             self.sock.settimeout(timeout)
         try:
-            self.sock.connect((str(host), port))
+            with metrics.span("tcp_connect"):
+                self.sock.connect((str(host), port))
         except socket.error as err:
             raise CommException(1, "socket.connect() host %s, err %s" % (host, err))
 
         try:
-            self.ssh_session = ssh2.session.Session()
-            if timeout:
-                self.ssh_session.set_timeout(timeout * 1000)   # In milliseconds
-            try:
-                self.ssh_session.handshake(self.sock)
-            except ssh2.exceptions.SocketRecvError as err:
-                raise CommException(1, err)
-            self.ssh_session.userauth_password(username, password)
-
-            self.channel = self.ssh_session.open_session()
-            self.channel.pty(term="dumb")
-            self.channel.shell()
+            with metrics.span("ssh_handshake"):
+                self.ssh_session = ssh2.session.Session()
+                if timeout:
+                    self.ssh_session.set_timeout(timeout * 1000)   # In milliseconds
+                try:
+                    self.ssh_session.handshake(self.sock)
+                except ssh2.exceptions.SocketRecvError as err:
+                    raise CommException(1, err)
+                self.ssh_session.userauth_password(username, password)
+
+                self.channel = self.ssh_session.open_session()
+                self.channel.pty(term="dumb")
+                self.channel.shell()
         except ssh_exceptions as err:
             raise CommException(1, "Cannot connect using ssh, err: %s" % err)
         self.fd = self.sock.fileno()
@@ -130,12 +208,22 @@ class RemoteConnection:
     - ensures that all newlines follows unix style "\n"
     """
 
-    def __init__(self, codec="utf8", timeout=10, method=None, newline=None):
+    compact_size = 65536    # Consumed data in buffer larger than this is discarded on next fill
+    write_size = 512        # Current write chunk size
+    write_size_min = 512
+    write_size_max = 65536
+
+    def __init__(self, codec="utf8", timeout=10, method=None, newline=None, record=None):
         self._codec = codec
         self._timeout = timeout
         self._method = method
+        self._record = record       # Filename or TranscriptWriter, all sent and received data is saved here
+        self.transcript = None
 
-        self._buffer = b""
+        self._buffer = bytearray()  # Received data
+        self._pos = 0               # Read offset in _buffer
+        self._last_len = 0          # Number of bytes returned by last read()
+        self._last_exact = False    # True if last read() returned one character per byte
         self.status = ""
         if newline:
             self.newline = newline
@@ -143,28 +231,95 @@ class RemoteConnection:
             self.newline = "\n"
         self.selector_r = selectors.DefaultSelector()
         self.selector_w = selectors.DefaultSelector()
+        self.conn = None
+        self._aborted = False
 
     def connect(self, host, port=None, username=None, password=None):
-        if self._method == "ssh":
-            self.conn = SSH_Connection(host, port=port, username=username, password=password, timeout=self._timeout)
-
-        elif self._method == "telnet":
-            self.conn = Telnet_Connection(host, port=port, timeout=self._timeout)
-
-        else:
-            raise CommException(1, "Unknown connection method %s" % self.method)
+        with metrics.span("connect"):
+            if self._method == "ssh":
+                self.conn = SSH_Connection(host, port=port, username=username, password=password, timeout=self._timeout)
+
+            elif self._method == "telnet":
+                self.conn = Telnet_Connection(host, port=port, timeout=self._timeout)
+
+            else:
+                raise CommException(1, "Unknown connection method %s" % self.method)
+        if self._aborted:
+            self.conn.close()
+            raise CommException(1, "Connection to %s aborted" % host)
         sock = self.conn.get_socket()
         self.selector_r.register(sock, selectors.EVENT_READ)
         self.selector_w.register(sock, selectors.EVENT_WRITE)
+        if isinstance(self._record, TranscriptWriter):
+            self.transcript = self._record      # Owned by the caller
+        elif self._record:
+            self.transcript = TranscriptWriter(self._record)
 
     def disconnect(self):
         self.conn.close()
+        if self.transcript:
+            if self.transcript is not self._record:
+                self.transcript.close()
+            self.transcript = None
+
+    def abort(self):
+        """
+        Abort the connection, can be called from another thread
+        A read or write that is waiting fails at once, a connect in progress
+        fails when the TCP connect or login completes
+        Closing the socket is not enough, select() does not wake up on close
+        """
+        self._aborted = True
+        conn = self.conn
+        if conn is not None:
+            try:
+                conn.get_socket().shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
     def unread(self, data):
         """
         Return data to beginning of buffer
+        If data is the tail of the last read, only the read offset is moved back
+        """
+        if self._last_exact and len(data) <= self._last_len and data.isascii():
+            # Each byte of last read was one character, no need to encode
+            self._pos -= len(data)
+            self._last_len -= len(data)
+            return
+        self._buffer[self._pos:self._pos] = data.encode(self._codec)
+        self._last_len = 0
+
+    def _fill(self, length, timeout):
+        """
+        Read data from connection into buffer
+        Returns False on timeout/disconnect
         """
-        self._buffer = data.encode(self._codec) + self._buffer
+        if self._aborted:
+            return False
+        events = self.selector_r.select(timeout=timeout)    # We ignore the event, only one socket
+        if not events:
+            return False  # timeout
+        try:
+            if length:
+                data = self.conn.read(length)
+            else:
+                data = self.conn.read()
+            if data == "":
+                return False  # disconnected
+        except ssh_exceptions as err:
+            return False  # disconnect
+        if self.transcript and data:
+            self.transcript.record(b"r", data)
+        if self._pos == len(self._buffer):
+            # All data consumed, reuse the buffer
+            del self._buffer[:]
+            self._pos = 0
+        elif self._pos > self.compact_size:
+            del self._buffer[:self._pos]
+            self._pos = 0
+        self._buffer += data
+        return True
 
     def read(self, length=4096, timeout=None):
         """
@@ -173,66 +328,65 @@ class RemoteConnection:
         """
         while True:
             # return data from buffer if we have any
-            if len(self._buffer):
-                if length < len(self._buffer):
-                    data = self._buffer[:length]
-                    self._buffer = self._buffer[length:]
-                else:
-                    data = self._buffer
-                    self._buffer = b""
-                return data.decode(self._codec, errors="ignore")
-
-            events = self.selector_r.select(timeout=timeout)    # We ignore the event, only one socket
-            try:
-                if length:
-                    data = self.conn.read(length)
-                else:
-                    data = self.conn.read()
-                if data == "":
-                    return None  # disconnected
-            except ssh_exceptions as err:
-                return None  # disconnect
-            self._buffer += data
+            if self._pos < len(self._buffer):
+                end = min(self._pos + length, len(self._buffer))
+                with memoryview(self._buffer) as view:
+                    data = str(view[self._pos:end], self._codec, "ignore")
+                self._last_len = end - self._pos
+                self._last_exact = len(data) == self._last_len
+                self._pos = end
+                return data
+
+            if not self._fill(length, timeout):
+                return None
 
     def readline(self, timeout=None):
         """
         read from connection until newline received
         """
         while True:
-            if b"\r\n" in self._buffer:
-                data, tmp, self._buffer = self._buffer.partition(b"\r\n")
-                return data.decode(self._codec)
-
-            events = self.selector_r.select(timeout=timeout)    # We ignore the event, only one socket
-            try:
-                data = os.read(sock, 4096)
-                if data == "":
-                    return None  # disconnected
-            except OSError:
-                return None  # disconnect
-            self._buffer += data
+            ix = self._buffer.find(b"\r\n", self._pos)
+            if ix >= 0:
+                with memoryview(self._buffer) as view:
+                    data = str(view[self._pos:ix], self._codec)
+                self._pos = ix + 2
+                self._last_len = 0
+                return data
+
+            if not self._fill(4096, timeout):
+                return None
 
     def write(self, line):
         """
         Write to connection
         We use select so we don't overrun/block the connection
+        The chunk size adapts, it grows while the connection is writable
+        and shrinks when we have to wait for it
         """
-        line = line.encode(self._codec)
-        while True:
-            events = self.selector_w.select()   # We ignore the event, only one socket
+        data = line.encode(self._codec)
+        pos = 0
+        while pos < len(data):
+            events = self.selector_w.select(timeout=0)    # We ignore the event, only one socket
+            if events:
+                self.write_size = min(self.write_size * 2, self.write_size_max)
+            else:
+                self.write_size = max(self.write_size // 2, self.write_size_min)
+                self.selector_w.select()
+            chunk = data[pos:pos + self.write_size]
             try:
-                if len(line) < 512:
-                    self.conn.write(line)
-                    return
-                self.conn.write(line[:512])
-                line = line[512:]
+                self.conn.write(chunk)
             except OSError:
                 return None
+            if self.transcript:
+                self.transcript.record(b"w", chunk)
+            pos += self.write_size
 
     def writeln(self, msg=None):
+        # One write, a separate newline packet is delayed by Nagle/delayed ack
         if msg:
-            self.write(msg)
-        self.write(self.newline)
+            self.write(msg + self.newline)
+        else:
+            self.write(self.newline)
 
     def flush(self):
         # self.p.stdin.flush()
@@ -240,6 +394,216 @@ class RemoteConnection:
         pass
 
 
+class ReplayConnection(RemoteConnection):
+    """
+    Replays a transcript recorded by RemoteConnection, instead of
+    talking to an element. Written data is discarded.
+
+    speed is relative to the recorded timing, 1.0 is same speed, None is
+    as fast as possible. When all data is returned, reads times out.
+    """
+
+    def __init__(self, filename, codec="utf8", timeout=10, newline=None, speed=None):
+        super().__init__(codec=codec, timeout=timeout, method="replay", newline=newline)
+        self.filename = filename
+        self.speed = speed
+        self._records = []
+        self._ix = 0
+        self._start = None
+
+    def connect(self, host=None, port=None, username=None, password=None):
+        self._records = [r for r in read_transcript(self.filename) if r[0] == b"r"]
+        self._ix = 0
+        self._start = time.monotonic()
+
+    def disconnect(self):
+        self._records = []
+
+    def _fill(self, length, timeout):
+        if self._aborted or self._ix >= len(self._records):
+            return False
+        kind, timestamp, data = self._records[self._ix]
+        self._ix += 1
+        if self.speed:
+            delay = timestamp / self.speed - (time.monotonic() - self._start)
+            if delay > 0:
+                time.sleep(delay)
+        if self._pos == len(self._buffer):
+            del self._buffer[:]
+            self._pos = 0
+        self._buffer += data
+        return True
+
+    def write(self, line):
+        pass
+
+
+class Matcher:
+    """
+    Incremental regex matcher used by Expect
+
+    Received data is fed in chunks. Each pattern is only searched in the new
+    chunk plus a bounded look-behind window, so the total work is linear in
+    the amount of received data instead of quadratic.
+
+    The look-behind window for a pattern is its maximum match width, for
+    patterns with unbounded width (for example .*) the default lookbehind
+    is used.
+
+    One character before the window is kept, and not searched, so ^ only
+    matches at the start of all data, and a look-behind like (?<![^\\r\\n])
+    sees if the window starts at a line start. See Prompt.
+    """
+
+    lookbehind = 4096    # Default look-behind, for patterns with unbounded width
+
+    def __init__(self, matches, lookbehind=None):
+        if lookbehind is not None:
+            self.lookbehind = lookbehind
+
+        self.regexes = []
+        maxback = 0
+        for key, match in self.normalize(matches).items():
+            regex = re.compile(match)
+            back = self._max_width(regex) - 1
+            if back < 0 or back > self.lookbehind:
+                back = self.lookbehind
+            maxback = max(maxback, back)
+            self.regexes.append((key, regex, back))
+        self._maxback = maxback
+
+        self._chunks = []       # All received data, joined only on match
+        self._size = 0          # Total length of received data
+        self._window = ""       # Look-behind tail + last received chunk
+        self.before = None      # Everything up to and including the match
+        self.match = None       # Matched text
+        self.regex = None       # Regex that matched
+        self.after = None       # Received data after the match
+
+    @staticmethod
+    def normalize(matches):
+        """
+        Returns matches as a dict, key -> pattern
+        A pattern gets key '0', a list gets the list index as key
+        """
+        if isinstance(matches, (str, re.Pattern)):
+            return {'0': matches}
+        if isinstance(matches, list):
+            return dict(enumerate(matches))
+        return matches
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _max_width(regex):
+        """
+        Returns the maximum length of a match, or -1 if it can't be determined
+        Cached, the same prompt patterns are used for every expect
+        """
+        try:
+            return sre_parse.parse(regex.pattern, regex.flags).getwidth()[1]
+        except Exception:
+            return -1
+
+    def feed(self, data):
+        """
+        Add received data and search for a match
+        Returns key of the matching pattern, or None if no match yet
+        """
+        self._chunks.append(data)
+        self._size += len(data)
+        tail = len(self._window) - self._maxback - 1
+        if tail > 0:
+            window = self._window[tail:] + data
+        else:
+            window = self._window + data
+        self._window = window
+        offset = self._size - len(window)      # Position of window in all data
+        start = len(window) - len(data)        # Position of new data in window
+        first = 1 if offset > 0 else 0         # window[0] is only context
+
+        for key, regex, back in self.regexes:
+            m = regex.search(window, max(first, start - back))
+            if m:
+                self.match = m.group()
+                self.regex = regex
+                data = self.get_data()
+                self.before = data[:offset + m.end()]
+                self.after = data[offset + m.end():]
+                return key
+        return None
+
+    def get_data(self):
+        """
+        Returns all received data
+        """
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        if self._chunks:
+            return self._chunks[0]
+        return ""
+
+
+# Commands that change the prompt, a learned prompt is forgotten
+prompt_reset_re = re.compile(r"\s*hostname\s")
+
+
+class Prompt:
+    """
+    The exact prompt of a session, learned from the first prompt after login
+
+    The prompt is the element hostname, an optional mode in parentheses and
+    the suffix from config.wait_for_prompt, for example "sw1#" and
+    "sw1(config-if)#". The patterns only match the prompt on its own line,
+    followed by a line break or the end of the received data, so a "#" in
+    command output does not end a command early.
+
+    mode is updated from each matched prompt, "" in exec mode and for
+    example "config" or "config-if" in config mode
+
+    config_pattern and exec_pattern match a config or exec mode prompt
+    anywhere in the data, for pipelined configuration where several
+    prompts arrive at once
+    """
+    max_mode = 40       # Max length of the mode, keeps the pattern width bounded
+
+    def __init__(self, name, suffixes):
+        self.name = name
+        self.mode = ""
+        self.patterns = {}
+        for key, suffix in Matcher.normalize(suffixes).items():
+            self.patterns[key] = re.compile(r"(?<![^\r\n])%s(?:\([^()\r\n]{1,%d}\))?(?:%s)[ \t]{0,8}(?=[\r\n]|\Z)" %
+                                            (re.escape(name), self.max_mode, suffix))
+        self.config_pattern = re.compile(r"(?<![^\r\n])%s\([^()\r\n]{1,%d}\)(?:%s)" %
+                                         (re.escape(name), self.max_mode, "|".join(Matcher.normalize(suffixes).values())))
+        self.exec_pattern = re.compile(r"(?<![^\r\n])%s(?:%s)" %
+                                       (re.escape(name), "|".join(Matcher.normalize(suffixes).values())))
+
+    @classmethod
+    def learn(cls, before, match, suffixes):
+        """
+        Learn the prompt from the text of a matched prompt
+        before is the received data up to and including match
+        Returns a Prompt, or None if the last line does not look like a prompt
+        """
+        if not match or not before.endswith(match):
+            return None
+        line = before[:-len(match)]
+        line = line[max(line.rfind("\n"), line.rfind("\r")) + 1:]
+        m = re.fullmatch(r"([^\s()]{1,64})(?:\(([^()\r\n]{1,%d})\))?" % cls.max_mode, line)
+        if m is None:
+            return None
+        prompt = cls(m.group(1), suffixes)
+        prompt.mode = m.group(2) or ""
+        return prompt
+
+    def update(self, match):
+        """
+        Update mode from the text of a matched prompt
+        """
+        start = match.rfind("(")
+        self.mode = match[start + 1:match.rfind(")")] if start >= 0 else ""
+
+
 class Expect:
     """
     Implements expect functionality, to easily work with network elements
@@ -247,12 +611,15 @@ class Expect:
     An instance of RemoteConnection is a good candidates
     """
 
-    def __init__(self, transport=None):
+    def __init__(self, transport=None, lookbehind=None):
         self.transport = transport
+        self.lookbehind = lookbehind
         self.before = ''
         self.match = None        # result from last match
         self.buffer = ""
         self.prev_data = ""
+        self.prompt = None       # Prompt, learned prompt of the session
+        self.broken = False      # True if expect timed out, the session is out of sync
 
     def _get(self, timeout=None):
         if self.prev_data:
@@ -267,52 +634,39 @@ class Expect:
         If match, returns key of which regex matched
         if no match (timeout), returns None
         """
+        with metrics.span("expect"):
+            return self._expect(matches, timeout)
+
+    def _expect(self, matches, timeout):
         self.before = ''
         self.match = None
-
-        if isinstance(matches, str):
-            matches = {'0': matches}
-
-        elif isinstance(matches, list):
-            tmp = {}
-            ix = 0
-            for match in matches:
-                tmp[ix] = match
-                ix += 1
-            matches = tmp
-
-        regexes = {}
-        for key, match in matches.items():
-            regexes[key] = re.compile(match)
+        matcher = Matcher(matches, lookbehind=self.lookbehind)
 
         while True:
             c = self.transport.read(timeout=timeout)
             if c is None:
                 break
-            self.before += c
-            for key, regex in regexes.items():
-                m = regex.search(self.before)
-                if m:
-                    log.debug("  expect, matched pattern: '%s' %s" % (key, regex))
-                    self.match = m.group()
+            key = matcher.feed(c)
+            if key is not None:
+                self.before = matcher.before
+                self.match = matcher.match
+                if log.isEnabledFor(log.DEBUG):
+                    log.debug("  expect, matched pattern: '%s' %s", key, matcher.regex)
+                    tmp = self.match.replace("\n", "\\n").replace("\r", "\\r")
+                    log.debug("  expect, matched text   : %s", tmp)
+                    tmp = self.before.replace("\n", "\\n").replace("\r", "\\r")
+                    log.debug("  expect, self.before    : %s", tmp)
+
+                if len(matcher.after):
+                    # There are received data after our match, return the extra data
                     if log.isEnabledFor(log.DEBUG):
-                        tmp = self.match.replace("\n", "\\n").replace("\r", "\\r")
-                        log.debug("  expect, matched text   : %s" % tmp)
+                        tmp = matcher.after.replace("\n", "\\n").replace("\r", "\\r")
+                        log.debug("  expect, returned to buffer: '%s'", tmp)
+                    self.transport.unread(matcher.after)  # text after match is returned to transport
 
-                    tmp = self.before[:m.end()]    # Everthing up to matched text
-                    if log.isEnabledFor(log.DEBUG):
-                        tmp = tmp.replace("\n", "\\n").replace("\r", "\\r")
-                        log.debug("  expect, self.before    : %s" % tmp)
-
-                    tmp = self.before[m.end():]
-                    if len(tmp):
-                        # There are received data after our match, return the extra data
-                        if log.isEnabledFor(log.DEBUG):
-                            tmp = tmp.replace("\n", "\\n").replace("\r", "\\r")
-                            log.debug("  expect, returned to buffer: '%s'" % tmp)
-                        self.transport.unread(self.before[m.end():])  # text after match is returned to transport
-
-                    return key
+                return key
+        self.before = matcher.get_data()
+        self.broken = True
         raise CommException(1, "  expect, timeout, self.before: %s" % self.before)
 
     def read(self, maxlen):
@@ -320,12 +674,14 @@ class Expect:
 
     def write(self, msg=None):
         if msg == None: msg = ""
-        log.debug("------------------- write('%s') -------------------" % msg)
+        log.debug("------------------- write('%s') -------------------", msg)
         self.transport.write(msg)
 
     def writeln(self, msg=None):
         if msg == None: msg = ""
-        log.debug("------------------- writeln('%s') -------------------" % msg)
+        log.debug("------------------- writeln('%s') -------------------", msg)
+        if self.prompt and prompt_reset_re.match(msg):
+            self.prompt = None   # Learned again at the next prompt
         self.transport.writeln(msg)
 
 
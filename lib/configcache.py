@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+'''
+Persistent cache of element running-configurations
+
+One JSON file per element, with the configuration lines, when it was
+fetched, a hash of the configuration and a change marker. The change
+marker is output from a cheap command on the element, that changes when
+the configuration changes (for example "Last configuration change" on IOS).
+'''
+
+import os
+import json
+import hashlib
+from orderedattrdict import AttrDict
+
+import emmgr.lib.config as config
+import emmgr.lib.log as log
+import emmgr.lib.util as util
+
+
+class ConfigCache:
+    """
+    Running-configurations stored on disk, keyed by hostname
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = config.em.get("config_cache_dir", "/var/cache/emmgr/config")
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _filename(self, hostname):
+        return os.path.join(self.directory, "%s.json" % str(hostname).replace(os.sep, "_"))
+
+    @staticmethod
+    def hash(lines):
+        return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+    def get(self, hostname):
+        """
+        Returns cached entry with attributes lines, timestamp, hash and marker
+        Returns None if there is no entry for hostname
+        """
+        try:
+            with open(self._filename(hostname), "r") as f:
+                return AttrDict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            log.warning("Ignoring unreadable config cache for %s: %s", hostname, err)
+            return None
+
+    def put(self, hostname, lines, marker=None):
+        """
+        Store lines for hostname, returns the stored entry
+        """
+        entry = AttrDict(hostname=hostname,
+                         timestamp=util.now().strftime("%Y-%m-%d %H:%M:%S"),
+                         hash=self.hash(lines),
+                         marker=marker,
+                         lines=lines)
+        filename = self._filename(hostname)
+        tmpfile = filename + ".tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmpfile, filename)
+        return entry
+
+    def delete(self, hostname):
+        try:
+            os.remove(self._filename(hostname))
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+'''
+Running-configuration parsed into a tree, using the indentation
+
+Used to answer questions about the configuration, for example the config
+of one interface, or all interfaces with a specific setting, without
+scanning all lines or asking the element again.
+
+  interface GigabitEthernet0/1           <- section
+   switchport trunk allowed vlan 10      <- child
+  !
+  router bgp 65000
+   address-family ipv4                   <- section in section
+    network 10.0.0.0
+'''
+
+import re
+
+# Lines that only separates sections
+separators = ("!", "#")
+
+re_interface = re.compile(r"^([A-Za-z-]+)\s*(\d.*)$")
+
+
+def split_interface(name):
+    """
+    Split an interface name in type and number, both lowercase
+    "GigabitEthernet0/1" -> ("gigabitethernet", "0/1")
+    Returns None if name does not look like an interface
+    """
+    match = re_interface.search(name.strip())
+    if not match:
+        return None
+    return match.group(1).lower(), match.group(2).replace(" ", "").lower()
+
+
+class ConfigNode:
+    """
+    One line in the configuration, with its children (indented lines)
+    """
+    __slots__ = ("text", "indent", "parent", "children", "index")
+
+    def __init__(self, text="", indent=-1, parent=None):
+        self.text = text            # Line, as in the configuration
+        self.indent = indent
+        self.parent = parent
+        self.children = []
+        self.index = {}             # Stripped child line -> child node
+
+    def __repr__(self):
+        return "ConfigNode(%r, %d children)" % (self.text, len(self.children))
+
+    @property
+    def line(self):
+        """
+        Line without indentation
+        """
+        return self.text.strip()
+
+    def add(self, node):
+        node.parent = self
+        self.children.append(node)
+        self.index.setdefault(node.line, node)
+
+    def get(self, line):
+        """
+        Returns child with the line, or None
+        """
+        return self.index.get(line.strip())
+
+    def walk(self):
+        """
+        Iterate over all nodes below this node, depth first
+        """
+        for child in self.children:
+            yield child
+            yield from child.walk()
+
+    def lines(self, children_only=False):
+        """
+        Returns the configuration lines for this node and all nodes below
+        """
+        res = []
+        if not children_only and self.indent >= 0:
+            res.append(self.text)
+        for node in self.walk():
+            res.append(node.text)
+        return res
+
+    def find(self, filter_):
+        """
+        Returns all nodes below this node where the line matches filter_ (regex)
+        """
+        p = re.compile(filter_)
+        return [node for node in self.walk() if p.search(node.text)]
+
+    def has(self, filter_):
+        """
+        Returns True if any line below this node matches filter_ (regex)
+        """
+        p = re.compile(filter_)
+        for node in self.walk():
+            if p.search(node.text):
+                return True
+        return False
+
+
+class ConfigTree:
+    """
+    A configuration, as a tree of ConfigNodes
+
+    Top level sections are indexed on the first word, and interfaces
+    on the interface number, so lookups does not need to scan the config
+    """
+
+    def __init__(self, lines):
+        self.config_lines = lines   # Used to detect if the config has been refetched
+        self.root = ConfigNode()
+        self.keywords = {}          # first word -> list of top level nodes
+        self.interfaces = {}        # interface number -> list of interface nodes
+        self._parse(lines)
+
+    def _parse(self, lines):
+        stack = [self.root]
+        for text in lines:
+            text = text.rstrip()
+            line = text.lstrip()
+            if not line or line in separators:
+                continue
+            indent = len(text) - len(line)
+            while stack[-1].indent >= indent:
+                stack.pop()
+            node = ConfigNode(text, indent)
+            stack[-1].add(node)
+            stack.append(node)
+            if len(stack) == 2:
+                self._index(node)
+
+    def _index(self, node):
+        words = node.line.split(None, 1)
+        self.keywords.setdefault(words[0], []).append(node)
+        if words[0] == "interface" and len(words) > 1:
+            name = split_interface(words[1])
+            if name:
+                self.interfaces.setdefault(name[1], []).append((name[0], node))
+
+    def __len__(self):
+        return len(self.root.children)
+
+    def section(self, *path):
+        """
+        Returns the node for a section, or None
+        path is the lines to the section, for example
+           section("router bgp 65000", "address-family ipv4")
+        """
+        node = self.root
+        for line in path:
+            node = node.get(line)
+            if node is None:
+                return None
+        return node
+
+    def sections(self, keyword, filter_=None):
+        """
+        Returns all top level sections starting with keyword
+        If filter_ (regex) is specified, only sections with at least
+        one matching line are returned, for example
+            sections("interface", "switchport trunk")
+        """
+        nodes = self.keywords.get(keyword.split(None, 1)[0], [])
+        if " " in keyword.strip():
+            nodes = [node for node in nodes if node.line.startswith(keyword)]
+        if filter_ is None:
+            return list(nodes)
+        return [node for node in nodes if node.has(filter_)]
+
+    def interface(self, name):
+        """
+        Returns the section for interface name, or None
+        Abbreviated names are accepted, Gi0/1 finds GigabitEthernet0/1
+        """
+        name = split_interface(name)
+        if name is None:
+            return None
+        typ, number = name
+        candidates = self.interfaces.get(number, [])
+        for cand_typ, node in candidates:
+            if cand_typ == typ:
+                return node
+        for cand_typ, node in candidates:
+            if cand_typ.startswith(typ):
+                return node
+        return None
+
+    def filter_(self, filter_):
+        """
+        Returns all configuration lines matching filter_ (regex)
+        """
+        return [node.text for node in self.root.find(filter_)]
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+'''
+emmgr daemon, keeps driver modules, definitions and logged in sessions warm
+
+Listens on a Unix socket, see remote.py for the client side. Requests and
+responses are JSON documents, one per line
+
+  {"op": "cli", "argv": ["run", "-H", "sw1", "-m", "ios", "-c", "show version"], "cwd": "/home/ops"}
+        Run an "emmgr em" CLI command. Output is sent as {"stdout": text}
+        and {"stderr": text}, the last response is {"exit": code}
+  {"op": "call", "element": {"hostname": "sw1", "model": "ios"}, "method": "run", "kwargs": {"cmd": "show version"}}
+        Call an element method, the response is {"result": ...} or
+        {"error": msg, "errno": errno}
+  {"op": "status"}
+        Returns {"result": {"pid": ..., "sessions": ..., "requests": ...}}
+
+Each request runs in its own thread. Elements are created with the
+process wide connection pool, and released to the pool when the request
+is done. DNS lookups of element hostnames are cached for dns_ttl seconds.
+'''
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import functools
+import threading
+import traceback
+import socketserver
+
+import emmgr.lib.log as log
+import emmgr.lib.util as util
+import emmgr.lib.cli as cli
+import emmgr.lib.metrics as metrics
+import emmgr.lib.remote as remote
+from emmgr.lib.element import Element
+from emmgr.lib.pool import get_pool
+from emmgr.lib.registry import get_registry
+
+# CLI arguments that are local paths, relative paths are from the client cwd
+path_args = ["file", "inventory", "output", "record", "replay", "state", "firmware_dir", "metrics", "trace", "trace_dir"]
+
+dns_ttl = 300
+
+_context = threading.local()    # Per request thread: stdout, stderr, elements
+_dns_cache = {}                 # hostname -> (address, expire time)
+_counters = {"requests": 0}
+_metrics_lock = threading.Lock()
+_metrics_users = 0              # Requests and daemon using metrics, enabled while > 0
+
+
+def resolve(hostname):
+    """
+    Returns IP address for hostname, cached
+    """
+    now = time.monotonic()
+    cached = _dns_cache.get(hostname)
+    if cached and cached[1] > now:
+        return cached[0]
+    try:
+        addr = socket.gethostbyname(hostname)
+    except socket.gaierror:
+        raise Element.ElementException("Cannot get IP address for %s" % hostname)
+    _dns_cache[hostname] = (addr, now + dns_ttl)
+    return addr
+
+
+def json_default(obj):
+    """
+    JSON serializer for element results
+    """
+    try:
+        return util.json_serial(obj)
+    except AttributeError:
+        pass
+    try:
+        return list(obj)
+    except TypeError:
+        return str(obj)
+
+
+class PooledElement(Element):
+    """
+    Element using the connection pool, released when the request is done
+    If a method raised an exception the session is closed instead, the
+    CLI commands print errors without failing
+    """
+
+    def __init__(self, **kwargs):
+        if kwargs.get("ipaddr_mgmt") is None and kwargs.get("hostname"):
+            kwargs["ipaddr_mgmt"] = resolve(kwargs["hostname"])
+        kwargs["pool"] = get_pool()
+        self._failed = False
+        super().__init__(**kwargs)
+        elements = getattr(_context, "elements", None)
+        if elements is not None:
+            elements.append(self)
+
+    def __getattr__(self, attr):
+        value = super().__getattr__(attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def wrapper(*args, **kwargs):
+            try:
+                return value(*args, **kwargs)
+            except BaseException:
+                self._failed = True
+                raise
+        return wrapper
+
+    def close(self, discard=False):
+        super().close(discard=discard or self._failed)
+
+
+class ClientStream:
+    """
+    Output from a request, buffered and sent to the client as {name: text}
+    """
+    buffer_size = 65536
+
+    def __init__(self, send, name):
+        self.send = send
+        self.name = name
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            data = "".join(self.buffer)
+            self.buffer = []
+            self.size = 0
+            self.send({self.name: data})
+
+
+class StreamProxy:
+    """
+    Replaces sys.stdout and sys.stderr
+    Output from a request thread goes to its client, other output to the original stream
+    """
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+
+    def _target(self):
+        return getattr(_context, self.name, None) or self.default
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.default, attr)
+
+
+def metrics_acquire():
+    """
+    Enable metrics, until released by all users
+    """
+    global _metrics_users
+    with _metrics_lock:
+        _metrics_users += 1
+        metrics.enable()
+
+
+def metrics_release():
+    global _metrics_users
+    with _metrics_lock:
+        _metrics_users -= 1
+        if _metrics_users == 0:
+            metrics.disable()
+
+
+cli_commands = {key[4:]: getattr(cli, key) for key in dir(cli) if key.startswith("CLI_")}
+
+
+def run_cli(argv, cwd):
+    """
+    Run an "emmgr em" CLI command, output goes to sys.stdout
+    Returns exit code
+    """
+    if not argv or argv[0] not in cli_commands:
+        print("Unknown command '%s'" % argv[0] if argv else "No command specified, choose one of:")
+        for cmd in cli_commands:
+            print("   ", cmd)
+        return 1
+    obj = cli_commands[argv[0]](mgr_cls=PooledElement, argv=argv[1:])
+    obj.keep_loglevel = True    # Requests run in parallel, --loglevel of the daemon is used
+    for attr in path_args:
+        value = getattr(obj.args, attr, None)
+        if isinstance(value, str) and value and not os.path.isabs(value):
+            setattr(obj.args, attr, os.path.join(cwd, value))
+    metrics_file = getattr(obj.args, "metrics", None)
+    if metrics_file:
+        # Written when the command is done, not at exit. Includes earlier requests
+        obj.args.metrics = None
+        metrics_acquire()
+    try:
+        obj.run()
+    finally:
+        if metrics_file:
+            metrics.registry.write(metrics_file)
+            metrics_release()
+    return 0
+
+
+def release_elements(discard=False):
+    """
+    Release the elements used by a request
+    If the request failed the sessions are closed, not returned to the pool
+    """
+    for element in getattr(_context, "elements", None) or []:
+        try:
+            element.close(discard=discard)
+        except Exception as err:
+            log.warning("daemon, error releasing %s: %s", element.hostname, err)
+    _context.elements = None
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one client connection, requests are run in order
+    """
+
+    def send(self, msg):
+        self.wfile.write(json.dumps(msg, default=json_default).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request["op"]
+            except (ValueError, KeyError, TypeError):
+                self.send({"error": "Invalid request"})
+                return
+            _counters["requests"] += 1
+            try:
+                if op == "cli":
+                    self.op_cli(request)
+                elif op == "call":
+                    self.op_call(request)
+                elif op == "status":
+                    self.send({"result": dict(pid=os.getpid(), sessions=len(get_pool()),
+                                              requests=_counters["requests"])})
+                else:
+                    self.send({"error": "Unknown op %s" % op})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def op_cli(self, request):
+        stdout = ClientStream(self.send, "stdout")
+        stderr = ClientStream(self.send, "stderr")
+        _context.stdout = stdout
+        _context.stderr = stderr
+        _context.elements = []
+        t = time.time()
+        exitcode = 1
+        try:
+            exitcode = run_cli(list(request.get("argv", [])), request.get("cwd") or "/")
+        except SystemExit as err:
+            exitcode = err.code
+            if exitcode is None:
+                exitcode = 0
+            elif not isinstance(exitcode, int):
+                stderr.write("%s\n" % exitcode)
+                exitcode = 1
+        except Exception:
+            stderr.write(traceback.format_exc())
+            exitcode = 1
+        finally:
+            release_elements(discard=exitcode != 0)
+            _context.stdout = None
+            _context.stderr = None
+        stdout.flush()
+        stderr.flush()
+        log.debug("daemon, cli %s, exit %s, %.3f seconds", request.get("argv"), exitcode, time.time() - t)
+        self.send({"exit": exitcode})
+
+    def op_call(self, request):
+        method = request.get("method") or ""
+        if method.startswith("_"):
+            self.send({"error": "Invalid method %s" % method, "errno": 1})
+            return
+        _context.elements = []
+        failed = True
+        try:
+            element = PooledElement(**request.get("element", {}))
+            result = getattr(element, method)(*request.get("args", []), **request.get("kwargs", {}))
+            response = {"result": result}
+            failed = False
+        except Element.ElementException as err:
+            response = {"error": str(err.msg), "errno": err.errno}
+        except Exception as err:
+            log.warning("daemon, %s failed: %s", method, traceback.format_exc())
+            response = {"error": "%s: %s" % (err.__class__.__name__, err), "errno": 1}
+        finally:
+            release_elements(discard=failed)
+        self.send(response)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def preload():
+    """
+    Load definitions and driver modules for all models
+    """
+    registry = get_registry()
+    for model in Element.get_models():
+        try:
+            registry.get(model)
+        except Exception as err:
+            log.warning("daemon, cannot load model %s: %s", model, err)
+
+
+def serve(path, mode=0o660, reap_interval=30, metrics_file=None, metrics_interval=60):
+    if os.path.exists(path):
+        try:
+            remote.Connection(path, timeout=1).close()
+            raise remote.RemoteException("Daemon already running on %s" % path)
+        except OSError:
+            os.unlink(path)     # Stale socket
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = Server(path, RequestHandler)
+    os.chmod(path, mode)
+
+    sys.stdout = StreamProxy("stdout", sys.stdout)
+    sys.stderr = StreamProxy("stderr", sys.stderr)
+
+    pool = get_pool()
+
+    def reap():
+        while True:
+            time.sleep(reap_interval)
+            pool.expire()
+
+    threading.Thread(target=reap, daemon=True).start()
+
+    def write_metrics():
+        while True:
+            time.sleep(metrics_interval)
+            try:
+                metrics.registry.write(metrics_file)
+            except OSError as err:
+                log.warning("daemon, cannot write metrics: %s", err)
+
+    if metrics_file:
+        metrics_acquire()
+        threading.Thread(target=write_metrics, daemon=True).start()
+
+    def terminate(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, terminate)
+    log.info("daemon, listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if metrics_file:
+            metrics.registry.write(metrics_file)
+            metrics_release()
+        if os.path.exists(path):
+            os.unlink(path)
+        log.info("daemon, stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="emmgr daemon, runs CLI commands with warm sessions")
+    parser.add_argument("--socket",
+                        default=remote.socket_path(),
+                        help="Unix socket path, default $EMMGR_SOCKET or %s" % remote.default_socket)
+    parser.add_argument("--mode",
+                        default="660",
+                        help="Socket permissions, octal")
+    parser.add_argument("--no_preload",
+                        action="store_false",
+                        dest="preload",
+                        default=True,
+                        help="Do not load all models at start")
+    parser.add_argument("--metrics",
+                        help="Measure all requests, write metrics to this file, Prometheus text format or JSON if the name ends with .json")
+    parser.add_argument("--metrics_interval",
+                        type=float,
+                        default=60,
+                        help="Seconds between writes of the metrics file")
+    parser.add_argument("--loglevel",
+                        choices=['info', 'warning', 'error', 'debug'],
+                        default='info')
+    args = parser.parse_args()
+    log.setLevel(args.loglevel)
+    if args.preload:
+        preload()
+    try:
+        serve(args.socket, mode=int(args.mode, 8), metrics_file=args.metrics, metrics_interval=args.metrics_interval)
+    except (remote.RemoteException, OSError) as err:
+        util.die("Error: %s" % err)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,16 @@ Each element uses a driver, which does most of the work.
 
 import os
 import yaml
+import types
 import socket
 
 from emmgr.lib.basedriver import BaseDriver
+from emmgr.lib.registry import get_registry
 import emmgr.lib.config as config
 import emmgr.lib.log as log
 import emmgr.lib.util as util
 import emmgr.lib.comm as comm
+import emmgr.lib.metrics as metrics
 
 
 class ElementException(Exception):
@@ -29,6 +32,17 @@ class Element:
     """
     ElementException = BaseDriver.ElementException
 
+    # Driver methods that are helpers, not element operations. They are
+    # not measured or traced
+    helper_methods = frozenset((
+        "load_definitions", "flatten_definitions", "get_flat_definitions",
+        "get_definition", "get_template", "render_definition", "filter_", "str_to_lines",
+        "get_models", "pool_key", "connect_pooled", "release",
+        "transaction", "transaction_add", "transaction_save", "when_applied", "pipeline_kwargs",
+        "invalidate_running_config", "interface_list",
+        "flash_dir_add", "flash_dir_remove", "invalidate_flash_dir",
+    ))
+
     @classmethod
     def get_models(cls):
         res = []
@@ -61,21 +75,45 @@ class Element:
             if key not in kwargs:
                 kwargs[key] = attr
 
-        definitions = BaseDriver.load_definitions(model)
-
-        # load the element driver for the element model
-        driver_file = config.driver_dir + "/%s.py" % definitions[-1].driver
-        if not os.path.exists(driver_file):
-            raise self.ElementException("Missing element driver %s" % driver_file)
-        self._drivermodule = util.import_file(driver_file)
+        # load definitions and the element driver for the element model, cached
+        definitions, self._drivermodule = get_registry().get(model)
 
         # Create instance of driver
         kwargs['definitions'] = definitions
         self._driver = self._drivermodule.Driver(**kwargs)
+        self._metrics_tags = dict(hostname=hostname or ipaddr_mgmt, model=model)
+        if metrics.enabled:
+            # Drivers call connect() themselves, measure it as login
+            self._driver.connect = metrics.instrument(self._driver.connect, "login")
     
     def __getattr__(self, attr):
         """Bridge to the driver specific code"""
-        return getattr(self._driver, attr)
+        value = getattr(self._driver, attr)
+        if isinstance(value, types.MethodType) and not attr.startswith("_") and attr not in self.helper_methods:
+            if metrics.enabled:
+                value = metrics.instrument(value, "method", command=attr, **self._metrics_tags)
+            if self._driver._trace:
+                value = log.traced(value, self._driver._trace)
+        return value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, tb):
+        self.close(discard=typ is not None)
+
+    def close(self, discard=False):
+        """
+        Done with the element. If a connection pool is used the session
+        is kept for reuse, otherwise the connection is closed
+        Use discard if an operation failed, the session is then closed
+        """
+        try:
+            self._driver.release(discard=discard)
+        finally:
+            if self._driver._trace:
+                # Pooled sessions can outlive the element, recording stops here
+                self._driver._trace.close()
 
 
 def main():
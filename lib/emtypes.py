@@ -4,12 +4,13 @@ Common types
 '''
 
 import sys
+import re
 import os.path
 import datetime
 import json
 import yaml
-import pprint
 import argparse
+import array
 import importlib.machinery
 from orderedattrdict import AttrDict
 
@@ -18,26 +19,101 @@ class TypesException(Exception):
     pass
 
 
+# Characters removed from MAC addresses before parsing
+_mac_strip = str.maketrans("", "", ":-. ")
+
+
 class MAC_Address:
     """
-    Represents one MAC address
+    Represents one MAC address, stored as an integer
     """
+    __slots__ = ("_mac",)
+
     def __init__(self, mac):
-        self._mac = self.normalize_mac(mac)
-        if self._mac is None:
-            raise ValueError(1, 'Incorrect MAC address %s' % mac)
+        if isinstance(mac, MAC_Address):
+            self._mac = mac._mac
+        elif isinstance(mac, int):
+            if mac < 0 or mac > 0xffffffffffff:
+                raise ValueError(1, 'Incorrect MAC address %x' % mac)
+            self._mac = mac
+        else:
+            self._mac = self.parse(mac)
+            if self._mac is None:
+                raise ValueError(1, 'Incorrect MAC address %s' % mac)
+
+    @staticmethod
+    def parse(mac):
+        """
+        Parse mac address in any of the formats below, returns an int
+        Returns None if incorrect
+
+        # "11:22:33:aa:bb:cc"
+        # "11.22.33.aa.bb.cc"
+        # "11-22-33-aa-bb-cc"
+        # "1122-33aa-bbcc"
+        # "1122.33aa.bbcc"
+        # "112233aabbcc"
+        """
+        mac = mac.translate(_mac_strip)
+        if len(mac) != 12:
+            return None
+        try:
+            return int(mac, 16)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def parse_many(macs):
+        """
+        Parse a list of mac address strings, returns an array of ints
+        Incorrect addresses raises ValueError
+        """
+        tmp = "\n".join(macs).translate(_mac_strip).split("\n")
+        res = array.array("Q")
+        for mac in tmp:
+            if len(mac) != 12:
+                raise ValueError(1, 'Incorrect MAC address %s' % mac)
+            res.append(int(mac, 16))
+        return res
+
+    @staticmethod
+    def format(mac):
+        """
+        Returns an int mac address in default format, 0102.0304.0506
+        """
+        tmp = "%012x" % mac
+        return "%s.%s.%s" % (tmp[0:4], tmp[4:8], tmp[8:])
 
     def __str__(self):
         """
         Returns default format, 0102.0304.0506
         """
+        return self.format(self._mac)
+
+    def __repr__(self):
+        return "MAC_Address(%s)" % self.format(self._mac)
+
+    def __int__(self):
         return self._mac
 
+    def __hash__(self):
+        return hash(self._mac)
+
+    def __eq__(self, other):
+        if isinstance(other, MAC_Address):
+            return self._mac == other._mac
+        if isinstance(other, str):
+            return self._mac == self.parse(other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        return self._mac < int(other)
+
     def str_colon(self):
         """
         Returns format with colon delemiter: 01:02:03:04:05:06
         """
-        m = self._mac
+        m = "%012x" % self._mac
         return "%s:%s:%s:%s:%s:%s" % (m[0:2], m[2:4], m[4:6], m[6:8], m[8:10], m[10:])
 
     def normalize_mac(self, mac):
@@ -45,34 +121,179 @@ class MAC_Address:
         Check if mac address is ok, and normalize it
         Normalized format: 1122.33aa.bbcc
         Returns None if incorrect
-
-        # Validates that mac-format is in one of following formats:
-        # "11:22:33:aa:bb:cc"
-        # "11:22:33:AA:BB:CC"
-        # "11.22.33.aa.bb.cc"
-        # "11.22.33.AA.BB.CC"
-        # "11-22-33-aa-bb-cc"
-        # "11-22-33-AA-BB-CC"
-        # "1122.33aa.bbcc"
-        # "1122.33AA.BBCC"
-        # "112233aabbcc"
-        # "112233AABBCC"
         """
-        mac = mac.lower().translate({ ord(c): None for c in ":-. "})
-        if len(mac) != 12:
+        mac = self.parse(mac)
+        if mac is None:
             return None
-        try:
-            int(mac, 16)
-        except ValueError:
-            return None
-
-        return "%s.%s.%s" % ( mac[0:4], mac[4:8], mac[8:])
+        return self.format(mac)
 
     def add(self, offset):
-        mac = re.sub("[^0-9a-fA-F]", "", macAddress)   # strip everything except hex char
-        mac = int(mac, 16)  # to integer
-        mac += offset
-        macAddress = network.format_mac("%012x" % mac)  # to string again
+        """
+        Returns a new MAC_Address, offset added
+        """
+        return MAC_Address((self._mac + offset) & 0xffffffffffff)
+
+
+class MACTable:
+    """
+    MAC address table, stored in columns
+
+    Each entry is a mac address (int), a VLAN ID and an index in the
+    list of interface names, stored in arrays so large tables does not
+    need one object per entry.
+    """
+
+    def __init__(self):
+        self.macs = array.array("Q")
+        self.vlans = array.array("H")
+        self.ifindexes = array.array("H")
+        self.interfaces = []        # interface names, ifindex is index in this list
+        self._ifindex = {}          # interface name -> ifindex
+
+    def __len__(self):
+        return len(self.macs)
+
+    def get_ifindex(self, interface):
+        """
+        Returns ifindex for interface name, added if needed
+        """
+        ifindex = self._ifindex.get(interface)
+        if ifindex is None:
+            ifindex = self._ifindex[interface] = len(self.interfaces)
+            self.interfaces.append(interface)
+        return ifindex
+
+    def add(self, mac, vlan, interface):
+        """
+        Add one entry, mac can be a string, int or MAC_Address
+        """
+        if not isinstance(mac, int):
+            mac = int(MAC_Address(mac))
+        self.macs.append(mac)
+        self.vlans.append(vlan)
+        self.ifindexes.append(self.get_ifindex(interface))
+
+    def parse_lines(self, lines, regex):
+        """
+        Add entries from command output
+        regex is a compiled regex with groups mac, vlan and interface,
+        lines not matching are ignored. VLANs that are not numbers
+        (for example "All") are stored as 0
+        Returns number of added entries
+        """
+        count = 0
+        macs = self.macs
+        vlans = self.vlans
+        ifindexes = self.ifindexes
+        for line in lines:
+            match = regex.search(line)
+            if match is None:
+                continue
+            mac, vlan, interface = match.group("mac", "vlan", "interface")
+            mac = mac.translate(_mac_strip)
+            macs.append(int(mac, 16))
+            vlans.append(int(vlan) if vlan.isdigit() else 0)
+            ifindex = self._ifindex.get(interface)
+            if ifindex is None:
+                ifindex = self.get_ifindex(interface)
+            ifindexes.append(ifindex)
+            count += 1
+        return count
+
+    def __iter__(self):
+        """
+        Yields (mac, vlan, interface name), mac as int
+        """
+        interfaces = self.interfaces
+        for mac, vlan, ifindex in zip(self.macs, self.vlans, self.ifindexes):
+            yield mac, vlan, interfaces[ifindex]
+
+    def find(self, mac):
+        """
+        Returns list of (vlan, interface name) where mac is seen
+        """
+        mac = int(MAC_Address(mac))
+        res = []
+        start = 0
+        while True:
+            try:
+                ix = self.macs.index(mac, start)
+            except ValueError:
+                return res
+            res.append((self.vlans[ix], self.interfaces[self.ifindexes[ix]]))
+            start = ix + 1
+
+    def count_by_interface(self):
+        """
+        Returns dict, interface name -> number of mac addresses
+        """
+        counts = [0] * len(self.interfaces)
+        for ifindex in self.ifindexes:
+            counts[ifindex] += 1
+        return dict(zip(self.interfaces, counts))
+
+    def to_dict(self):
+        """
+        Returns the table as a dict of lists, suitable for JSON
+        """
+        return dict(macs=[MAC_Address.format(mac) for mac in self.macs],
+                    vlans=self.vlans.tolist(),
+                    ifindexes=self.ifindexes.tolist(),
+                    interfaces=list(self.interfaces))
+
+
+class FlashDir:
+    """
+    Files in element flash, with sizes and free space
+    Sizes and free space are None if not known
+    """
+
+    def __init__(self, device=None, total=None, free=None):
+        self.device = device
+        self.files = {}         # filename -> size
+        self.total = total
+        self.free = free
+
+    def __contains__(self, filename):
+        return filename in self.files
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __repr__(self):
+        return "FlashDir(%s, %d files, free %s)" % (self.device, len(self.files), self.free)
+
+    def add(self, filename, size=None):
+        """
+        Add or replace a file, free space is adjusted if sizes are known
+        """
+        old_size = self.files.get(filename)
+        self.files[filename] = size
+        if self.free is not None:
+            if old_size is not None:
+                self.free += old_size
+            if size is not None:
+                self.free -= size
+
+    def remove(self, filename):
+        size = self.files.pop(filename, None)
+        if self.free is not None and size is not None:
+            self.free += size
+
+    def size(self, filename):
+        return self.files.get(filename)
+
+    def list(self, filter_=None):
+        """
+        Returns list of filenames, optionally filtered with a regex
+        """
+        if not filter_:
+            return list(self.files)
+        p = re.compile(filter_)
+        return [f for f in self.files if p.search(f)]
 
 
 class Peers:
@@ -160,63 +381,257 @@ class VLAN:
 
 class VLANS:
     '''
-    Manage a bunch of VLANs, as a dictionary
+    A set of VLAN IDs, stored as bitmaps
+
+    Membership is one bitmap, untagged VLANs are a second bitmap. Range
+    strings like "1,5-10,200" (Cisco, iBOS) and "1 5 to 10 200" (Huawei)
+    are parsed and formatted without creating an object per VLAN.
     '''
+    max_id = 4095
+
     def __init__(self, vlans=None, delemiter=",", range_delemiter="-"):
-        super().__init__()
         self._delemiter = delemiter
         self._range_delemiter = range_delemiter
-        self._vlans = AttrDict()
-        if vlans:
+        self.members = 0        # bit n set if VLAN n is a member
+        self.untagged = 0       # bit n set if VLAN n is untagged
+        if vlans is not None:
             self.__iadd__(vlans)
 
+    @staticmethod
+    def range_mask(first, last):
+        """
+        Returns bitmap with VLANs first..last set
+        """
+        if first > last:
+            first, last = last, first
+        if first < 0 or last > VLANS.max_id:
+            raise ValueError("VLAN range %d-%d out of range" % (first, last))
+        return ((1 << (last - first + 1)) - 1) << first
+
+    @classmethod
+    def parse_mask(cls, s):
+        """
+        Parse a range string, returns a bitmap
+        Handles "1,5-10", "1 5 to 10", "none" and "all"
+        For "add 5" and "remove 5" use add_range()
+        """
+        mask = 0
+        s = s.strip()
+        if s == "none":
+            return 0
+        if s == "all":
+            return cls.range_mask(1, 4094)
+        tokens = s.replace(",", " ").replace(" to ", "-").split()
+        for token in tokens:
+            if "-" in token:
+                first, last = token.split("-", 1)
+                mask |= cls.range_mask(int(first), int(last))
+            else:
+                mask |= 1 << cls._check_id(int(token))
+        return mask
+
+    @classmethod
+    def parse(cls, s, untagged=None, **kwargs):
+        """
+        Create a VLANS from a range string, optional untagged range string
+        """
+        vlans = cls(**kwargs)
+        vlans.members = cls.parse_mask(s)
+        if untagged:
+            vlans.untagged = cls.parse_mask(untagged)
+            vlans.members |= vlans.untagged
+        return vlans
+
+    @classmethod
+    def _check_id(cls, vid):
+        if vid < 0 or vid > cls.max_id:
+            raise ValueError("VLAN %d out of range" % vid)
+        return vid
+
+    @staticmethod
+    def _iter_bits(mask):
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    @staticmethod
+    def _iter_ranges(mask):
+        """
+        Yields (first, last) for each range of set bits
+        """
+        while mask:
+            first = (mask & -mask).bit_length() - 1
+            tmp = mask >> first
+            length = ((tmp + 1) & ~tmp).bit_length() - 1
+            yield first, first + length - 1
+            mask &= ~(((1 << length) - 1) << first)
+
+    def _new(self, members, untagged):
+        tmp = VLANS(delemiter=self._delemiter, range_delemiter=self._range_delemiter)
+        tmp.members = members
+        tmp.untagged = untagged & members
+        return tmp
+
+    def copy(self):
+        return self._new(self.members, self.untagged)
+
+    def add(self, vid, tagged=True):
+        """
+        Add one VLAN
+        """
+        bit = 1 << self._check_id(vid)
+        self.members |= bit
+        if tagged:
+            self.untagged &= ~bit
+        else:
+            self.untagged |= bit
+
+    def add_range(self, s, tagged=True):
+        """
+        Add VLANs in a range string
+        The string can start with an operation, as in "switchport trunk
+        allowed vlan" lines: "add 5", "remove 5" and "except 5"
+        """
+        op, _, rest = s.strip().partition(" ")
+        if op == "remove":
+            mask = self.parse_mask(rest)
+            self.members &= ~mask
+            self.untagged &= ~mask
+            return
+        if op == "except":
+            mask = self.range_mask(1, 4094) & ~self.parse_mask(rest)
+            self.members = 0
+            self.untagged &= mask
+        elif op == "add":
+            mask = self.parse_mask(rest)
+        else:
+            mask = self.parse_mask(s)
+        self.members |= mask
+        if tagged:
+            self.untagged &= ~mask
+        else:
+            self.untagged |= mask
+
+    def remove(self, vid):
+        bit = 1 << self._check_id(vid)
+        self.members &= ~bit
+        self.untagged &= ~bit
+
+    def is_tagged(self, vid):
+        """
+        Returns True if vid is a tagged member
+        """
+        bit = 1 << vid
+        return bool(self.members & bit) and not (self.untagged & bit)
+
+    def get_untagged(self):
+        """
+        Returns the untagged VLANs, as a VLANS
+        """
+        return self._new(self.untagged, self.untagged)
+
+    def __contains__(self, vid):
+        if isinstance(vid, VLAN):
+            vid = vid.id
+        return 0 <= vid <= self.max_id and bool(self.members >> vid & 1)
+
+    def __len__(self):
+        return bin(self.members).count("1")
+
+    def __bool__(self):
+        return self.members != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, VLANS):
+            return NotImplemented
+        return self.members == other.members and self.untagged == other.untagged
+
+    def __or__(self, other):
+        return self._new(self.members | other.members, self.untagged | other.untagged)
+
+    def __and__(self, other):
+        return self._new(self.members & other.members, self.untagged & other.untagged)
+
+    def __sub__(self, other):
+        return self._new(self.members & ~other.members, self.untagged)
+
+    def __xor__(self, other):
+        return self._new(self.members ^ other.members, self.untagged | other.untagged)
+
     def __add__(self, other):
         """
         Add two VLANS to each other
         """
         if not isinstance(other, VLANS):
             raise TypeError("Error: Can only handle object of VLANS()")
-        tmp = self.copy()
-        for vlan in other._vlans.values():
-            tmp._vlans[vlan.id] = vlan
-        return tmp
+        return self | other
 
     def __iadd__(self, other):
         if isinstance(other, VLANS):
-            for vlan in other._vlans.values():
-                self._vlans[vlan.id] = vlan
+            self.members |= other.members
+            self.untagged = (self.untagged & ~other.members) | other.untagged
         elif isinstance(other, VLAN):
-            self._vlans[other.id] = other
+            self.add(other.id, tagged=other.tagged)
+        elif isinstance(other, str):
+            self.add_range(other)
+        elif isinstance(other, int):
+            self.add(other)
         else:
-            raise TypeError("Error: Can only handle object of VLANS() or VLAN() got %s" % type(other))
+            try:
+                for vid in other:
+                    self.add(vid)
+            except TypeError:
+                raise TypeError("Error: Can only handle object of VLANS(), VLAN(), str or int, got %s" % type(other))
         return self
 
+    def to_str(self, mask=None, delemiter=None, range_delemiter=None):
+        """
+        Returns VLANs as a range string, for example 1,5-10,200
+        """
+        if mask is None:
+            mask = self.members
+        if delemiter is None:
+            delemiter = self._delemiter
+        if range_delemiter is None:
+            range_delemiter = self._range_delemiter
+        res = []
+        for first, last in self._iter_ranges(mask):
+            if first == last:
+                res.append(str(first))
+            elif last == first + 1:
+                res.append("%d%s%d" % (first, delemiter, last))
+            else:
+                res.append("%d%s%d" % (first, range_delemiter, last))
+        return delemiter.join(res)
+
     def __str__(self):
-        return dict_to_vlan_str(self._vlans,
-                                delemiter=self._delemiter,
-                                range_delemiter=self._range_delemiter)
+        return self.to_str()
 
     def __repr__(self):
-        s = ""
-        for vlan in self._vlans.values():
-            s += "(%s)" % vlan.to_str()
-        return "VLANS(%s)" % s
+        if self.untagged:
+            return "VLANS(%s, untagged %s)" % (self.to_str(), self.to_str(self.untagged))
+        return "VLANS(%s)" % self.to_str()
 
     def __iter__(self):
-        return iter(self.__dict__)
+        return self._iter_bits(self.members)
 
     def items(self):
-        for item in self._vlans.items():
-            yield item
+        """
+        Yields (vlan id, tagged)
+        """
+        for vid in self._iter_bits(self.members):
+            yield vid, not (self.untagged >> vid & 1)
 
     def keys(self):
-        for item in self._vlans.keys():
-            yield item
-            
-    def values(self):
-        for item in self._vlans.values():
-            yield item
+        return self._iter_bits(self.members)
 
+    def values(self):
+        """
+        Yields a VLAN object for each VLAN
+        """
+        for vid, tagged in self.items():
+            yield VLAN(id=vid, tagged=tagged)
 
 
 def main():
@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+'''
+Firmware server, TFTP and HTTP
+
+Serves the files in a firmware directory, so elements can fetch firmware
+from the host running emmgr. Made for many parallel transfers of large
+files:
+
+  TFTP  RFC 1350 read requests, with the options blksize (RFC 2348),
+        tsize (RFC 2349), timeout and windowsize (RFC 7440). Files are
+        mmap'ed and blocks are sent from the mapping without copying
+  HTTP  GET and HEAD, with Range. The body is sent with sendfile
+
+Bandwidth can be limited for all transfers together, and per client.
+Progress of each transfer is reported to callbacks, registered for one
+client address or for all clients, see FirmwareServer.watch().
+'''
+
+import os
+import sys
+import mmap
+import time
+import struct
+import socket
+import asyncio
+import argparse
+import email.utils
+import urllib.parse
+
+import emmgr.lib.config as config
+import emmgr.lib.log as log
+
+# TFTP opcodes
+RRQ, WRQ, DATA, ACK, ERROR, OACK = 1, 2, 3, 4, 5, 6
+
+# TFTP error codes
+ERR_NOT_DEFINED = 0
+ERR_NOT_FOUND = 1
+ERR_ACCESS = 2
+ERR_ILLEGAL = 4
+ERR_UNKNOWN_TID = 5
+
+tftp_header = struct.Struct("!HH")
+max_blksize = 65464
+max_windowsize = 64
+
+
+class FirmwareServerException(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Bandwidth limit, rate is bytes/second
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(rate // 10, 65536)
+        self.tokens = self.burst
+        self.timestamp = time.monotonic()
+
+    def delay(self, size):
+        """
+        Take size bytes, returns number of seconds to wait before sending them
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+        self.tokens -= size
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class Transfer:
+    """
+    One file transfer to a client
+    """
+
+    def __init__(self, protocol, client, filename, size):
+        self.protocol = protocol
+        self.client = client        # IP address
+        self.filename = filename
+        self.size = size
+        self.sent = 0
+        self.status = "running"     # running, done or error
+        self.error = None
+        self.started = time.time()
+        self._reported = 0
+
+    def __repr__(self):
+        return "Transfer(%s %s %s, %d of %d bytes, %s)" % (
+            self.protocol, self.client, self.filename, self.sent, self.size, self.status)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def rate(self):
+        """
+        Average bytes/second
+        """
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0
+
+    def to_dict(self):
+        return dict(protocol=self.protocol, client=self.client, filename=self.filename,
+                    size=self.size, sent=self.sent, status=self.status, error=self.error,
+                    elapsed=round(self.elapsed, 3))
+
+
+class FirmwareServer:
+    """
+    TFTP and HTTP server for the files in directory
+    A port set to None or 0 disables the protocol
+    """
+
+    def __init__(self, directory=None, host="0.0.0.0", address=None,
+                 tftp_port=69, http_port=8080,
+                 bandwidth=None, client_bandwidth=None, max_transfers=None,
+                 tftp_timeout=1, tftp_retries=5, progress_interval=1.0):
+        if directory is None:
+            directory = getattr(config, "fwserver", {}).get("directory")
+        if not directory or not os.path.isdir(directory):
+            raise FirmwareServerException("Firmware directory %s does not exist" % directory)
+        self.directory = os.path.realpath(directory)
+        self.host = host
+        self.address = address          # Address elements use to reach the server, for url()
+        self.tftp_port = tftp_port
+        self.http_port = http_port
+        self.bandwidth = bandwidth      # bytes/second, all transfers
+        self.client_bandwidth = client_bandwidth    # bytes/second, each client
+        self.max_transfers = max_transfers
+        self.tftp_timeout = tftp_timeout
+        self.tftp_retries = tftp_retries
+        self.progress_interval = progress_interval
+
+        self.transfers = set()          # Running transfers
+        self._watchers = {}             # client address, None for all -> list of callbacks
+        self._bucket = TokenBucket(bandwidth) if bandwidth else None
+        self._client_buckets = {}       # client address -> TokenBucket
+        self._tftp_sock = None
+        self._tftp_task = None
+        self._http_server = None
+        self._tasks = set()
+
+    # ----- common -----
+
+    def path(self, filename):
+        """
+        Returns the full path for filename, None if outside the directory
+        """
+        filename = filename.replace("\\", "/").lstrip("/")
+        path = os.path.realpath(os.path.join(self.directory, filename))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            return None
+        return path
+
+    def url(self, protocol="tftp"):
+        """
+        Returns URL prefix for sw_copy_to(mgr=...)
+        """
+        address = self.address
+        if address is None:
+            address = self.host if self.host not in ("", "0.0.0.0") else socket.gethostbyname(socket.gethostname())
+        if protocol == "http":
+            return "http://%s:%d" % (address, self.http_port)
+        if self.tftp_port == 69:
+            return "tftp://%s" % address
+        return "tftp://%s:%d" % (address, self.tftp_port)
+
+    def watch(self, client, callback):
+        """
+        Call callback(transfer) with progress of transfers to client
+        client is an IP address, None for all clients
+        """
+        self._watchers.setdefault(client, []).append(callback)
+
+    def unwatch(self, client, callback):
+        callbacks = self._watchers.get(client, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._watchers.pop(client, None)
+
+    def _report(self, transfer, force=False):
+        now = time.monotonic()
+        if not force and now - transfer._reported < self.progress_interval:
+            return
+        transfer._reported = now
+        for client in (transfer.client, None):
+            for callback in list(self._watchers.get(client, [])):
+                try:
+                    callback(transfer)
+                except Exception as err:
+                    log.warning("fwserver, progress callback failed: %s", err)
+
+    def _start_transfer(self, protocol, client, filename, size):
+        if self.max_transfers and len(self.transfers) >= self.max_transfers:
+            return None
+        transfer = Transfer(protocol, client, filename, size)
+        self.transfers.add(transfer)
+        log.info("fwserver, %s %s started, %s, %d bytes", protocol, client, filename, size)
+        self._report(transfer, force=True)
+        return transfer
+
+    def _end_transfer(self, transfer, error=None):
+        self.transfers.discard(transfer)
+        if error:
+            transfer.status = "error"
+            transfer.error = error
+            log.warning("fwserver, %s %s %s failed: %s", transfer.protocol, transfer.client, transfer.filename, error)
+        else:
+            transfer.status = "done"
+            log.info("fwserver, %s %s %s done, %d bytes in %.1f seconds" % (
+                transfer.protocol, transfer.client, transfer.filename, transfer.sent, transfer.elapsed))
+        self._report(transfer, force=True)
+        if not any(t.client == transfer.client for t in self.transfers):
+            self._client_buckets.pop(transfer.client, None)
+
+    async def throttle(self, client, size):
+        """
+        Wait until size bytes can be sent to client, within the bandwidth limits
+        """
+        delay = 0
+        if self._bucket:
+            delay = self._bucket.delay(size)
+        if self.client_bandwidth:
+            bucket = self._client_buckets.get(client)
+            if bucket is None:
+                bucket = self._client_buckets[client] = TokenBucket(self.client_bandwidth)
+            delay = max(delay, bucket.delay(size))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self):
+        """
+        Start listening
+        """
+        if self.tftp_port:
+            self._tftp_sock = self._udp_socket(self.tftp_port)
+            self._tftp_task = self._spawn(self._tftp_listen())
+        if self.http_port:
+            self._http_server = await asyncio.start_server(self._http_handle, self.host, self.http_port)
+        log.info("fwserver, serving %s, tftp port %s, http port %s", self.directory, self.tftp_port, self.http_port)
+
+    async def stop(self):
+        if self._http_server:
+            self._http_server.close()
+            await self._http_server.wait_closed()
+            self._http_server = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tftp_sock:
+            self._tftp_sock.close()
+            self._tftp_sock = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, typ, value, tb):
+        await self.stop()
+
+    # ----- TFTP -----
+
+    def _udp_socket(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        sock.setblocking(False)
+        sock.bind((self.host, port))
+        return sock
+
+    async def _recvfrom(self, sock, timeout=None):
+        """
+        Receive one datagram, raises asyncio.TimeoutError
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def readable():
+            if future.done():
+                return
+            try:
+                res = sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as err:
+                future.set_exception(err)
+                return
+            # Only one datagram, the rest stays in the socket until next call
+            loop.remove_reader(sock.fileno())
+            future.set_result(res)
+
+        loop.add_reader(sock.fileno(), readable)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            loop.remove_reader(sock.fileno())
+
+    async def _sendto(self, sock, buffers, addr):
+        """
+        Send a datagram, from a list of buffers (scatter/gather, no copy)
+        """
+        while True:
+            try:
+                return sock.sendmsg(buffers, [], 0, addr)
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)
+
+    def _tftp_error(self, sock, addr, code, msg):
+        try:
+            sock.sendto(tftp_header.pack(ERROR, code) + msg.encode() + b"\0", addr)
+        except OSError:
+            pass
+
+    async def _tftp_listen(self):
+        while True:
+            data, addr = await self._recvfrom(self._tftp_sock)
+            try:
+                opcode = tftp_header.unpack_from(data)[0]
+                if opcode == WRQ:
+                    self._tftp_error(self._tftp_sock, addr, ERR_ACCESS, "Write not supported")
+                    continue
+                if opcode != RRQ:
+                    self._tftp_error(self._tftp_sock, addr, ERR_ILLEGAL, "Illegal operation")
+                    continue
+                fields = data[2:].split(b"\0")
+                filename = fields[0].decode("utf-8", "replace")
+                options = {}
+                for ix in range(2, len(fields) - 1, 2):
+                    options[fields[ix].decode("ascii", "replace").lower()] = fields[ix + 1].decode("ascii", "replace")
+            except (struct.error, IndexError):
+                self._tftp_error(self._tftp_sock, addr, ERR_ILLEGAL, "Malformed request")
+                continue
+            self._spawn(self._tftp_send(addr, filename, options))
+
+    def _tftp_options(self, options, size):
+        """
+        Returns accepted options, (blksize, windowsize, timeout, dict of options to acknowledge)
+        """
+        blksize, windowsize, timeout = 512, 1, self.tftp_timeout
+        oack = {}
+        try:
+            if "blksize" in options:
+                blksize = min(max(int(options["blksize"]), 8), max_blksize)
+                oack["blksize"] = blksize
+            if "windowsize" in options:
+                windowsize = min(max(int(options["windowsize"]), 1), max_windowsize)
+                oack["windowsize"] = windowsize
+            if "timeout" in options:
+                timeout = min(max(int(options["timeout"]), 1), 255)
+                oack["timeout"] = timeout
+            if "tsize" in options:
+                oack["tsize"] = size
+        except ValueError:
+            pass
+        return blksize, windowsize, timeout, oack
+
+    async def _tftp_wait_ack(self, sock, addr, timeout):
+        """
+        Returns next acknowledged block number from addr, raises asyncio.TimeoutError
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            data, raddr = await self._recvfrom(sock, max(deadline - time.monotonic(), 0))
+            if raddr != addr:
+                self._tftp_error(sock, raddr, ERR_UNKNOWN_TID, "Unknown transfer ID")
+                continue
+            if len(data) < 4:
+                continue
+            opcode, block = tftp_header.unpack_from(data)
+            if opcode == ERROR:
+                raise FirmwareServerException("Client error: %s" % data[4:].rstrip(b"\0").decode("ascii", "replace"))
+            if opcode == ACK:
+                return block
+
+    async def _tftp_send(self, addr, filename, options):
+        client = addr[0]
+        sock = self._udp_socket(0)
+        transfer = None
+        try:
+            path = self.path(filename)
+            if path is None or not os.path.isfile(path):
+                self._tftp_error(sock, addr, ERR_NOT_FOUND, "File not found")
+                return
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                transfer = self._start_transfer("tftp", client, filename, size)
+                if transfer is None:
+                    self._tftp_error(sock, addr, ERR_NOT_DEFINED, "Server busy")
+                    return
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+                try:
+                    with memoryview(data) as view:
+                        await self._tftp_send_data(sock, addr, transfer, view, options)
+                finally:
+                    if size:
+                        data.close()
+            self._end_transfer(transfer)
+        except (FirmwareServerException, asyncio.TimeoutError, OSError) as err:
+            if transfer:
+                if isinstance(err, asyncio.TimeoutError):
+                    err = "Timeout"
+                self._end_transfer(transfer, error=str(err))
+            else:
+                log.warning("fwserver, tftp %s %s failed: %s", client, filename, err)
+        finally:
+            sock.close()
+
+    async def _tftp_send_data(self, sock, addr, transfer, view, options):
+        size = transfer.size
+        blksize, windowsize, timeout, oack = self._tftp_options(options, size)
+
+        if oack:
+            packet = tftp_header.pack(OACK, 0)[:2] + b"".join(
+                b"%s\0%d\0" % (key.encode(), val) for key, val in oack.items())
+            for retry in range(self.tftp_retries + 1):
+                await self._sendto(sock, [packet], addr)
+                try:
+                    if await self._tftp_wait_ack(sock, addr, timeout) == 0:
+                        break
+                except asyncio.TimeoutError:
+                    continue
+            else:
+                raise FirmwareServerException("No acknowledge of options")
+
+        # Block numbers are counted from 1 and wraps at 65536 in packets
+        # The last block is shorter than blksize, possibly empty
+        last = size // blksize + 1
+        block = 1
+        retries = 0
+        while block <= last:
+            window_end = min(block + windowsize - 1, last)
+            for n in range(block, window_end + 1):
+                offset = (n - 1) * blksize
+                with view[offset:offset + blksize] as chunk:
+                    await self.throttle(transfer.client, len(chunk) + 4)
+                    await self._sendto(sock, [tftp_header.pack(DATA, n & 0xffff), chunk], addr)
+            try:
+                while True:
+                    ack = await self._tftp_wait_ack(sock, addr, timeout)
+                    # Find the acknowledged block in the window
+                    acked = None
+                    for n in range(window_end, block - 2, -1):
+                        if n & 0xffff == ack:
+                            acked = n
+                            break
+                    if acked is not None:
+                        break
+            except asyncio.TimeoutError:
+                retries += 1
+                if retries > self.tftp_retries:
+                    raise
+                continue
+            retries = 0
+            block = acked + 1
+            transfer.sent = min(acked * blksize, size)
+            self._report(transfer)
+
+    # ----- HTTP -----
+
+    async def _http_response(self, writer, status, reason, headers=None, body=b""):
+        lines = ["HTTP/1.1 %d %s" % (status, reason),
+                 "Server: emmgr",
+                 "Date: %s" % email.utils.formatdate(usegmt=True),
+                 "Connection: close"]
+        if headers is None:
+            headers = {"Content-Length": len(body), "Content-Type": "text/plain"}
+        for key, val in headers.items():
+            lines.append("%s: %s" % (key, val))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    def _http_range(self, value, size):
+        """
+        Parse a Range header, returns (start, end) with end exclusive, None if not satisfiable
+        """
+        if not value.startswith("bytes=") or "," in value:
+            return None
+        start, _, end = value[6:].strip().partition("-")
+        try:
+            if start == "":
+                length = int(end)
+                if length <= 0:
+                    return None
+                return max(size - length, 0), size
+            start = int(start)
+            end = int(end) + 1 if end else size
+        except ValueError:
+            return None
+        if start >= size or end <= start:
+            return None
+        return start, min(end, size)
+
+    async def _http_handle(self, reader, writer):
+        client = writer.get_extra_info("peername")[0]
+        try:
+            request = await asyncio.wait_for(reader.readline(), 30)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 30)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, val = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = val.strip()
+            parts = request.decode("latin-1").split()
+            if len(parts) != 3:
+                await self._http_response(writer, 400, "Bad Request", body=b"Bad request\n")
+                return
+            method, target, version = parts
+            if method not in ("GET", "HEAD"):
+                await self._http_response(writer, 405, "Method Not Allowed", body=b"Method not allowed\n")
+                return
+            filename = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+            path = self.path(filename)
+            if path is None or not os.path.isfile(path):
+                await self._http_response(writer, 404, "Not Found", body=b"Not found\n")
+                return
+            await self._http_send_file(writer, client, method, filename.lstrip("/"), path, headers)
+        except (asyncio.TimeoutError, ConnectionError, OSError) as err:
+            log.debug("fwserver, http %s: %s", client, err)
+        finally:
+            writer.close()
+
+    async def _http_send_file(self, writer, client, method, filename, path, headers):
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            start, end = 0, size
+            status, reason = 200, "OK"
+            response_headers = {"Content-Type": "application/octet-stream",
+                                "Accept-Ranges": "bytes",
+                                "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True)}
+            if "range" in headers:
+                tmp = self._http_range(headers["range"], size)
+                if tmp is None:
+                    response_headers = {"Content-Range": "bytes */%d" % size, "Content-Length": 0}
+                    await self._http_response(writer, 416, "Range Not Satisfiable", response_headers)
+                    return
+                start, end = tmp
+                status, reason = 206, "Partial Content"
+                response_headers["Content-Range"] = "bytes %d-%d/%d" % (start, end - 1, size)
+            response_headers["Content-Length"] = end - start
+            if method == "HEAD":
+                await self._http_response(writer, status, reason, response_headers)
+                return
+
+            transfer = self._start_transfer("http", client, filename, end - start)
+            if transfer is None:
+                await self._http_response(writer, 503, "Service Unavailable", body=b"Server busy\n")
+                return
+            try:
+                await self._http_response(writer, status, reason, response_headers)
+                chunk = 1024 * 1024
+                for rate in (self.bandwidth, self.client_bandwidth):
+                    if rate:
+                        chunk = min(chunk, max(rate // 10, 16384))
+                offset = start
+                while offset < end:
+                    count = min(chunk, end - offset)
+                    await self.throttle(client, count)
+                    await loop.sendfile(writer.transport, f, offset, count)
+                    offset += count
+                    transfer.sent = offset - start
+                    self._report(transfer)
+            except (ConnectionError, OSError) as err:
+                self._end_transfer(transfer, error=str(err))
+                return
+            self._end_transfer(transfer)
+
+
+def main():
+    fwconfig = getattr(config, "fwserver", {})
+    parser = argparse.ArgumentParser(description="Serve firmware to elements, with TFTP and HTTP")
+    parser.add_argument("-d", "--directory", default=fwconfig.get("directory"),
+                        help="Directory with firmware files")
+    parser.add_argument("--host", default=fwconfig.get("host", "0.0.0.0"),
+                        help="Address to listen on")
+    parser.add_argument("--tftp_port", type=int, default=fwconfig.get("tftp_port", 69),
+                        help="TFTP port, 0 to disable TFTP")
+    parser.add_argument("--http_port", type=int, default=fwconfig.get("http_port", 8080),
+                        help="HTTP port, 0 to disable HTTP")
+    parser.add_argument("--bandwidth", type=int, default=fwconfig.get("bandwidth", 0),
+                        help="Max bytes/second for all transfers, 0 is unlimited")
+    parser.add_argument("--client_bandwidth", type=int, default=fwconfig.get("client_bandwidth", 0),
+                        help="Max bytes/second for each client, 0 is unlimited")
+    parser.add_argument("--max_transfers", type=int, default=fwconfig.get("max_transfers", 0),
+                        help="Max number of parallel transfers, 0 is unlimited")
+    parser.add_argument("--loglevel",
+                        choices=['info', 'warning', 'error', 'debug'],
+                        default='info')
+    args = parser.parse_args()
+    log.setLevel(args.loglevel)
+
+    async def run():
+        try:
+            server = FirmwareServer(directory=args.directory, host=args.host,
+                                    tftp_port=args.tftp_port, http_port=args.http_port,
+                                    bandwidth=args.bandwidth or None,
+                                    client_bandwidth=args.client_bandwidth or None,
+                                    max_transfers=args.max_transfers or None)
+            await server.start()
+        except (FirmwareServerException, OSError) as err:
+            print("Error: %s" % err)
+            sys.exit(1)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ Logging functionality
 import sys
 import logging
 import logging.handlers
+import functools
+import contextlib
+import contextvars
 
 INFO = logging.INFO
 WARNING = logging.WARNING
@@ -26,35 +29,86 @@ def activateSyslog():
     logger.addHandler(syslogger)
 
 def setLevel(level):
+    global _level
     if isinstance(level, str):
         level = level_dict[level]
     logger.setLevel(level)
+    _level = logger.getEffectiveLevel()
+
+def _format(msg, args):
+    if args:
+        try:
+            msg = msg % args
+        except (TypeError, ValueError):
+            msg = "%s %s" % (msg, args)
+    return str(msg).replace('\n', ', ')
+
+def log(level, msg, *args):
+    """
+    Log msg % args. msg is only formatted if the level is enabled,
+    or a trace sink is active
+    """
+    sink = _sink.get()
+    if level < _level and sink is None:
+        return
+    try:
+        msg = _format(msg, args)
+    except UnicodeDecodeError:
+        return
+    if level >= _level:
+        logger.log(level, msg)
+    if sink is not None:
+        sink.record(b"l", ("%s %s" % (logging.getLevelName(level), msg)).encode("utf8", "replace"))
 
-def info(msg):
-    msg = str(msg).replace('\n', ', ')
-    logger.info(msg)
+def debug(msg, *args):
+    if _level > DEBUG and _sink.get() is None:
+        return
+    log(DEBUG, msg, *args)
 
-def warning(msg):
-    msg = str(msg).replace('\n', ', ')
-    logger.warning(msg)
+def info(msg, *args):
+    log(INFO, msg, *args)
 
-def error(msg):
-    msg = str(msg).replace('\n', ', ')
-    logger.error(msg)
+def warning(msg, *args):
+    log(WARNING, msg, *args)
 
-def debug(msg):
-    try:
-        msg = str(msg).replace('\n', ', ')
-    except UnicodeDecodeError:
-        return
-    logger.debug(msg)
+def error(msg, *args):
+    log(ERROR, msg, *args)
 
-def log(level, msg):
+def isEnabledFor(level):
+    """
+    Returns True if messages at level are logged or traced
+    Use before building expensive log arguments
+    """
+    return level >= _level or _sink.get() is not None
+
+@contextlib.contextmanager
+def trace(sink):
+    """
+    Send all log messages in the with block to sink, at all levels,
+    in addition to the normal log. Messages are written with
+    sink.record(b"l", data), see comm.TranscriptWriter
+
+    Only the current thread or asyncio task is affected, so one element
+    can be traced without slowing down others
+    """
+    token = _sink.set(sink)
     try:
-        msg = str(msg).replace('\n', ', ')
-    except UnicodeDecodeError:
-        return
-    logger.log(level, msg)
+        yield sink
+    finally:
+        _sink.reset(token)
+
+def traced(func, sink):
+    """
+    Returns func, with all log messages also sent to sink
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with trace(sink):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sink.flush()
+    return wrapper
 
 def addLogger(stream):
     handler = logging.StreamHandler(stream)
@@ -65,13 +119,12 @@ def addLogger(stream):
 def removeLogger(handler):
     logger.removeHandler(handler)
 
-def isEnabledFor(level):
-    return logger.isEnabledFor(level)
-
 formatstr='%(asctime)s %(levelname)s %(message)s '
 loglevel = logging.INFO
 logger = logging.getLogger('luconf')
 logger.setLevel(loglevel)
+_level = loglevel           # Cached level, checked before formatting messages
+_sink = contextvars.ContextVar("emmgr_log_sink", default=None)     # Trace sink, see trace()
 
 # remove all handlers
 for hdlr in logger.handlers:
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+'''
+Latency metrics for element operations
+
+Code is instrumented with spans
+
+    with metrics.span("expect"):
+        ...
+
+Each span is tagged with hostname, model and command. Tags that are not
+given are taken from the enclosing span, so an expect inside a driver
+method gets the hostname, model and command of the method. Spans are
+tracked with contextvars, this works both in threads and asyncio tasks.
+
+Span durations are aggregated into histograms, one per span name and
+tags, that can be exported in Prometheus text format or as JSON.
+
+Spans used:
+  method            public driver method, called through Element
+  login             driver connect(), connect and login
+  connect           RemoteConnection.connect()
+  tcp_connect       TCP connect
+  ssh_handshake     SSH handshake and authentication
+  expect            Expect.expect()
+  wait_for_prompt   BaseDriver.wait_for_prompt()
+
+Metrics are disabled by default. When disabled span() returns a shared
+no-op context manager, and Element does not wrap driver methods.
+'''
+
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+import contextvars
+
+enabled = False
+
+labels = ("span", "hostname", "model", "command")
+
+# Upper bounds of the histogram buckets, in seconds
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current = contextvars.ContextVar("emmgr_span", default=None)
+
+
+class Histogram:
+    """
+    Distribution of durations, counts per bucket are not cumulative
+    The last count is for durations larger than the last bucket
+    """
+    __slots__ = ("counts", "count", "sum", "errors")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, buckets, seconds, error=False):
+        self.counts[bisect.bisect_left(buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+
+class Registry:
+    """
+    Histograms, keyed by the label values (span, hostname, model, command)
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(self.buckets, seconds, error)
+
+    def clear(self):
+        with self._lock:
+            self.histograms = {}
+
+    def _snapshot(self):
+        with self._lock:
+            res = [(key, list(h.counts), h.count, h.sum, h.errors) for key, h in self.histograms.items()]
+        return sorted(res, key=lambda item: tuple("" if v is None else str(v) for v in item[0]))
+
+    def to_dict(self):
+        """
+        Returns list of dicts, one per histogram, buckets are cumulative
+        """
+        res = []
+        for key, counts, count, total, errors in self._snapshot():
+            d = dict(zip(labels, key))
+            d.update(count=count, sum=round(total, 6), errors=errors)
+            buckets = {}
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = count
+            d["buckets"] = buckets
+            res.append(d)
+        return res
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_prometheus(self, name="emmgr_span_seconds"):
+        """
+        Returns the histograms in Prometheus text exposition format
+        """
+        lines = ["# HELP %s Duration of element operations" % name,
+                 "# TYPE %s histogram" % name]
+        errors = []
+        for key, counts, count, total, error_count in self._snapshot():
+            tags = ",".join('%s="%s"' % (label, escape(value)) for label, value in zip(labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, tags, bound, cumulative))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, tags, count))
+            lines.append("%s_sum{%s} %.6f" % (name, tags, total))
+            lines.append("%s_count{%s} %d" % (name, tags, count))
+            errors.append("emmgr_span_errors_total{%s} %d" % (tags, error_count))
+        lines.append("# HELP emmgr_span_errors_total Element operations that raised an exception")
+        lines.append("# TYPE emmgr_span_errors_total counter")
+        lines += errors
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """
+        Write metrics to filename, as JSON if the name ends with .json,
+        otherwise in Prometheus text format
+        The file is replaced atomically, for the node_exporter textfile collector
+        """
+        if filename.endswith(".json"):
+            data = self.to_json()
+        else:
+            data = self.to_prometheus()
+        tmpfile = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmpfile, "w") as f:
+            f.write(data)
+        os.replace(tmpfile, filename)
+
+
+def escape(value):
+    if value is None:
+        return ""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+class Span:
+    """
+    Measures the time of a with block, see span()
+    """
+    __slots__ = ("name", "hostname", "model", "command", "start", "token")
+
+    def __init__(self, name, hostname, model, command):
+        self.name = name
+        self.hostname = hostname
+        self.model = model
+        self.command = command
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            if self.hostname is None:
+                self.hostname = parent.hostname
+            if self.model is None:
+                self.model = parent.model
+            if self.command is None:
+                self.command = parent.command
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, typ, value, tb):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self.token)
+        registry.observe((self.name, self.hostname, self.model, self.command), elapsed, typ is not None)
+        return False
+
+
+class NullSpan:
+    """
+    Used when metrics are disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, tb):
+        return False
+
+
+null_span = NullSpan()
+
+
+def span(name, hostname=None, model=None, command=None):
+    """
+    Returns a context manager, that measures the time of the with block
+    """
+    if not enabled:
+        return null_span
+    return Span(name, hostname, model, command)
+
+
+def instrument(func, name, hostname=None, model=None, command=None):
+    """
+    Returns func wrapped in a span
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Span(name, hostname, model, command):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def enable(buckets=None):
+    global enabled
+    if buckets is not None:
+        registry.buckets = tuple(buckets)
+        registry.clear()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+'''
+Pool of authenticated connections to elements
+
+Keeps logged in RemoteConnection/Expect sessions alive, so repeated
+operations against the same element skips connect, handshake and login.
+
+Sessions are keyed by (hostname, port, method, username). Before a session is
+reused it is health checked: data left from the previous user is discarded,
+then a newline is sent and the prompt must be received. Sessions that has
+been idle longer than idle_timeout are closed.
+'''
+
+import time
+import threading
+
+import emmgr.lib.config as config
+import emmgr.lib.log as log
+import emmgr.lib.comm as comm
+
+
+class Session:
+    """
+    One authenticated session in the pool
+    """
+    def __init__(self, transport, em):
+        self.transport = transport
+        self.em = em
+        self.last_used = time.time()
+
+    def close(self):
+        try:
+            self.transport.disconnect()
+        except Exception as err:
+            log.debug("pool, error closing session: %s", err)
+
+
+class ConnectionPool:
+    """
+    Keeps idle sessions, until they are reused or have been idle too long
+    """
+
+    def __init__(self, idle_timeout=None, health_timeout=5, reap_interval=None, drain_timeout=0.01):
+        if idle_timeout is None:
+            idle_timeout = config.em.get("pool_idle_timeout", 300)
+        self.idle_timeout = idle_timeout
+        self.health_timeout = health_timeout
+        self.drain_timeout = drain_timeout  # Session is idle when nothing is received for this long
+        self._sessions = {}         # key is (hostname, port, method, username), value is list of Session
+        self._lock = threading.Lock()
+        self._reaper = None
+        if reap_interval:
+            self._reaper = threading.Thread(target=self._reap, args=(reap_interval,), daemon=True)
+            self._reaper.start()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(sessions) for sessions in self._sessions.values())
+
+    def _reap(self, interval):
+        while True:
+            time.sleep(interval)
+            self.expire()
+
+    def acquire(self, key, prompt):
+        """
+        Get an idle session for key
+        Returns a tuple (transport, em), or None if there is no usable session
+        """
+        self.expire()
+        while True:
+            with self._lock:
+                sessions = self._sessions.get(key)
+                if not sessions:
+                    return None
+                session = sessions.pop()
+            if self.check(session, prompt):
+                log.debug("pool, reusing session %s", key)
+                return session.transport, session.em
+            session.close()
+
+    def release(self, key, transport, em):
+        """
+        Return a session to the pool
+        A session where expect timed out is out of sync, and is closed
+        """
+        if getattr(em, "broken", False):
+            log.debug("pool, closing out of sync session %s", key)
+            Session(transport, em).close()
+            return
+        with self._lock:
+            self._sessions.setdefault(key, []).append(Session(transport, em))
+        self.expire()
+
+    def drain(self, session):
+        """
+        Discard received data, until nothing is received for drain_timeout
+        Returns False if the session does not become idle within health_timeout
+        """
+        deadline = time.monotonic() + self.health_timeout
+        while session.transport.read(65536, timeout=self.drain_timeout) is not None:
+            if time.monotonic() > deadline:
+                return False
+        return True
+
+    def check(self, session, prompt):
+        """
+        Verify that the session is alive and in sync
+        Discard data left from the previous user, send a newline and wait for
+        the prompt, the learned prompt of the session if any
+        """
+        if prompt is None:
+            return True
+        if session.em.prompt:
+            prompt = session.em.prompt.patterns
+        try:
+            if not self.drain(session):
+                log.debug("pool, session health check failed: not idle")
+                return False
+            session.em.writeln("")
+            session.em.expect(prompt, timeout=self.health_timeout)
+        except (comm.CommException, OSError) as err:
+            log.debug("pool, session health check failed: %s", err)
+            return False
+        return True
+
+    def expire(self):
+        """
+        Close all sessions idle longer than idle_timeout
+        """
+        expired = []
+        limit = time.time() - self.idle_timeout
+        with self._lock:
+            for key in list(self._sessions.keys()):
+                sessions = self._sessions[key]
+                keep = [session for session in sessions if session.last_used >= limit]
+                expired += [session for session in sessions if session.last_used < limit]
+                if keep:
+                    self._sessions[key] = keep
+                else:
+                    del self._sessions[key]
+        for session in expired:
+            session.close()
+
+    def close(self):
+        """
+        Close all sessions
+        """
+        with self._lock:
+            sessions = [session for tmp in self._sessions.values() for session in tmp]
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+
+_pool = None
+
+def get_pool():
+    """
+    Returns the process wide connection pool
+    """
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool()
+    return _pool
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
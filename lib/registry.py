@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+'''
+Process wide cache of model definitions and driver modules
+
+Creating an element needs the parsed yaml definitions for the model and
+the imported driver module. Both are loaded once and reused, until one
+of the files is changed on disk (mtime differs).
+'''
+
+import os
+import threading
+
+import emmgr.lib.config as config
+import emmgr.lib.util as util
+from emmgr.lib.basedriver import BaseDriver
+
+
+def definition_file(model):
+    return "%s/%s/%s-def.yaml" % (config.driver_dir, model, model)
+
+
+def driver_file(driver):
+    return "%s/%s.py" % (config.driver_dir, driver)
+
+
+def mtime(filename):
+    """
+    Returns modification time of filename, None if it does not exist
+    """
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ModelRegistry:
+    """
+    Cache of definitions and driver modules, keyed by model
+    """
+
+    def __init__(self):
+        self._definitions = {}      # model -> (list of (filename, mtime), definitions)
+        self._drivers = {}          # driver -> (mtime, module)
+        self._lock = threading.Lock()
+
+    def _is_current(self, files):
+        for filename, file_mtime in files:
+            if mtime(filename) != file_mtime:
+                return False
+        return True
+
+    def get_definitions(self, model):
+        """
+        Returns the definitions for model, see BaseDriver.load_definitions()
+        """
+        with self._lock:
+            cached = self._definitions.get(model)
+            if cached and self._is_current(cached[0]):
+                return cached[1]
+
+            definitions = BaseDriver.load_definitions(model)
+            files = []
+            layer = model
+            for data in definitions:
+                filename = definition_file(layer)
+                files.append((filename, mtime(filename)))
+                if 'driver' in data:
+                    layer = os.path.dirname(data.driver)
+            self._definitions[model] = (files, definitions)
+            return definitions
+
+    def get_driver(self, driver):
+        """
+        Returns the imported driver module, driver is for example "ios/ios_mgr"
+        """
+        filename = driver_file(driver)
+        with self._lock:
+            file_mtime = mtime(filename)
+            if file_mtime is None:
+                raise BaseDriver.ElementException("Missing element driver %s" % filename)
+            cached = self._drivers.get(driver)
+            if cached and cached[0] == file_mtime:
+                return cached[1]
+            module = util.import_file(filename)
+            self._drivers[driver] = (file_mtime, module)
+            return module
+
+    def get(self, model):
+        """
+        Returns (definitions, driver module) for model
+        """
+        definitions = self.get_definitions(model)
+        return definitions, self.get_driver(definitions[-1].driver)
+
+    def clear(self):
+        with self._lock:
+            self._definitions.clear()
+            self._drivers.clear()
+
+
+_registry = None
+
+def get_registry():
+    """
+    Returns the process wide model registry
+    """
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
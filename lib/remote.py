@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+'''
+Client for the emmgr daemon, see daemon.py
+
+Only uses the standard library, so it is fast to import. cli/emmgr uses
+forward_cli() to run "emmgr em" commands in the daemon when it is running.
+'''
+
+import os
+import sys
+import json
+import socket
+
+default_socket = "/run/emmgr/emmgrd.sock"
+
+
+class RemoteException(Exception):
+    def __init__(self, msg, errno=1):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+
+
+def socket_path():
+    """
+    Returns path to the daemon socket, can be changed with $EMMGR_SOCKET
+    """
+    return os.environ.get("EMMGR_SOCKET", default_socket)
+
+
+class Connection:
+    """
+    Connection to the daemon, one JSON document per line in each direction
+    """
+
+    def __init__(self, path=None, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path or socket_path())
+        except OSError:
+            self.sock.close()
+            raise
+        self.rfile = self.sock.makefile("rb")
+
+    def send(self, request):
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+
+    def receive(self):
+        line = self.rfile.readline()
+        if not line:
+            raise RemoteException("Connection closed by emmgr daemon")
+        return json.loads(line)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def forward_cli(argv, path=None):
+    """
+    Run the CLI command "emmgr em <argv>" in the daemon
+    Output is written to stdout and stderr
+    Returns the exit code, or None if the daemon is not running
+    """
+    if os.environ.get("EMMGR_NO_DAEMON"):
+        return None
+    try:
+        conn = Connection(path)
+    except OSError:
+        return None
+    try:
+        conn.send(dict(op="cli", argv=argv, cwd=os.getcwd()))
+        while True:
+            msg = conn.receive()
+            if "stdout" in msg:
+                sys.stdout.write(msg["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in msg:
+                sys.stderr.write(msg["stderr"])
+                sys.stderr.flush()
+            elif "exit" in msg:
+                return msg["exit"]
+            elif "error" in msg:
+                raise RemoteException(msg["error"])
+    except (OSError, ValueError, RemoteException) as err:
+        print("Error: emmgr daemon, %s" % err, file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+class RemoteElement:
+    """
+    An element in the daemon, with the same methods as Element
+
+    Each method call is run on a new element in the daemon, using a pooled
+    session. Results are returned as JSON types, errors are raised as
+    RemoteException
+    """
+    ElementException = RemoteException
+
+    def __init__(self, path=None, timeout=None, **kwargs):
+        self._kwargs = kwargs       # Element parameters: hostname, model, ...
+        self._conn = Connection(path, timeout)
+
+    def _call(self, method, *args, **kwargs):
+        self._conn.send(dict(op="call", element=self._kwargs, method=method, args=args, kwargs=kwargs))
+        msg = self._conn.receive()
+        if "error" in msg:
+            raise RemoteException(msg["error"], msg.get("errno", 1))
+        return msg.get("result")
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        def call(*args, **kwargs):
+            return self._call(attr, *args, **kwargs)
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+
+def status(path=None):
+    """
+    Returns status of the daemon, dict with pid, sessions and requests
+    """
+    conn = Connection(path, timeout=10)
+    try:
+        conn.send(dict(op="status"))
+        return conn.receive().get("result")
+    finally:
+        conn.close()
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
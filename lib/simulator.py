@@ -0,0 +1,920 @@
+#!/usr/bin/env python3
+'''
+Simulated elements, for testing and benchmarking drivers without hardware
+
+Serves an IOS-like, VRP-like or iBOS-like CLI over telnet, and over ssh
+if the asyncssh module is installed. Each simulated element listens on
+its own port, so one process can host thousands of elements on loopback.
+
+The simulated elements handles login, enable, terminal settings, some
+show/display commands and configuration mode. Configuration changes are
+stored, so they are visible in the running-config.
+
+Latency (delay before each response), bandwidth (bytes/second) and size
+(number of interfaces, controls the size of the output) are configurable.
+
+  emmgr sim --personality ios --count 1000 --port 20000 --inventory sim.yaml
+'''
+
+import re
+import asyncio
+import argparse
+
+import yaml
+
+import emmgr.lib.log as log
+import emmgr.lib.configtree as configtree
+
+# Telnet protocol
+IAC  = 255
+WILL = 251
+SB   = 250
+SE   = 240
+
+
+class SimConfig:
+    """
+    Running configuration of a simulated element
+    List of sections, each a header line and a list of child lines
+    """
+
+    def __init__(self):
+        self.sections = []
+
+    def find(self, line):
+        """
+        Returns section for line, or None
+        Interface names can be abbreviated
+        """
+        line = line.strip()
+        for section in self.sections:
+            if section[0] == line:
+                return section
+        if line.startswith("interface "):
+            return self.find_interface(line[10:])
+        return None
+
+    def find_interface(self, name):
+        name = configtree.split_interface(name)
+        if name is None:
+            return None
+        for section in self.sections:
+            if section[0].startswith("interface "):
+                cand = configtree.split_interface(section[0][10:])
+                if cand and cand[1] == name[1] and cand[0].startswith(name[0]):
+                    return section
+        return None
+
+    def enter(self, line):
+        """
+        Returns section for line, created if needed
+        """
+        section = self.find(line)
+        if section is None:
+            section = [line.strip(), []]
+            self.sections.append(section)
+        return section
+
+    def set(self, line, section=None):
+        """
+        Add line to section, or as a top level line
+        A line starting with "no " removes the line
+        """
+        line = line.strip()
+        if section is None:
+            if line.startswith("no "):
+                existing = self.find(line[3:])
+                if existing:
+                    self.sections.remove(existing)
+                return
+            self.enter(line)
+            return
+        children = section[1]
+        if line.startswith("no "):
+            line = line[3:]
+            for child in list(children):
+                if child == line or child.startswith(line + " "):
+                    children.remove(child)
+            return
+        if line not in children:
+            children.append(line)
+
+    def lines(self, separator="!", indent=" "):
+        res = []
+        for line, children in self.sections:
+            res.append(line)
+            for child in children:
+                res.append(indent + child)
+            if children:
+                res.append(separator)
+        return res
+
+
+class Session:
+    """
+    State for one login session
+    """
+    def __init__(self, element):
+        self.element = element
+        self.username = None
+        self.mode = "login"
+        self.section = None     # Configuration section, in configuration mode
+        self.pending = None     # If set, called with next line instead of a command
+        self.echo = True        # Echo received lines
+        self.closed = False
+
+
+class Personality:
+    """
+    Base class for the CLI of a simulated element
+    Subclasses sets prompts and messages, and a list of commands
+    """
+    name = None
+    username_prompt = "Username: "
+    password_prompt = "Password: "
+    login_failed = "% Authentication failed"
+    invalid = "% Invalid input detected at '^' marker."
+    separator = "!"
+    hostname_line = "hostname %s"
+    interface_name = "GigabitEthernet0/%d"
+    commands = []               # list of (regex, method name), tried in order
+
+    def __init__(self, hostname, size=24, username=None, password=None, enable_password=None, macs=0):
+        self.hostname = hostname
+        self.size = size
+        self.macs = macs        # number of entries in the MAC address table
+        self.flash = {}         # filename -> size
+        self.flash_size = 128 * 1024 * 1024
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.neighbors = []     # list of (local port, hostname, remote port, ipaddr, platform)
+        self.config = SimConfig()
+        self.config.enter(self.hostname_line % hostname)
+        for i in range(1, size + 1):
+            section = self.config.enter("interface " + self.interface_name % i)
+            for line in self.interface_config(i):
+                self.config.set(line, section)
+        self._commands = [(re.compile(regex), getattr(self, name)) for regex, name in self.commands]
+
+    def interface_config(self, ix):
+        return ["description sim port %d" % ix]
+
+    def mac_entries(self):
+        """
+        Yields (mac, vlan, port) for the simulated MAC address table
+        """
+        for n in range(self.macs):
+            port = n % self.size + 1
+            yield "%012x" % (0x020000000000 + n), 100 + port, port
+
+    # ----- login -----
+
+    def start(self, session, login=True):
+        """
+        Returns initial output for a new session
+        """
+        if login:
+            session.pending = self._username
+            return self.username_prompt
+        self._logged_in(session)
+        return ""
+
+    def _username(self, session, line):
+        session.username = line
+        session.pending = self._password
+        session.echo = False
+        return self.password_prompt
+
+    def _password(self, session, line):
+        session.echo = True
+        if session.username != self.username or line != self.password:
+            session.closed = True
+            return self.login_failed + "\r\n"
+        self._logged_in(session)
+        return ""
+
+    def _logged_in(self, session):
+        if self.enable_password:
+            session.mode = "disable"
+        else:
+            session.mode = "enable"
+
+    # ----- commands -----
+
+    def prompt(self, session):
+        raise NotImplementedError
+
+    def command(self, session, line):
+        """
+        Run a command, returns output
+        """
+        line = line.strip()
+        if not line:
+            return ""
+        if session.mode == "config":
+            return self.config_command(session, line)
+        filter_ = None
+        if " | " in line:
+            line, filter_ = line.split(" | ", 1)
+        for regex, func in self._commands:
+            match = regex.match(line)
+            if match:
+                output = func(session, match)
+                break
+        else:
+            return self.invalid
+        if filter_ and isinstance(output, list):
+            words = filter_.split(None, 1)
+            if len(words) == 2 and "include".startswith(words[0]):
+                p = re.compile(words[1])
+                output = [l for l in output if p.search(l)]
+            elif len(words) == 2 and "begin".startswith(words[0]):
+                p = re.compile(words[1])
+                for ix, l in enumerate(output):
+                    if p.search(l):
+                        output = output[ix:]
+                        break
+                else:
+                    output = []
+        return output
+
+    def config_command(self, session, line):
+        raise NotImplementedError
+
+    def cmd_none(self, session, match):
+        return ""
+
+    def cmd_close(self, session, match):
+        session.closed = True
+        return ""
+
+    def running_config(self, session, match):
+        name = match.groupdict().get("interface")
+        if name:
+            section = self.config.find_interface(name)
+            if section is None:
+                return self.invalid
+            return [section[0]] + [" " + child for child in section[1]]
+        return self.config.lines(separator=self.separator)
+
+
+class IOS(Personality):
+    name = "ios"
+    commands = [
+        (r"en(able)?$", "cmd_enable"),
+        (r"term(inal)? (length|width) \d+$", "cmd_none"),
+        (r"sh(ow)? ver(sion)?$", "cmd_version"),
+        (r"sh(ow)? run(ning-config)?( interface (?P<interface>.+))?$", "running_config"),
+        (r"sh(ow)? int(erfaces)? status$", "cmd_interfaces"),
+        (r"sh(ow)? cdp n(eighbors)? d(etail)?$", "cmd_cdp"),
+        (r"sh(ow)? mac(-| )address-table$", "cmd_mac_table"),
+        (r"conf(igure)? t(erminal)?$", "cmd_configure"),
+        (r"(copy run(ning-config)? start(up-config)?|wr(ite)?( mem(ory)?)?)$", "cmd_save"),
+        (r"dir( flash:/?)?$", "cmd_dir"),
+        (r"copy (?P<url>\w+://\S+/(?P<filename>[^/\s]+)) flash:$", "cmd_copy"),
+        (r"reload$", "cmd_reload"),
+        (r"(exit|logout|quit)$", "cmd_close"),
+    ]
+
+    image = "sim-universalk9-mz.152-7.E2.bin"
+    boot_line = "boot system flash %s"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flash[self.image] = 25165824
+        self.config.set(self.boot_line % self.image)
+
+    def interface_config(self, ix):
+        return ["description sim port %d" % ix,
+                "switchport trunk allowed vlan 1,%d-%d" % (100 + ix, 110 + ix),
+                "switchport mode trunk"]
+
+    def start(self, session, login=True):
+        output = super().start(session, login)
+        if login:
+            output = "\r\nUser Access Verification\r\n\r\n" + output
+        return output
+
+    def prompt(self, session):
+        if session.mode == "disable":
+            return "%s>" % self.hostname
+        if session.mode == "config":
+            if session.section:
+                return "%s(config-if)#" % self.hostname
+            return "%s(config)#" % self.hostname
+        return "%s#" % self.hostname
+
+    def cmd_enable(self, session, match):
+        if session.mode != "disable":
+            return ""
+        session.pending = self._enable
+        session.echo = False
+        return self.password_prompt
+
+    def _enable(self, session, line):
+        session.echo = True
+        if line != self.enable_password:
+            return "% Access denied"
+        session.mode = "enable"
+        return ""
+
+    def cmd_version(self, session, match):
+        return ["Cisco IOS Software, Simulated Software, Version 15.2(7)E2",
+                "",
+                "%s uptime is 1 week, 2 days, 3 hours, 4 minutes" % self.hostname,
+                "System image file is \"flash:sim-universalk9-mz.152-7.E2.bin\"",
+                "",
+                "cisco WS-C2960X-48TS-L (APM86XXX) processor with 524288K bytes of memory.",
+                "%d Gigabit Ethernet interfaces" % self.size,
+                "Configuration register is 0xF"]
+
+    def cmd_interfaces(self, session, match):
+        res = ["Port      Name               Status       Vlan       Duplex  Speed Type"]
+        for i in range(1, self.size + 1):
+            res.append("Gi0/%-5d sim port %-9d connected    trunk        a-full a-1000 10/100/1000BaseTX" % (i, i))
+        return res
+
+    def cmd_cdp(self, session, match):
+        res = []
+        for local_ix, hostname, remote_ix, ipaddr, platform in self.neighbors:
+            res += ["-------------------------",
+                    "Device ID: %s" % hostname,
+                    "Entry address(es): ",
+                    "  IP address: %s" % ipaddr,
+                    "Platform: %s,  Capabilities: Switch IGMP " % platform,
+                    "Interface: GigabitEthernet0/%d,  Port ID (outgoing port): GigabitEthernet0/%d" % (local_ix, remote_ix),
+                    ""]
+        return res
+
+    def cmd_mac_table(self, session, match):
+        res = ["          Mac Address Table",
+               "-------------------------------------------",
+               "",
+               "Vlan    Mac Address       Type        Ports",
+               "----    -----------       --------    -----",
+               " All    0100.0ccc.cccc    STATIC      CPU"]
+        for mac, vlan, port in self.mac_entries():
+            res.append("%4d    %s.%s.%s    DYNAMIC     Gi0/%d" % (vlan, mac[0:4], mac[4:8], mac[8:], port))
+        res.append("Total Mac Addresses for this criterion: %d" % (self.macs + 1))
+        return res
+
+    def cmd_dir(self, session, match):
+        res = ["Directory of flash:/", ""]
+        for ix, (filename, size) in enumerate(self.flash.items()):
+            res.append("%5d  -rwx  %11d  Mar 1 1993 00:04:52 +00:00  %s" % (ix + 2, size, filename))
+        res += ["",
+                "%d bytes total (%d bytes free)" % (self.flash_size, self.flash_size - sum(self.flash.values()))]
+        return res
+
+    def cmd_copy(self, session, match):
+        url, filename = match.group("url", "filename")
+        session.pending = lambda session, line: self._copy(session, url, line or filename)
+        return "Destination filename [%s]? " % filename
+
+    def _copy(self, session, url, filename):
+        size = 8 * 1024 * 1024
+        self.flash[filename] = size
+        return ["Accessing %s..." % url,
+                "Loading %s: !!!!!!!!!!" % filename,
+                "[OK - %d bytes]" % size,
+                "",
+                "%d bytes copied in 1.234 secs (6797950 bytes/sec)" % size]
+
+    def cmd_configure(self, session, match):
+        session.mode = "config"
+        session.section = None
+        return "Enter configuration commands, one per line.  End with CNTL/Z."
+
+    def cmd_save(self, session, match):
+        if match.group(0).startswith("copy"):
+            session.pending = self._save
+            return "Destination filename [startup-config]? "
+        return self._save(session, "")
+
+    def _save(self, session, line):
+        return ["Building configuration...", "[OK]"]
+
+    def cmd_reload(self, session, match):
+        session.pending = self._reload
+        return "Proceed with reload? [confirm]"
+
+    def _reload(self, session, line):
+        session.closed = True
+        return "Reload command."
+
+    def config_command(self, session, line):
+        if line == "end":
+            session.mode = "enable"
+            session.section = None
+            return ""
+        if line == "exit":
+            if session.section:
+                session.section = None
+            else:
+                session.mode = "enable"
+            return ""
+        if line.startswith("do "):
+            session.mode = "enable"
+            try:
+                return self.command(session, line[3:])
+            finally:
+                session.mode = "config"
+        if line.startswith("invalid"):
+            return self.invalid
+        if line.startswith("default interface "):
+            section = self.config.find(line[8:])
+            if section:
+                del section[1][:]
+            return ""
+        if line.startswith("interface ") or \
+           (session.section is None and re.match(r"(router|vlan|line|ip access-list) ", line)):
+            session.section = self.config.enter(line)
+            return ""
+        self.config.set(line, session.section)
+        return ""
+
+
+class VRP(Personality):
+    name = "vrp"
+    username_prompt = "Username:"
+    password_prompt = "Password:"
+    login_failed = "Error: Local authentication is rejected."
+    invalid = "Error: Unrecognized command found at '^' position."
+    separator = "#"
+    hostname_line = "sysname %s"
+    interface_name = "GigabitEthernet0/0/%d"
+    commands = [
+        (r"super$", "cmd_super"),
+        (r"(mmi-mode enable|screen-length 0 temporary|screen-width \d+)$", "cmd_none"),
+        (r"dis(play)? ver(sion)?$", "cmd_version"),
+        (r"dis(play)? cu(rrent-config\S*)?( interface (?P<interface>.+))?$", "running_config"),
+        (r"dis(play)? int(erface)? br(ief)?$", "cmd_interfaces"),
+        (r"dis(play)? mac-address$", "cmd_mac_table"),
+        (r"sys(tem(-view)?)?$", "cmd_system_view"),
+        (r"save$", "cmd_save"),
+        (r"reboot$", "cmd_reboot"),
+        (r"(quit|logout)$", "cmd_close"),
+    ]
+
+    def interface_config(self, ix):
+        return ["description sim port %d" % ix,
+                "port link-type trunk",
+                "port trunk allow-pass vlan %d to %d" % (100 + ix, 110 + ix)]
+
+    def _logged_in(self, session):
+        session.mode = "enable"
+
+    def prompt(self, session):
+        if session.mode == "config":
+            if session.section:
+                return "[%s-%s]" % (self.hostname, session.section[0].split(None, 1)[-1])
+            return "[%s]" % self.hostname
+        return "<%s>" % self.hostname
+
+    def cmd_super(self, session, match):
+        if not self.enable_password:
+            return "Now user privilege is 3 level, and only those commands whose level is equal to or less than this level can be used. Privilege note: 0-VISIT, 1-MONITOR, 2-SYSTEM, 3-MANAGE"
+        session.pending = self._super
+        session.echo = False
+        return self.password_prompt
+
+    def _super(self, session, line):
+        session.echo = True
+        if line != self.enable_password:
+            return "Error: Password is incorrect."
+        return "Now user privilege is 3 level, 3-MANAGE"
+
+    def cmd_version(self, session, match):
+        return ["Huawei Versatile Routing Platform Software",
+                "VRP (R) software, Version 5.170 (S5720 V200R019C10SPC500)",
+                "HUAWEI S5720-52X-SI-AC Routing Switch uptime is 9 days, 2 hours, 3 minutes"]
+
+    def cmd_interfaces(self, session, match):
+        res = ["Interface                   PHY   Protocol  InUti OutUti   inErrors  outErrors"]
+        for i in range(1, self.size + 1):
+            res.append("GigabitEthernet0/0/%-8d up    up           0%%     0%%          0          0" % i)
+        return res
+
+    def cmd_mac_table(self, session, match):
+        res = ["MAC address table of slot 0:",
+               "-------------------------------------------------------------------------------",
+               "MAC Address    VLAN/       PEVLAN CEVLAN Port            Type      LSP/LSR-ID",
+               "               VSI/SI                                              MAC-Tunnel",
+               "-------------------------------------------------------------------------------"]
+        for mac, vlan, port in self.mac_entries():
+            res.append("%s-%s-%s %-11d -      -      GE0/0/%-9d dynamic   0/-" % (mac[0:4], mac[4:8], mac[8:], vlan, port))
+        res += ["-------------------------------------------------------------------------------",
+                "Total matching items on slot 0 displayed = %d" % self.macs]
+        return res
+
+    def cmd_system_view(self, session, match):
+        session.mode = "config"
+        session.section = None
+        return "Enter system view, return user view with Ctrl+Z."
+
+    def cmd_save(self, session, match):
+        # Sent after the prompt, like the element does
+        session.element.later("Save the configuration successfully.")
+        return "Now saving the current configuration to the slot 0."
+
+    def cmd_reboot(self, session, match):
+        session.closed = True
+        return "Info: The system is rebooting."
+
+    def config_command(self, session, line):
+        if line == "return":
+            session.mode = "enable"
+            session.section = None
+            return ""
+        if line == "quit":
+            if session.section:
+                session.section = None
+            else:
+                session.mode = "enable"
+            return ""
+        if line.startswith("invalid"):
+            return self.invalid
+        if re.match(r"(interface|vlan|bgp|ospf|acl) ", line):
+            session.section = self.config.enter(line)
+            return ""
+        if line.startswith("undo "):
+            line = "no " + line[5:]
+        self.config.set(line, session.section)
+        return ""
+
+
+class IBOS(IOS):
+    name = "ibos"
+    username_prompt = "Username:"
+    password_prompt = "Password:"
+    login_failed = "Login incorrect"
+    invalid = "%-ERR: Invalid command"
+    interface_name = "gi1/0/%d"
+    image = "ibos-ms4k-6.3.11-ED-R.bz2"
+    boot_line = "boot system flash:%s"
+    commands = [
+        (r"enable$", "cmd_enable"),
+        (r"terminal no pager$", "cmd_none"),
+        (r"show version$", "cmd_version"),
+        (r"show running-config( context interface (?P<interface>.+))?$", "running_config"),
+        (r"show mac-address-table$", "cmd_mac_table"),
+        (r"show boot$", "cmd_show_boot"),
+        (r"ls flash:$", "cmd_ls"),
+        (r"copy (?P<url>\w+://\S+/(?P<filename>[^/\s]+)) flash:(?P<dest>\S*)$", "cmd_copy"),
+        (r"delete flash:(?P<filename>\S+)$", "cmd_delete"),
+        (r"configure terminal$", "cmd_configure"),
+        (r"copy running-config startup-config$", "cmd_save"),
+        (r"reload$", "cmd_reload"),
+        (r"(exit|logout)$", "cmd_close"),
+    ]
+
+    def interface_config(self, ix):
+        return ["description sim port %d" % ix,
+                "vlan member %d-%d" % (100 + ix, 110 + ix)]
+
+    def start(self, session, login=True):
+        return Personality.start(self, session, login)
+
+    def cmd_version(self, session, match):
+        return ["Westermo iBOS, Simulated",
+                "Version: 4.20.0",
+                "Uptime: 9 days, 2:03:04"]
+
+    def cmd_mac_table(self, session, match):
+        res = ["VLAN  MAC Address        Type     Port",
+               "----  -----------------  -------  --------"]
+        for mac, vlan, port in self.mac_entries():
+            mac = ":".join(mac[i:i+2] for i in range(0, 12, 2))
+            res.append("%-4d  %s  Dynamic  gi1/0/%d" % (vlan, mac, port))
+        return res
+
+    def cmd_show_boot(self, session, match):
+        boot = None
+        for line, children in self.config.sections:
+            if line.startswith("boot system flash:"):
+                boot = line[18:]
+        return "boot=%s" % boot
+
+    def cmd_ls(self, session, match):
+        res = ["Permissions  Size      Date                 Name",
+               "-----------  --------  -------------------  ----"]
+        for filename, size in self.flash.items():
+            res.append("-rw-r--r--   %-8d  2019-01-01 12:00:00  %s" % (size, filename))
+        return res
+
+    def cmd_copy(self, session, match):
+        filename = match.group("dest") or match.group("filename")
+        size = 8 * 1024 * 1024
+        self.flash[filename] = size
+        progress = "".join("%d/%d\r" % (done, size) for done in range(0, size, size // 4))
+        return progress + "\r\nTransferred %d bytes successfully in 1 seconds" % size
+
+    def cmd_delete(self, session, match):
+        if self.flash.pop(match.group("filename"), None) is None:
+            return "%-ERR: No such file"
+        return ""
+
+    def cmd_save(self, session, match):
+        return ""
+
+    def cmd_reload(self, session, match):
+        session.pending = self._reload
+        return "Reboot system? [y/N]:"
+
+
+personalities = {cls.name: cls for cls in (IOS, VRP, IBOS)}
+
+
+class LineReader:
+    """
+    Split received data in lines, removes telnet commands
+    """
+    def __init__(self, read):
+        self.read = read
+        self.buffer = bytearray()
+        self.lines = []
+        self._cr = False
+        self._iac = 0           # 1 after IAC, 2 when an option byte follows
+        self._sb = False        # True if inside subnegotiation
+
+    async def readline(self):
+        while not self.lines:
+            data = await self.read(4096)
+            if not data:
+                return None
+            self._feed(data)
+        return self.lines.pop(0)
+
+    def _feed(self, data):
+        for c in data:
+            if self._iac == 2:
+                self._iac = 0
+                continue
+            if self._iac == 1:
+                self._iac = 0
+                if c >= WILL:
+                    self._iac = 2
+                elif c == SB:
+                    self._sb = True
+                elif c == SE:
+                    self._sb = False
+                elif c == IAC and not self._sb:
+                    self.buffer.append(c)
+                continue
+            if c == IAC:
+                self._iac = 1
+                continue
+            if self._sb:
+                continue
+            if c == 13 or (c == 10 and not self._cr):
+                self.lines.append(self.buffer.decode("utf8", errors="ignore"))
+                self.buffer = bytearray()
+            if c in (0, 10, 13):
+                self._cr = c == 13
+                continue
+            self._cr = False
+            self.buffer.append(c)
+
+
+class SimElement:
+    """
+    One simulated element
+    """
+    def __init__(self, simulator, index):
+        self.simulator = simulator
+        self.index = index
+        self.hostname = "sim%04d" % index
+        self.port = simulator.port + index if simulator.port else None
+        self.ssh_port = simulator.ssh_port + index if simulator.ssh_port else None
+        self.personality = simulator.personality_cls(
+            self.hostname, size=simulator.size, username=simulator.username,
+            password=simulator.password, enable_password=simulator.enable_password,
+            macs=simulator.macs)
+        self._later = []        # Messages to send after next prompt
+
+        # Elements are connected in a ring, port 1 to previous and port 2 to next element
+        # Port 3 has a device that is not simulated
+        neighbors = self.personality.neighbors
+        platform = "cisco WS-C2960X-48TS-L"
+        if simulator.count > 1:
+            neighbors.append((1, "sim%04d" % ((index - 1) % simulator.count), 2, simulator.host, platform))
+        if simulator.count > 2:
+            neighbors.append((2, "sim%04d" % ((index + 1) % simulator.count), 1, simulator.host, platform))
+        if simulator.size >= 3:
+            neighbors.append((3, "phone%04d" % index, 1, "10.0.%d.%d" % (index // 250, index % 250 + 1), "Cisco IP Phone 8841"))
+
+    def later(self, msg):
+        self._later.append(msg)
+
+
+class Simulator:
+    """
+    A number of simulated elements, listening on consecutive ports
+    """
+
+    def __init__(self, personality="ios", host="127.0.0.1", port=2300, ssh_port=None,
+                 count=1, latency=0, bandwidth=None, size=24,
+                 username="admin", password="admin", enable_password=None, macs=0):
+        if personality not in personalities:
+            raise ValueError("Unknown personality %s, use one of %s" % (personality, ", ".join(personalities)))
+        self.personality = personality
+        self.personality_cls = personalities[personality]
+        self.host = host
+        self.port = port
+        self.ssh_port = ssh_port
+        self.count = count
+        self.latency = latency          # seconds, before each response
+        self.bandwidth = bandwidth      # bytes/second, None is unlimited
+        self.size = size                # number of interfaces
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.macs = macs                # MAC address table entries, per element
+        self.elements = []
+        self.servers = []
+
+    async def start(self):
+        """
+        Start listening, for all elements
+        """
+        ssh_key = None
+        if self.ssh_port:
+            import asyncssh
+            ssh_key = asyncssh.generate_private_key("ssh-rsa")
+        for index in range(self.count):
+            element = SimElement(self, index)
+            self.elements.append(element)
+            if element.port:
+                server = await asyncio.start_server(
+                    lambda r, w, element=element: self._handle_telnet(element, r, w),
+                    self.host, element.port)
+                self.servers.append(server)
+            if element.ssh_port:
+                server = await asyncssh.create_server(
+                    self._ssh_server_class(), self.host, element.ssh_port,
+                    server_host_keys=[ssh_key], encoding=None,
+                    process_factory=lambda process, element=element: self._handle_ssh(element, process))
+                self.servers.append(server)
+        log.info("Simulator started, %d %s elements on %s", self.count, self.personality, self.host)
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    def inventory(self, use_ssh=False):
+        """
+        Returns a list of elements, usable as a batch_run inventory
+        """
+        res = []
+        for element in self.elements:
+            port = element.ssh_port if use_ssh else element.port
+            res.append(dict(hostname=element.hostname, model=self.personality,
+                            ipaddr_mgmt=self.host, port=port, use_ssh=use_ssh))
+        return res
+
+    def _ssh_server_class(self):
+        import asyncssh
+        simulator = self
+
+        class SSHServer(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return username == simulator.username and password == simulator.password
+
+        return SSHServer
+
+    async def _handle_telnet(self, element, reader, writer):
+        async def write(data):
+            writer.write(data)
+            await writer.drain()
+        try:
+            await self._serve(element, reader.read, write, login=True)
+        except (OSError, asyncio.IncompleteReadError) as err:
+            log.debug("sim %s, connection error: %s", element.hostname, err)
+        finally:
+            writer.close()
+
+    async def _handle_ssh(self, element, process):
+        async def write(data):
+            process.stdout.write(data)
+            await process.stdout.drain()
+        try:
+            await self._serve(element, process.stdin.read, write, login=False)
+        except OSError as err:
+            log.debug("sim %s, connection error: %s", element.hostname, err)
+        finally:
+            process.exit(0)
+
+    async def _send(self, write, text):
+        data = text.encode("utf8")
+        if not self.bandwidth:
+            await write(data)
+            return
+        chunk = max(1, self.bandwidth // 20)
+        for ix in range(0, len(data), chunk):
+            await write(data[ix:ix + chunk])
+            await asyncio.sleep(min(chunk, len(data) - ix) / self.bandwidth)
+
+    async def _serve(self, element, read, write, login=True):
+        """
+        Run one CLI session
+        """
+        personality = element.personality
+        session = Session(element)
+        reader = LineReader(read)
+        output = personality.start(session, login)
+        if not session.pending:
+            output += personality.prompt(session)
+        await self._send(write, output)
+        while not session.closed:
+            line = await reader.readline()
+            if line is None:
+                break
+            if session.echo:
+                output = line + "\r\n"
+            else:
+                output = "\r\n"
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            pending = session.pending
+            session.pending = None
+            if pending:
+                res = pending(session, line)
+            else:
+                res = personality.command(session, line)
+            if isinstance(res, list):
+                res = "\r\n".join(res)
+            if res:
+                output += res
+                if not session.pending:
+                    output += "\r\n"
+            if not session.pending and not session.closed:
+                output += personality.prompt(session)
+                while element._later:
+                    output += "\r\n" + element._later.pop(0) + "\r\n" + personality.prompt(session)
+            await self._send(write, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate elements, for testing and benchmarking")
+    parser.add_argument("--personality", choices=sorted(personalities), default="ios",
+                        help="Type of element to simulate")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on")
+    parser.add_argument("--port", type=int, default=2300,
+                        help="First telnet port, 0 for no telnet")
+    parser.add_argument("--ssh_port", type=int, default=0,
+                        help="First ssh port, 0 for no ssh (needs the asyncssh module)")
+    parser.add_argument("--count", type=int, default=1,
+                        help="Number of elements, on consecutive ports")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Delay in seconds before each response")
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="Bytes/second for output, 0 is unlimited")
+    parser.add_argument("--size", type=int, default=24,
+                        help="Number of interfaces in each element")
+    parser.add_argument("--macs", type=int, default=0,
+                        help="Number of MAC address table entries in each element")
+    parser.add_argument("-u", "--username", default="admin")
+    parser.add_argument("-p", "--password", default="admin")
+    parser.add_argument("-e", "--enable_password", default=None)
+    parser.add_argument("--inventory",
+                        help="Write an inventory for batch_run to this file")
+    parser.add_argument("--loglevel",
+                        choices=['info', 'warning', 'error', 'debug'],
+                        default='info')
+    args = parser.parse_args()
+    log.setLevel(args.loglevel)
+
+    async def run():
+        sim = Simulator(personality=args.personality, host=args.host, port=args.port,
+                        ssh_port=args.ssh_port, count=args.count, latency=args.latency,
+                        bandwidth=args.bandwidth or None, size=args.size,
+                        username=args.username, password=args.password,
+                        enable_password=args.enable_password, macs=args.macs)
+        await sim.start()
+        if args.inventory:
+            with open(args.inventory, "w") as f:
+                yaml.safe_dump(sim.inventory(use_ssh=not args.port), f, default_flow_style=False)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await sim.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+'''
+Discover the L2 topology, by crawling elements using l2_peers()
+
+Starting from one or more seed elements, l2_peers() is called on many
+elements in parallel. Each peer that is not already visited becomes a new
+element to crawl. Each element is contacted once, and links seen from
+both ends are only reported once.
+
+To connect to a discovered peer, the model is needed. It is taken from
+the inventory if the peer is there, otherwise from the model map, a list
+of regexes matched against the peer description. Peers without a model
+are included in the topology, but not crawled.
+'''
+
+import re
+import asyncio
+import ipaddress
+import xml.etree.ElementTree as ET
+
+import emmgr.lib.log as log
+import emmgr.lib.util as util
+from emmgr.lib.batch import BatchRunner
+from emmgr.lib.configtree import split_interface
+
+
+def host_key(name):
+    """
+    Returns key for a hostname or IP address, used to detect already visited elements
+    Hostnames are compared without domain
+    """
+    name = str(name).strip().lower()
+    try:
+        ipaddress.ip_address(name)
+        return name
+    except ValueError:
+        return name.split(".")[0]
+
+
+def element_keys(element):
+    """
+    Returns keys for element parameters, by hostname and by management address
+    The port is part of the key, elements can share address with different ports
+    """
+    keys = []
+    for name in (element.get("hostname"), element.get("ipaddr_mgmt")):
+        if name:
+            keys.append((host_key(name), element.get("port")))
+    return keys
+
+
+def interface_key(name):
+    """
+    Returns key for an interface name, so abbreviated and full names are equal
+    "Gi0/1" and "GigabitEthernet0/1" both returns "gi0/1"
+    """
+    if not name:
+        return ""
+    tmp = split_interface(name)
+    if tmp is None:
+        return name.strip().lower()
+    return tmp[0][:2] + tmp[1]
+
+
+class Topology:
+    """
+    Discovered elements and links between them
+    """
+
+    def __init__(self):
+        self.nodes = {}         # host_key -> dict with node attributes
+        self.links = {}         # link key -> dict with link attributes
+
+    def add_node(self, hostname, **attrs):
+        key = host_key(hostname)
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = dict(hostname=hostname)
+        for attr, value in attrs.items():
+            if value is not None:
+                node[attr] = value
+        return node
+
+    def add_link(self, local_host, local_if, remote_host, remote_if, **attrs):
+        """
+        Add a link. A link already seen from the other end is not added again
+        Returns True if the link is new
+        """
+        a = (host_key(local_host), interface_key(local_if))
+        b = (host_key(remote_host), interface_key(remote_if))
+        if remote_if:
+            key = frozenset((a, b))
+        else:
+            key = (a, b[0])     # Remote interface unknown
+        if key in self.links:
+            return False
+        if remote_if and ((b, a[0]) in self.links):
+            # Already seen from the other end, without interface
+            del self.links[(b, a[0])]
+        self.links[key] = dict(local_host=local_host, local_if=local_if,
+                               remote_host=remote_host, remote_if=remote_if, **attrs)
+        return True
+
+    def to_dict(self):
+        return dict(nodes=list(self.nodes.values()), links=list(self.links.values()))
+
+    def to_json(self):
+        return util.json_dumps(self.to_dict())
+
+    def to_graphml(self):
+        """
+        Returns the topology as a GraphML document
+        """
+        ns = "http://graphml.graphdrawing.org/xmlns"
+        root = ET.Element("graphml", xmlns=ns)
+        node_attrs = sorted({attr for node in self.nodes.values() for attr in node})
+        link_attrs = sorted({attr for link in self.links.values() for attr in link})
+        for attr in node_attrs:
+            ET.SubElement(root, "key", {"id": "n_" + attr, "for": "node", "attr.name": attr, "attr.type": "string"})
+        for attr in link_attrs:
+            ET.SubElement(root, "key", {"id": "e_" + attr, "for": "edge", "attr.name": attr, "attr.type": "string"})
+        graph = ET.SubElement(root, "graph", id="l2", edgedefault="undirected")
+        for key, node in self.nodes.items():
+            elem = ET.SubElement(graph, "node", id=key)
+            for attr, value in node.items():
+                ET.SubElement(elem, "data", key="n_" + attr).text = str(value)
+        for ix, link in enumerate(self.links.values()):
+            source = host_key(link["local_host"])
+            target = host_key(link["remote_host"])
+            elem = ET.SubElement(graph, "edge", id="e%d" % ix, source=source, target=target)
+            for attr, value in link.items():
+                if value is not None:
+                    ET.SubElement(elem, "data", key="e_" + attr).text = str(value)
+        return ET.tostring(root, encoding="unicode")
+
+
+class TopologyCrawler:
+    """
+    Crawl elements in parallel, using l2_peers()
+    """
+
+    def __init__(self, concurrency=50, timeout=120, max_depth=None, inventory=None,
+                 model_map=None, default_model=None, include=None, domain=None,
+                 mgr_cls=None, **defaults):
+        self.max_depth = max_depth
+        self.inventory = {}         # host_key -> element parameters
+        for element in inventory or []:
+            for name in (element.get("hostname"), element.get("ipaddr_mgmt")):
+                if name:
+                    self.inventory.setdefault(host_key(name), element)
+        self.model_map = []         # list of (compiled regex, model)
+        for entry in model_map or []:
+            self.model_map.append((re.compile(entry["match"]), entry["model"]))
+        self.default_model = default_model
+        self.include = re.compile(include) if include else None
+        self.domain = domain
+        self.runner = BatchRunner(concurrency=concurrency, timeout=timeout, mgr_cls=mgr_cls, **defaults)
+        self.concurrency = concurrency
+
+    def _target(self, peer):
+        """
+        Returns element parameters for a peer, or None if it should not be crawled
+        """
+        hostname = peer.get("remote_hostname") or peer.get("remote_ipaddr")
+        if not hostname:
+            return None
+        if self.include and not self.include.search(hostname):
+            return None
+        for name in (peer.get("remote_hostname"), peer.get("remote_ipaddr")):
+            if name and host_key(name) in self.inventory:
+                return dict(self.inventory[host_key(name)])
+        model = None
+        description = peer.get("remote_description") or ""
+        for regex, map_model in self.model_map:
+            if regex.search(description):
+                model = map_model
+                break
+        if model is None:
+            model = self.default_model
+        if model is None:
+            return None
+        target = dict(hostname=hostname, model=model)
+        if peer.get("remote_ipaddr"):
+            target["ipaddr_mgmt"] = peer["remote_ipaddr"]
+        return target
+
+    async def _l2_peers(self, element):
+        peers = await element.l2_peers(default_domain=self.domain)
+        return [dict(peer) for ifname, peer in peers]
+
+    async def crawl(self, seeds, callback=None):
+        """
+        Crawl from seeds, a list of element parameters (hostname, model, ...)
+        callback, if set, is called with the result for each element
+        Returns a Topology
+        """
+        topology = Topology()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        visited = set()             # element_keys() of contacted elements
+        tasks = {}                  # task -> depth
+
+        def schedule(kwargs, depth):
+            keys = element_keys(kwargs)
+            if visited.intersection(keys):
+                return
+            visited.update(keys)
+            task = asyncio.ensure_future(self.runner._run_element(semaphore, kwargs, self._l2_peers))
+            tasks[task] = depth
+
+        for seed in seeds:
+            schedule(dict(seed), 0)
+
+        while tasks:
+            done, pending = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                depth = tasks.pop(task)
+                res = task.result()
+                if callback:
+                    callback(res)
+                hostname = res["hostname"]
+                topology.add_node(hostname, model=res["model"], status=res["status"], error=res.get("error"))
+                if res["status"] != "ok":
+                    log.warning("topology, %s: %s", hostname, res.get("error"))
+                    continue
+                for peer in res["result"]:
+                    remote = peer.get("remote_hostname") or peer.get("remote_ipaddr")
+                    if not remote:
+                        continue
+                    target = self._target(peer)
+                    topology.add_node(remote, ipaddr_mgmt=peer.get("remote_ipaddr"),
+                                      description=peer.get("remote_description"))
+                    topology.add_link(hostname, peer.get("local_if"), remote, peer.get("remote_if"))
+                    if target and (self.max_depth is None or depth < self.max_depth):
+                        schedule(target, depth + 1)
+        return topology
+
+
+def crawl(seeds, **kwargs):
+    """
+    Crawl the topology from seeds, see TopologyCrawler
+    Returns a Topology
+    """
+    callback = kwargs.pop("callback", None)
+    crawler = TopologyCrawler(**kwargs)
+    return asyncio.run(crawler.crawl(seeds, callback=callback))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+'''
+Upgrade firmware on many elements, in waves
+
+Elements are read from an inventory, see batch.load_inventory(). The
+firmware for an element is, in order
+  - the "firmware" column in the inventory
+  - the image given for the element model
+  - the newest file in the firmware directory matching firmware_filter
+    in the model definitions
+
+Each wave is done in steps
+  copy      firmware is copied to the elements in the wave, in parallel,
+            with a limit on concurrent copies from each file server
+  boot      boot firmware is set and the running-config saved
+  reload    optional, elements are reloaded with a delay between each
+
+The state of each element is saved to a JSON file after each step. If the
+upgrade is interrupted and started again with the same state file, it
+continues where it stopped. Elements that failed are retried.
+
+With a fwserver.FirmwareServer, the firmware is served from this host,
+and transfer progress for each element is reported to the callback.
+'''
+
+import os
+import re
+import json
+import asyncio
+import urllib.parse
+
+import emmgr.lib.log as log
+import emmgr.lib.util as util
+from emmgr.lib.basedriver import BaseDriver
+from emmgr.lib.batch import BatchRunner
+from emmgr.lib.registry import get_registry
+
+# Steps, in order
+steps = ["copy", "boot", "reload"]
+
+
+class UpgradeException(Exception):
+    pass
+
+
+def natural_key(filename):
+    """
+    Sort key, so numbers in filenames are compared as numbers
+    "ibos-6.10.0" is newer than "ibos-6.9.1"
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", filename)]
+
+
+def find_firmware(model, firmware_dir):
+    """
+    Returns the newest file in firmware_dir matching firmware_filter for model
+    Returns None if the model has no filter, or no file matches
+    """
+    definitions = get_registry().get_definitions(model)
+    filter_ = BaseDriver.get_flat_definitions(model, definitions).get("firmware_filter")
+    if not filter_ or filter_ == "none":
+        return None
+    p = re.compile(filter_)
+    files = [f for f in os.listdir(firmware_dir) if p.search(f)]
+    if not files:
+        return None
+    return max(files, key=natural_key)
+
+
+def server_key(server):
+    """
+    Returns the host part of a file server URL, copies are limited per host
+    """
+    netloc = urllib.parse.urlsplit(server).netloc
+    return netloc or server
+
+
+class UpgradeState:
+    """
+    Per element progress, saved to a JSON file
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.elements = {}          # hostname -> dict with firmware, done, status, error, timestamp
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, "r") as f:
+                    self.elements = json.load(f)
+            except (OSError, ValueError) as err:
+                raise UpgradeException("Cannot load state file %s: %s" % (filename, err))
+
+    def get(self, hostname, firmware):
+        """
+        Returns state for hostname. If the firmware has changed the element starts over
+        """
+        state = self.elements.get(hostname)
+        if state is None or state.get("firmware") != firmware:
+            state = self.elements[hostname] = dict(firmware=firmware, done=None, status="pending")
+        return state
+
+    def update(self, hostname, **kwargs):
+        state = self.elements[hostname]
+        state.update(kwargs)
+        state["timestamp"] = util.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.save()
+
+    def save(self):
+        if not self.filename:
+            return
+        tmpfile = self.filename + ".tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(self.elements, f, indent=1)
+        os.replace(tmpfile, self.filename)
+
+
+class Upgrader:
+    """
+    Upgrade firmware on a list of elements, in waves
+    """
+
+    def __init__(self, server=None, images=None, firmware_dir=None,
+                 concurrency=50, per_server=10, wave_size=100, max_failures=None,
+                 set_boot=True, reload=False, reload_interval=0,
+                 delete_unneeded=False, state_file=None, timeout=3600,
+                 mgr_cls=None, callback=None, fwserver=None, **defaults):
+        self.server = server                # Default file server, for example tftp://10.10.16.50
+        self.fwserver = fwserver            # Built-in firmware server, used if server is not set
+        self.images = images or {}          # model -> firmware filename
+        self.firmware_dir = firmware_dir
+        self.per_server = per_server
+        self.wave_size = wave_size
+        self.max_failures = max_failures    # Stop if a wave has more failed elements
+        self.set_boot = set_boot
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self.delete_unneeded = delete_unneeded
+        self.state = UpgradeState(state_file)
+        self.callback = callback
+        self.runner = BatchRunner(concurrency=concurrency, timeout=timeout, mgr_cls=mgr_cls, **defaults)
+        self.concurrency = concurrency
+        self._semaphores = {}               # server_key -> asyncio.Semaphore
+        self._firmware = {}                 # model -> firmware, from firmware_dir
+        self._elements = {}                 # hostname -> element parameters
+
+    def _progress(self, hostname, step, status, msg=""):
+        log.info("upgrade, %s %s %s %s", hostname, step, status, msg)
+        if self.callback:
+            self.callback(hostname, step, status, msg)
+
+    def get_firmware(self, element):
+        """
+        Returns firmware filename for an element
+        """
+        if element.get("firmware"):
+            return element["firmware"]
+        model = element["model"]
+        if model in self.images:
+            return self.images[model]
+        if self.firmware_dir:
+            if model not in self._firmware:
+                self._firmware[model] = find_firmware(model, self.firmware_dir)
+            return self._firmware[model]
+        return None
+
+    def _server_semaphore(self, server):
+        key = server_key(server)
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.per_server)
+        return semaphore
+
+    def _last_step(self):
+        if self.reload:
+            return "reload"
+        if self.set_boot:
+            return "boot"
+        return "copy"
+
+    def _is_done(self, state, step):
+        return state["done"] is not None and steps.index(state["done"]) >= steps.index(step)
+
+    async def _copy_and_boot(self, element, hostname, firmware, server):
+        state = self.state.elements[hostname]
+        if not self._is_done(state, "copy"):
+            async with self._server_semaphore(server):
+                self._progress(hostname, "copy", "running", "%s/%s" % (server, firmware))
+                if not await element.sw_exist(firmware):
+                    if self.delete_unneeded:
+                        await element.sw_delete_unneeded()
+                    await self._copy(element, hostname, firmware, server)
+            self.state.update(hostname, done="copy", status="ok", error=None)
+            self._progress(hostname, "copy", "ok")
+        if self.set_boot and not self._is_done(state, "boot"):
+            self._progress(hostname, "boot", "running", firmware)
+            await element.sw_set_boot(firmware)
+            await element.save_running_config()
+            self.state.update(hostname, done="boot", status="ok", error=None)
+            self._progress(hostname, "boot", "ok")
+
+    async def _copy(self, element, hostname, firmware, server):
+        watcher = None
+        address = self._elements[hostname].get("ipaddr_mgmt") or hostname
+        if self.fwserver and server == self.server:
+            def watcher(transfer):
+                if transfer.status == "running":
+                    self._progress(hostname, "copy", "progress", "%d of %d bytes" % (transfer.sent, transfer.size))
+            self.fwserver.watch(address, watcher)
+        try:
+            await element.sw_copy_to(mgr=server, filename=firmware,
+                                     callback=lambda msg: log.debug("upgrade, %s %s" % (hostname, msg)))
+        finally:
+            if watcher:
+                self.fwserver.unwatch(address, watcher)
+
+    async def _reload(self, element, hostname):
+        self._progress(hostname, "reload", "running")
+        await element.reload(save_config=False)
+        self.state.update(hostname, done="reload", status="ok", error=None)
+        self._progress(hostname, "reload", "ok")
+
+    async def _run_step(self, elements, operation, interval=0):
+        """
+        Run operation(element, hostname) on elements, returns number of failed elements
+        If interval is set, elements are started with interval seconds between them
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_element(kwargs, delay):
+            if delay:
+                await asyncio.sleep(delay)
+            hostname = kwargs["hostname"]
+            return await self.runner._run_element(semaphore, kwargs,
+                                                  lambda element: operation(element, hostname))
+
+        tasks = [run_element(kwargs, ix * interval) for ix, kwargs in enumerate(elements)]
+        failed = 0
+        for res in await asyncio.gather(*tasks):
+            if res["status"] != "ok":
+                failed += 1
+                hostname = res["hostname"]
+                done = self.state.elements[hostname]["done"]
+                step = steps[steps.index(done) + 1] if done else steps[0]
+                self.state.update(hostname, status=res["status"], error=res.get("error"))
+                self._progress(hostname, step, res["status"], res.get("error"))
+        return failed
+
+    async def run_wave(self, elements):
+        """
+        Upgrade one wave of elements, returns number of failed elements
+        """
+        last_step = self._last_step()
+        todo = []
+        for kwargs in elements:
+            hostname = kwargs["hostname"]
+            state = self.state.elements[hostname]
+            if not self._is_done(state, last_step):
+                todo.append(kwargs)
+
+        copy_step = "boot" if self.set_boot else "copy"
+        copy_elements = [kwargs for kwargs in todo
+                         if not self._is_done(self.state.elements[kwargs["hostname"]], copy_step)]
+
+        def copy_and_boot(element, hostname):
+            kwargs = self._elements[hostname]
+            server = kwargs.get("firmware_server") or self.server
+            return self._copy_and_boot(element, hostname, self.state.elements[hostname]["firmware"], server)
+
+        failed = await self._run_step(copy_elements, copy_and_boot)
+
+        if self.reload:
+            reload_elements = [kwargs for kwargs in todo
+                               if self.state.elements[kwargs["hostname"]]["done"] == "boot"]
+            failed += await self._run_step(reload_elements, self._reload, interval=self.reload_interval)
+        return failed
+
+    async def run(self, elements):
+        """
+        Upgrade all elements, in waves
+        Returns dict with number of elements per status
+        """
+        if self.fwserver:
+            try:
+                await self.fwserver.start()
+            except OSError as err:
+                raise UpgradeException("Cannot start firmware server: %s" % err)
+            if not self.server:
+                self.server = self.fwserver.url()
+            try:
+                return await self._run(elements)
+            finally:
+                await self.fwserver.stop()
+        return await self._run(elements)
+
+    async def _run(self, elements):
+        queue = []
+        for kwargs in elements:
+            hostname = kwargs["hostname"]
+            firmware = self.get_firmware(kwargs)
+            if not firmware:
+                self._progress(hostname, "copy", "skipped", "no firmware for model %s" % kwargs["model"])
+                continue
+            if not (kwargs.get("firmware_server") or self.server):
+                raise UpgradeException("No file server for %s" % hostname)
+            self.state.get(hostname, firmware)
+            self._elements[hostname] = kwargs
+            queue.append(kwargs)
+        self.state.save()
+
+        for start in range(0, len(queue), self.wave_size):
+            wave = queue[start:start + self.wave_size]
+            log.info("upgrade, wave %d, %d elements", start // self.wave_size + 1, len(wave))
+            failed = await self.run_wave(wave)
+            if self.max_failures is not None and failed > self.max_failures:
+                log.error("upgrade, %d elements failed in wave, stopping", failed)
+                break
+        return self.summary()
+
+    def summary(self):
+        """
+        Returns dict, number of elements per state
+        """
+        res = {}
+        last_step = self._last_step()
+        for hostname in self._elements:
+            state = self.state.elements[hostname]
+            if state["status"] != "ok":
+                key = state["status"]
+            elif self._is_done(state, last_step):
+                key = "done"
+            else:
+                key = "pending"
+            res[key] = res.get(key, 0) + 1
+        return res
+
+
+def upgrade(elements, **kwargs):
+    """
+    Upgrade elements, see Upgrader
+    Returns dict with number of elements per status
+    """
+    upgrader = Upgrader(**kwargs)
+    return asyncio.run(upgrader.run(elements))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
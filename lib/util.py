@@ -8,12 +8,12 @@ import os.path
 import datetime
 import json
 import yaml
-import pprint
 import argparse
 import importlib.machinery
 from orderedattrdict import AttrDict
 
-pp = pprint.PrettyPrinter(indent=4)
+# The C parser from libyaml is much faster, if available
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 class UtilException(Exception):
@@ -69,7 +69,8 @@ def pretty_print(msg, d):
             pass
     if msg:
         print(msg)
-    pp.pprint(d)
+    import pprint
+    pprint.PrettyPrinter(indent=4).pprint(d)
 
 def now():
     return datetime.datetime.now().replace(microsecond=0)
@@ -102,7 +103,7 @@ def yaml_load(filename):
     with open(filename, "r") as f:
         try:
             # self.default_data = yaml.load(f)
-            data = ordered_load(f, yaml.SafeLoader)
+            data = ordered_load(f, yaml_loader)
             return data
         except yaml.YAMLError as err:
             raise UtilException("Cannot load YAML file %s, err: %s" % (filename, err))
@@ -119,10 +120,10 @@ def str2bool(v):
 
 class BaseCLI:
     
-    def __init__(self):
+    def __init__(self, argv=None):
         self.parser = argparse.ArgumentParser()
         self.add_arguments()
-        self.args = self.parser.parse_args()
+        self.args = self.parser.parse_args(argv)   # None is sys.argv
         
     def add_arguments(self):
         """Superclass overrides this to add additional arguments"""
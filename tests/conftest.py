@@ -0,0 +1,85 @@
+'''
+Fixtures for tests that need elements, using the element simulator
+'''
+
+import socket
+import asyncio
+import threading
+
+import pytest
+
+from emmgr.lib.simulator import Simulator
+from emmgr.lib.element import Element
+
+
+def free_port(count=1):
+    """
+    Returns a port where count consecutive ports are free
+    """
+    for _ in range(100):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        try:
+            socks = []
+            for ix in range(count):
+                s = socket.socket()
+                socks.append(s)
+                s.bind(("127.0.0.1", port + ix))
+            return port
+        except OSError:
+            pass
+        finally:
+            for s in socks:
+                s.close()
+    raise OSError("No free ports")
+
+
+class SimThread:
+    """
+    A Simulator, running in its own thread and event loop
+    """
+
+    def __init__(self, personality="ios", count=1, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.simulator = Simulator(personality=personality, port=free_port(count), count=count, **kwargs)
+        self.call(self.simulator.start())
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+
+    def inventory(self):
+        return self.simulator.inventory()
+
+    def element(self, index=0, mgr_cls=Element, **kwargs):
+        """
+        Returns an Element for simulated element index
+        """
+        args = dict(self.inventory()[index], username="admin", password="admin")
+        args.update(kwargs)
+        return mgr_cls(**args)
+
+    async def _stop(self):
+        await self.simulator.stop()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        self.call(self._stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+@pytest.fixture
+def sim():
+    """
+    One simulated IOS element, use sim.element() to connect
+    """
+    s = SimThread()
+    yield s
+    s.stop()
@@ -0,0 +1,101 @@
+'''
+Tests for batch, using the element simulator
+'''
+
+import time
+import asyncio
+
+from emmgr.lib import batch
+from emmgr.lib.comm import CommException
+from emmgr.lib.element import Element
+from emmgr.lib.pool import ConnectionPool
+from conftest import free_port
+
+
+def run_batch(runner, elements, operation):
+    async def collect():
+        return [res async for res in runner.run(elements, operation)]
+    return asyncio.run(collect())
+
+
+def test_load_inventory_csv(tmp_path):
+    filename = tmp_path / "inventory.csv"
+    filename.write_text("hostname,model,ipaddr_mgmt\nsw1,ios,10.0.0.1\nsw2,ibos,\n")
+    elements = batch.load_inventory(str(filename))
+    assert elements == [dict(hostname="sw1", model="ios", ipaddr_mgmt="10.0.0.1"),
+                        dict(hostname="sw2", model="ibos")]
+
+
+def test_run_commands(sim):
+    elements = sim.inventory()
+    res = run_batch(batch.BatchRunner(username="admin", password="admin"), elements,
+                    lambda element: element.run(cmd="show version"))
+    assert res[0]["status"] == "ok"
+    assert res[0]["result"][0].startswith("Cisco IOS")
+
+
+def test_timeout_aborts_blocked_thread(sim):
+    runner = batch.BatchRunner(timeout=1, username="admin", password="admin")
+
+    async def operation(element):
+        def blocked():
+            element.driver.connect()
+            element.driver.em.expect("never matches", timeout=30)
+        await asyncio.get_running_loop().run_in_executor(runner.executor, blocked)
+
+    res = run_batch(runner, sim.inventory(), operation)
+    assert res[0]["status"] == "timeout"
+    start = time.monotonic()
+    runner.executor.shutdown(wait=True)
+    assert time.monotonic() - start < 5
+
+
+def test_timeout_closes_element(sim, tmp_path):
+    pool = ConnectionPool()
+    runner = batch.BatchRunner(timeout=1, username="admin", password="admin", pool=pool)
+    elements = [dict(sim.inventory()[0], trace=str(tmp_path / "sim.trace"))]
+    drivers = []
+
+    async def operation(element):
+        drivers.append(element.driver)
+        await element.run(cmd="show version")
+        await asyncio.sleep(10)
+
+    res = run_batch(runner, elements, operation)
+    assert res[0]["status"] == "timeout"
+    assert drivers[0]._trace.f is None
+    assert len(pool) == 0
+    pool.close()
+
+
+def test_error_message():
+    assert batch.error_message(CommException(1, "timeout")) == "timeout"
+    assert batch.error_message(Element.ElementException(CommException(1, "refused"))) == "refused"
+    assert batch.error_message(Element.ElementException("failed")) == "failed"
+    assert batch.error_message(ValueError("bad")) == "bad"
+
+
+def test_ssh_without_asyncssh_uses_threaded_driver(monkeypatch):
+    import emmgr.lib.aiocomm as aiocomm
+    monkeypatch.setattr(aiocomm, "ssh_available", lambda: False)
+    # Nothing listens on the port, the threaded ssh connect fails at once
+    elements = [dict(hostname="sw1", model="ios", ipaddr_mgmt="127.0.0.1", port=free_port(), use_ssh=True)]
+    native = []
+
+    async def operation(element):
+        native.append(element.is_native("run"))
+        assert not element.is_native("connect")
+        return await element.run(cmd="show version")
+
+    res = run_batch(batch.BatchRunner(username="admin", password="admin"), elements, operation)
+    assert native == [False]
+    assert res[0]["status"] == "error"
+    assert "asyncssh" not in res[0]["error"]
+
+
+def test_telnet_is_native(sim):
+    async def operation(element):
+        return element.is_native("run")
+
+    res = run_batch(batch.BatchRunner(username="admin", password="admin"), sim.inventory(), operation)
+    assert res[0]["result"] is True
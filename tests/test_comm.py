@@ -0,0 +1,114 @@
+'''
+Tests for comm, matching of received data
+'''
+
+from emmgr.lib.comm import Matcher, Prompt
+
+
+def feed(matcher, chunks):
+    """
+    Feed chunks until a match, returns key of the matching pattern or None
+    """
+    for chunk in chunks:
+        key = matcher.feed(chunk)
+        if key is not None:
+            return key
+    return None
+
+
+def test_matcher_string_pattern():
+    m = Matcher("#")
+    assert feed(m, ["show version\r\n", "sw1#"]) == "0"
+    assert m.match == "#"
+    assert m.before == "show version\r\nsw1#"
+    assert m.after == ""
+
+
+def test_matcher_list_and_dict_keys():
+    assert feed(Matcher([">", "#"]), ["sw1#"]) == 1
+    assert feed(Matcher({"user": "sername:", "pass": "assword:"}), ["Password: "]) == "pass"
+
+
+def test_matcher_match_split_over_chunks():
+    m = Matcher("sw1#")
+    assert feed(m, ["output\r\nsw", "1", "#"]) == "0"
+    assert m.before == "output\r\nsw1#"
+
+
+def test_matcher_after_is_returned():
+    m = Matcher("assword:")
+    assert feed(m, ["Password: extra"]) == "0"
+    assert m.after == " extra"
+
+
+def test_matcher_unbounded_pattern_uses_lookbehind():
+    m = Matcher(r"start.*end", lookbehind=64)
+    assert feed(m, ["start", "x" * 20, "end"]) == "0"
+
+
+def test_matcher_no_match():
+    m = Matcher("#")
+    assert feed(m, ["a", "b"]) is None
+    assert m.get_data() == "ab"
+
+
+def test_matcher_normalize():
+    assert Matcher.normalize("#") == {"0": "#"}
+    assert Matcher.normalize([">", "#"]) == {0: ">", 1: "#"}
+    assert Matcher.normalize({"a": "#"}) == {"a": "#"}
+
+
+def test_matcher_caret_only_at_start_of_data():
+    assert feed(Matcher("^abc"), ["abc"]) == "0"
+    # The window starts at "ab" after the first chunk is trimmed, not a start of data
+    assert feed(Matcher("^abc"), ["x" * 100 + "ab", "c"]) is None
+
+
+def test_prompt_learn():
+    prompt = Prompt.learn("login ok\r\nsw1(config-if)#", "#", "#")
+    assert prompt.name == "sw1"
+    assert prompt.mode == "config-if"
+    assert Prompt.learn("login ok\r\nsome text#", "#", "#") is None
+    assert Prompt.learn("sw1#", "", "#") is None
+
+
+def test_prompt_update():
+    prompt = Prompt("sw1", "#")
+    prompt.update("\r\nsw1(config)#")
+    assert prompt.mode == "config"
+    prompt.update("sw1#")
+    assert prompt.mode == ""
+
+
+def test_prompt_pattern():
+    prompt = Prompt("sw1", {"prompt": "#"})
+    m = Matcher(prompt.patterns)
+    assert feed(m, ["show run\r\nhostname sw1\r\n", "sw1(config)# "]) == "prompt"
+    assert m.match == "sw1(config)# "
+    assert feed(Matcher(prompt.patterns), ["sw1#"]) == "prompt"
+
+
+def test_prompt_pattern_followed_by_data():
+    m = Matcher(Prompt("sw1", "#").patterns)
+    assert feed(m, ["output\r\nsw1#\r\nmore"]) == "0"
+    assert m.after == "\r\nmore"
+
+
+def test_prompt_pattern_not_in_line():
+    m = Matcher(Prompt("sw1", "#").patterns)
+    assert feed(m, ["banner xsw1#\r\n", "echo sw1# text\r\n", "sw1#x\r\n", "sw2#"]) is None
+
+
+def test_prompt_pattern_line_start_in_earlier_chunk():
+    m = Matcher(Prompt("sw1", "#").patterns)
+    assert feed(m, ["x" * 100 + "\r\n", "sw1", "#"]) == "0"
+    m = Matcher(Prompt("sw1", "#").patterns)
+    assert feed(m, ["x" * 100, "sw1", "#"]) is None
+
+
+def test_prompt_config_and_exec_pattern():
+    prompt = Prompt("sw1", "#")
+    data = "interface Gi0/1\r\nsw1(config-if)#description x\r\nsw1#"
+    assert prompt.config_pattern.search(data).group() == "sw1(config-if)#"
+    assert prompt.exec_pattern.search(data).group() == "sw1#"
+    assert prompt.exec_pattern.search("xsw1#") is None
@@ -0,0 +1,79 @@
+'''
+Tests for configtree
+'''
+
+from emmgr.lib.configtree import ConfigTree, split_interface
+
+
+CONFIG = """\
+hostname sw1
+!
+interface GigabitEthernet0/1
+ description uplink
+ switchport mode trunk
+ switchport trunk allowed vlan 10,20
+!
+interface GigabitEthernet0/2
+ description access
+ switchport access vlan 10
+!
+interface TenGigabitEthernet0/1
+ description core
+!
+router bgp 65000
+ neighbor 10.0.0.1 remote-as 65001
+ address-family ipv4
+  network 10.0.0.0
+ exit-address-family
+!
+end
+""".splitlines()
+
+
+def test_split_interface():
+    assert split_interface("GigabitEthernet0/1") == ("gigabitethernet", "0/1")
+    assert split_interface("Port-channel 1") == ("port-channel", "1")
+    assert split_interface("vlan") is None
+
+
+def test_parse():
+    tree = ConfigTree(CONFIG)
+    assert len(tree) == 6
+    assert tree.root.children[0].line == "hostname sw1"
+    assert tree.sections("interface")[0].lines() == ["interface GigabitEthernet0/1",
+                                                     " description uplink",
+                                                     " switchport mode trunk",
+                                                     " switchport trunk allowed vlan 10,20"]
+
+
+def test_section():
+    tree = ConfigTree(CONFIG)
+    node = tree.section("router bgp 65000", "address-family ipv4")
+    assert node.lines(children_only=True) == ["  network 10.0.0.0"]
+    assert node.parent.line == "router bgp 65000"
+    assert tree.section("router bgp 65000", "address-family ipv6") is None
+
+
+def test_sections_filter():
+    tree = ConfigTree(CONFIG)
+    assert len(tree.sections("interface")) == 3
+    trunks = tree.sections("interface", "switchport mode trunk")
+    assert [node.line for node in trunks] == ["interface GigabitEthernet0/1"]
+    assert [node.line for node in tree.sections("router bgp")] == ["router bgp 65000"]
+    assert tree.sections("vlan") == []
+
+
+def test_interface():
+    tree = ConfigTree(CONFIG)
+    assert tree.interface("GigabitEthernet0/2").get("description access")
+    assert tree.interface("Gi0/1").line == "interface GigabitEthernet0/1"
+    assert tree.interface("Te0/1").line == "interface TenGigabitEthernet0/1"
+    assert tree.interface("Gi0/9") is None
+    assert tree.interface("nonsense") is None
+
+
+def test_filter():
+    tree = ConfigTree(CONFIG)
+    assert tree.filter_("^ description") == [" description uplink", " description access", " description core"]
+    assert tree.root.has("network 10.0.0.0")
+    assert not tree.root.has("network 192.168")
@@ -0,0 +1,106 @@
+'''
+Tests for configure, plain and pipelined, using the element simulator
+'''
+
+import time
+
+import pytest
+
+from emmgr.lib.element import Element
+
+
+def test_configure(sim):
+    with sim.element() as element:
+        element.configure(["interface Gi0/1", "description uplink"])
+        config = element.get_running_config()
+    assert " description uplink" in config
+
+
+def test_configure_pipelined(sim):
+    lines = ["interface Gi0/%d\n description port %d" % (i, i) for i in range(1, 25)]
+    with sim.element() as element:
+        element.configure("\n".join(lines), pipeline=True)
+        assert element.prompt_mode == ""
+        config = element.get_running_config()
+    assert " description port 24" in config
+
+
+def test_configure_pipelined_trailing_end(sim):
+    with sim.element() as element:
+        start = time.time()
+        element.configure(["interface Gi0/1", "description uplink", "end"], pipeline=True)
+        assert time.time() - start < 5
+        assert " description uplink" in element.get_running_config()
+
+
+def record_writes(element):
+    """
+    Returns a list, where all data written to the element is appended
+    """
+    element.connect()
+    writes = []
+    em = element.em
+    write = em.write
+
+    def record(data):
+        writes.append(data)
+        return write(data)
+    em.write = record
+    return writes
+
+
+def test_configure_pipelined_leaves_config_mode(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        with pytest.raises(Element.ElementException, match="line 2 'end' left configuration mode"):
+            element.configure(["interface Gi0/1", "end", "show version"], pipeline=True)
+        assert "show version" not in "".join(writes)
+        assert element.run("show version")[0].startswith("Cisco IOS")
+
+
+def test_configure_pipelined_exit_in_section(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        element.configure(["interface Gi0/1", "description one", "exit",
+                           "interface Gi0/2", "description two"], pipeline=True)
+        config = element.get_config_tree()
+    assert config.interface("Gi0/1").get("description one")
+    assert config.interface("Gi0/2").get("description two")
+    # "exit" is the last line of its window
+    assert [data for data in writes if "exit" in data][0].endswith("exit\r\n")
+
+
+def test_configure_pipelined_error(sim):
+    with sim.element() as element:
+        with pytest.raises(Element.ElementException, match="line 2 'invalid line'"):
+            element.configure(["interface Gi0/1", "invalid line", "description uplink"], pipeline=True)
+        assert element.prompt_mode == ""
+        assert element.run("show version")[0].startswith("Cisco IOS")
+
+
+def without_pipeline(element):
+    """
+    Replace the driver configure() with one that has no pipeline argument,
+    as in drivers that do not support pipelined configuration
+    """
+    configure = element._driver.configure
+
+    def configure_lines(config_lines, save_running_config=False, callback=None):
+        return configure(config_lines, save_running_config=save_running_config, callback=callback)
+    element._driver.configure = configure_lines
+
+
+def test_pipeline_kwargs(sim):
+    with sim.element() as element:
+        assert element.pipeline_kwargs(False) == {}
+        assert element.pipeline_kwargs(True) == {"pipeline": True}
+        without_pipeline(element)
+        assert element.pipeline_kwargs(True) == {}
+
+
+def test_transaction_pipeline_fallback(sim):
+    with sim.element() as element:
+        without_pipeline(element)
+        with element.transaction(pipeline=True):
+            element.configure(["interface Gi0/1", "description uplink"])
+        assert " description uplink" in element.get_running_config()
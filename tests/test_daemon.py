@@ -0,0 +1,35 @@
+'''
+Tests for the daemon request handling, using the element simulator
+'''
+
+import json
+
+import emmgr.lib.log as log
+import emmgr.lib.metrics as metrics
+import emmgr.lib.daemon as daemon
+
+
+def run_args(sim):
+    element = sim.inventory()[0]
+    return ["run", "-H", element["hostname"], "-i", element["ipaddr_mgmt"], "--port", str(element["port"]),
+            "-m", element["model"], "-u", "admin", "-p", "admin", "-t", "-c", "show version"]
+
+
+def test_run_cli_keeps_loglevel(sim, capsys):
+    level = log.logger.level
+    try:
+        assert daemon.run_cli(run_args(sim) + ["--loglevel", "error"], "/") == 0
+    finally:
+        daemon.release_elements(discard=True)
+    assert log.logger.level == level
+    assert "Cisco IOS" in capsys.readouterr().out
+
+
+def test_run_cli_metrics(sim, tmp_path):
+    assert not metrics.enabled
+    try:
+        assert daemon.run_cli(run_args(sim) + ["--metrics", "run.json"], str(tmp_path)) == 0
+    finally:
+        daemon.release_elements(discard=True)
+    assert not metrics.enabled
+    assert json.loads((tmp_path / "run.json").read_text())
@@ -0,0 +1,64 @@
+'''
+Tests for Element, using the element simulator
+'''
+
+import asyncio
+
+import pytest
+
+import emmgr.lib.metrics as metrics
+from emmgr.lib.comm import CommException
+from emmgr.lib.aiodriver import AsyncElement
+from emmgr.lib.basedriver import BaseDriver
+from emmgr.lib.element import Element
+from conftest import SimThread
+
+
+def test_helper_methods_not_measured(sim):
+    metrics.enable()
+    try:
+        with sim.element() as element:
+            assert element.run != element._driver.run
+            assert element.transaction == element._driver.transaction
+            assert element.get_definition == element._driver.get_definition
+            with element.transaction():
+                element.configure(["interface Gi0/1", "description uplink"])
+        commands = {d["command"] for d in metrics.registry.to_dict()}
+    finally:
+        metrics.disable()
+    assert "configure" in commands
+    assert "transaction" not in commands
+
+
+def test_run_timeout():
+    s = SimThread(latency=0.5)
+    try:
+        with s.element() as element:
+            element.connect()
+            with pytest.raises(CommException):
+                element.run(cmd="show version", timeout=0.1)
+    finally:
+        s.stop()
+
+
+def test_async_run_timeout():
+    s = SimThread(latency=0.5)
+
+    async def run():
+        element = await AsyncElement.create(**dict(s.inventory()[0], username="admin", password="admin"))
+        try:
+            await element.connect()
+            assert element.is_native("run")
+            with pytest.raises(CommException):
+                await element.run(cmd="show version", timeout=0.1)
+        finally:
+            await element.close()
+    try:
+        asyncio.run(run())
+    finally:
+        s.stop()
+
+
+def test_helper_methods_are_driver_methods():
+    for name in Element.helper_methods:
+        assert callable(getattr(BaseDriver, name, None)), name
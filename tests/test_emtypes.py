@@ -0,0 +1,137 @@
+'''
+Tests for emtypes
+'''
+
+import re
+
+import pytest
+
+from emmgr.lib.emtypes import VLANS, VLAN, MAC_Address, MACTable
+
+
+def test_parse_mask():
+    assert VLANS.parse_mask("1,5-7") == 0b11100010
+    assert VLANS.parse_mask("1 5 to 7") == 0b11100010
+    assert VLANS.parse_mask("none") == 0
+    assert VLANS.parse_mask("all") == VLANS.range_mask(1, 4094)
+    with pytest.raises(ValueError):
+        VLANS.parse_mask("4096")
+    with pytest.raises(ValueError):
+        VLANS.parse_mask("remove 5")
+
+
+def test_add_range_operations():
+    vlans = VLANS()
+    vlans.add_range("1,100-110")
+    vlans.add_range("add 200-202")
+    assert str(vlans) == "1,100-110,200-202"
+    vlans.add_range("remove 100-105,201")
+    assert str(vlans) == "1,106-110,200,202"
+    vlans.add_range("except 2-4094")
+    assert str(vlans) == "1"
+
+
+def test_add_range_untagged():
+    vlans = VLANS("10-12")
+    vlans.add_range("11", tagged=False)
+    assert vlans.is_tagged(10)
+    assert not vlans.is_tagged(11)
+    vlans.add_range("remove 11")
+    assert 11 not in vlans
+    assert not vlans.get_untagged()
+
+
+def test_format():
+    vlans = VLANS("1,5,6,10-20", delemiter=" ", range_delemiter=" to ")
+    assert str(vlans) == "1 5 6 10 to 20"
+    assert VLANS.parse("1 5 6 10 to 20") == VLANS("1,5-6,10-20")
+    assert repr(VLANS.parse("10-12", untagged="11")) == "VLANS(10-12, untagged 11)"
+
+
+def test_set_operations():
+    a = VLANS("1-10")
+    b = VLANS("5-15")
+    assert str(a | b) == "1-15"
+    assert str(a & b) == "5-10"
+    assert str(a - b) == "1-4"
+    assert str(a ^ b) == "1-4,11-15"
+    assert len(a) == 10
+
+
+def test_iadd():
+    vlans = VLANS()
+    vlans += 5
+    vlans += VLAN(id=6, tagged=False)
+    vlans += [7, 8]
+    vlans += "add 9"
+    assert str(vlans) == "5-9"
+    assert list(vlans.items())[1] == (6, False)
+    with pytest.raises(TypeError):
+        vlans += 1.5
+
+
+@pytest.mark.parametrize("text", ["11:22:33:aa:bb:cc", "11.22.33.aa.bb.cc", "11-22-33-aa-bb-cc",
+                                  "1122-33aa-bbcc", "1122.33AA.BBCC", "112233aabbcc"])
+def test_mac_parse(text):
+    mac = MAC_Address(text)
+    assert int(mac) == 0x112233aabbcc
+    assert str(mac) == "1122.33aa.bbcc"
+    assert mac.str_colon() == "11:22:33:aa:bb:cc"
+    assert mac == text
+
+
+@pytest.mark.parametrize("text", ["11:22:33:aa:bb", "1122.33aa.bbcg", ""])
+def test_mac_incorrect(text):
+    assert MAC_Address.parse(text) is None
+    with pytest.raises(ValueError):
+        MAC_Address(text)
+
+
+def test_mac_address():
+    mac = MAC_Address(0x112233aabbcc)
+    assert MAC_Address(mac) == mac
+    assert hash(MAC_Address("1122.33aa.bbcc")) == hash(mac)
+    assert mac.add(1) == "1122.33aa.bbcd"
+    assert MAC_Address(0xffffffffffff).add(1) == MAC_Address(0)
+    assert sorted([mac.add(1), mac]) == [mac, mac.add(1)]
+    assert mac.normalize_mac("11:22:33:aa:bb:cc") == "1122.33aa.bbcc"
+    with pytest.raises(ValueError):
+        MAC_Address(1 << 48)
+
+
+def test_mac_parse_many():
+    assert list(MAC_Address.parse_many(["11:22:33:aa:bb:cc", "0000.0000.0001"])) == [0x112233aabbcc, 1]
+    with pytest.raises(ValueError):
+        MAC_Address.parse_many(["11:22:33:aa:bb:cc", "nonsense"])
+
+
+def test_mac_table():
+    table = MACTable()
+    table.add("0000.0000.0001", 10, "Gi0/1")
+    table.add(MAC_Address(2), 10, "Gi0/1")
+    table.add(1, 20, "Gi0/2")
+    assert len(table) == 3
+    assert list(table) == [(1, 10, "Gi0/1"), (2, 10, "Gi0/1"), (1, 20, "Gi0/2")]
+    assert table.find("00:00:00:00:00:01") == [(10, "Gi0/1"), (20, "Gi0/2")]
+    assert table.find(3) == []
+    assert table.count_by_interface() == {"Gi0/1": 2, "Gi0/2": 1}
+    assert table.to_dict() == dict(macs=["0000.0000.0001", "0000.0000.0002", "0000.0000.0001"],
+                                   vlans=[10, 10, 20],
+                                   ifindexes=[0, 0, 1],
+                                   interfaces=["Gi0/1", "Gi0/2"])
+
+
+def test_mac_table_parse_lines():
+    regex = re.compile(r"^\s*(?P<vlan>\S+)\s+(?P<mac>[0-9a-f.]{14})\s+\S+\s+(?P<interface>\S+)")
+    lines = ["          Mac Address Table",
+             "Vlan    Mac Address       Type        Ports",
+             "----    -----------       --------    -----",
+             " All    0100.0ccc.cccc    STATIC      CPU",
+             "  10    0011.2233.4455    DYNAMIC     Gi0/1",
+             "  20    0011.2233.4466    DYNAMIC     Gi0/2",
+             "Total Mac Addresses for this criterion: 3"]
+    table = MACTable()
+    assert table.parse_lines(lines, regex) == 3
+    assert list(table) == [(0x01000ccccccc, 0, "CPU"),
+                           (0x001122334455, 10, "Gi0/1"),
+                           (0x001122334466, 20, "Gi0/2")]
@@ -0,0 +1,78 @@
+'''
+Tests for interface management, using the element simulator
+'''
+
+import pytest
+
+from emmgr.lib.element import Element
+from conftest import SimThread
+
+
+@pytest.fixture
+def ibos():
+    s = SimThread(personality="ibos")
+    yield s
+    s.stop()
+
+
+def test_interfaces_clear_config_none(sim):
+    with sim.element() as element:
+        with pytest.raises(Element.ElementException):
+            element.interfaces_clear_config(interfaces=None)
+        with pytest.raises(Element.ElementException):
+            element.interface_set_admin_state(interface=None, state=True)
+
+
+def test_interfaces_clear_config(sim):
+    with sim.element() as element:
+        element.interfaces_clear_config(interfaces=["Gi0/1", "Gi0/2"])
+        assert element.get_config_tree().interface("Gi0/1").lines(children_only=True) == []
+        assert element.get_config_tree().interface("Gi0/3").lines(children_only=True)
+
+
+def test_ibos_interfaces_clear_config_none(ibos):
+    with ibos.element() as element:
+        with pytest.raises(Element.ElementException):
+            element.interfaces_clear_config(interfaces=None)
+
+
+def test_ibos_interfaces_clear_config_transaction(ibos):
+    with ibos.element() as element:
+        with element.transaction():
+            element.interfaces_clear_config(interfaces=["gi1/0/1", "gi1/0/2"])
+            assert element._transaction == ["interface gi1/0/1",
+                                            "no description sim port 1",
+                                            "no vlan member 101-111",
+                                            "interface gi1/0/2",
+                                            "no description sim port 2",
+                                            "no vlan member 102-112"]
+
+
+def test_vlan_interface_delete(sim):
+    with sim.element() as element:
+        assert 105 in element.vlan_interface_get(interface="Gi0/1")
+        element.vlan_interface_create(interface="Gi0/1", vlan=200)
+        element.vlan_interface_delete(interface="Gi0/1", vlan=105)
+        vlans = element.vlan_interface_get(interface="Gi0/1")
+    assert 105 not in vlans
+    assert str(vlans) == "1,101-104,106-111,200"
+
+
+def test_ibos_sw_set_boot_transaction(ibos):
+    personality = ibos.simulator.elements[0].personality
+    personality.flash["new.bz2"] = 1024
+    with ibos.element() as element:
+        old = element.sw_get_boot()
+        with pytest.raises(RuntimeError):
+            with element.transaction():
+                element.sw_set_boot("new.bz2")
+                assert element.sw_get_boot() == old
+                raise RuntimeError("abort")
+        assert element.sw_get_boot() == old
+        with pytest.raises(Element.ElementException):
+            element.sw_delete(old)
+        with element.transaction():
+            element.sw_set_boot("new.bz2")
+        assert element.sw_get_boot() == "new.bz2"
+    with ibos.element() as element:
+        assert element.sw_get_boot() == "new.bz2"
@@ -0,0 +1,55 @@
+'''
+Tests for the connection pool, using the element simulator
+'''
+
+import time
+
+import pytest
+
+from emmgr.lib.pool import ConnectionPool
+
+
+def test_session_is_reused(sim):
+    pool = ConnectionPool()
+    with sim.element(pool=pool) as element:
+        element.run("show version")
+        transport = element.transport
+    assert len(pool) == 1
+    with sim.element(pool=pool) as element:
+        assert element.run("show version")[0].startswith("Cisco IOS")
+        assert element.transport is transport
+    pool.close()
+
+
+def test_stale_prompt_is_drained(sim):
+    pool = ConnectionPool()
+    with sim.element(pool=pool) as element:
+        element.run("show version")
+        element.em.writeln("")      # Prompt is received after release
+    time.sleep(0.1)
+    with sim.element(pool=pool) as element:
+        lines = element.run("show version")
+        assert lines[0].startswith("Cisco IOS")
+        assert element.run("show running-config")[0] == "hostname sim0000"
+    pool.close()
+
+
+def test_session_discarded_after_exception(sim):
+    pool = ConnectionPool()
+    with pytest.raises(RuntimeError):
+        with sim.element(pool=pool) as element:
+            element.run("show version")
+            raise RuntimeError("operation failed")
+    assert len(pool) == 0
+
+
+def test_session_discarded_after_expect_timeout(sim):
+    pool = ConnectionPool()
+    element = sim.element(pool=pool)
+    element.run("show version")
+    element.em.writeln("show version")
+    with pytest.raises(Exception):
+        element.em.expect("no such prompt", timeout=0.2)
+    assert element.em.broken
+    element.close()
+    assert len(pool) == 0
@@ -0,0 +1,67 @@
+'''
+Tests for topology
+'''
+
+import json
+import xml.etree.ElementTree as ET
+
+from emmgr.lib.topology import Topology, host_key, interface_key
+
+
+def test_keys():
+    assert host_key("SW1.example.com") == "sw1"
+    assert host_key("10.0.0.1") == "10.0.0.1"
+    assert interface_key("GigabitEthernet0/1") == interface_key("Gi0/1") == "gi0/1"
+    assert interface_key("") == ""
+
+
+def test_add_link():
+    topo = Topology()
+    assert topo.add_link("sw1", "Gi0/1", "sw2", "Gi0/2")
+    assert not topo.add_link("sw1", "Gi0/1", "sw2", "Gi0/2")
+    assert len(topo.links) == 1
+
+
+def test_add_link_other_end():
+    topo = Topology()
+    assert topo.add_link("sw1", "GigabitEthernet0/1", "sw2.example.com", "GigabitEthernet0/2")
+    assert not topo.add_link("sw2", "Gi0/2", "SW1", "Gi0/1")
+    assert len(topo.links) == 1
+
+
+def test_add_link_parallel():
+    topo = Topology()
+    assert topo.add_link("sw1", "Gi0/1", "sw2", "Gi0/1")
+    assert topo.add_link("sw1", "Gi0/2", "sw2", "Gi0/2")
+    assert len(topo.links) == 2
+
+
+def test_add_link_remote_if_unknown():
+    topo = Topology()
+    assert topo.add_link("sw1", "Gi0/1", "ap1", None)
+    assert not topo.add_link("sw1", "Gi0/1", "ap1", None)
+    # Seen from the other end, with interface, replaces the link
+    assert topo.add_link("ap1", "eth0", "sw1", "Gi0/1", platform="ap")
+    assert list(topo.links.values()) == [dict(local_host="ap1", local_if="eth0",
+                                              remote_host="sw1", remote_if="Gi0/1", platform="ap")]
+
+
+def test_add_node():
+    topo = Topology()
+    topo.add_node("sw1.example.com", model="ios")
+    topo.add_node("SW1", ipaddr_mgmt="10.0.0.1", model=None)
+    assert topo.nodes == {"sw1": dict(hostname="sw1.example.com", model="ios", ipaddr_mgmt="10.0.0.1")}
+
+
+def test_output():
+    topo = Topology()
+    topo.add_node("sw1")
+    topo.add_node("sw2")
+    topo.add_link("sw1", "Gi0/1", "sw2", "Gi0/2")
+    data = json.loads(topo.to_json())
+    assert len(data["nodes"]) == 2
+    assert data["links"][0]["remote_if"] == "Gi0/2"
+    root = ET.fromstring(topo.to_graphml())
+    ns = "{http://graphml.graphdrawing.org/xmlns}"
+    edges = root.findall("%sgraph/%sedge" % (ns, ns))
+    assert [(edge.get("source"), edge.get("target")) for edge in edges] == [("sw1", "sw2")]
@@ -0,0 +1,68 @@
+'''
+Tests for configuration transactions, using the element simulator
+'''
+
+import pytest
+
+
+def record_writes(element):
+    """
+    Returns a list, where all lines written to the element are appended
+    """
+    element.connect()
+    writes = []
+    em = element.em
+    writeln = em.writeln
+
+    def record(line):
+        writes.append(line)
+        return writeln(line)
+    em.writeln = record
+    return writes
+
+
+def test_transaction(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        with element.transaction():
+            element.vlan_interface_create(interface="Gi0/1", vlan=10)
+            element.vlan_interface_create(interface="Gi0/2", vlan=10)
+            assert writes == []
+        assert writes.count("configure terminal") == 1
+        assert writes.count("copy running-config startup-config") == 1
+        config = element.get_config_tree()
+        assert config.interface("Gi0/1").get("switchport trunk allowed vlan add 10")
+        assert config.interface("Gi0/2").get("switchport trunk allowed vlan add 10")
+
+
+def test_transaction_nested(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        with element.transaction():
+            element.configure(["interface Gi0/1", "description outer"])
+            with element.transaction(save_running_config=True):
+                element.configure(["interface Gi0/2", "description inner"])
+            assert writes == []
+        assert writes.count("configure terminal") == 1
+        assert writes.count("copy running-config startup-config") == 1
+
+
+def test_transaction_exception(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        with pytest.raises(RuntimeError):
+            with element.transaction():
+                element.configure(["interface Gi0/1", "description not sent"])
+                raise RuntimeError("abort")
+        assert writes == []
+        assert " description not sent" not in element.get_running_config()
+        element.configure(["interface Gi0/1", "description sent"])
+        assert " description sent" in element.get_running_config(refresh=True)
+
+
+def test_transaction_save_only(sim):
+    with sim.element() as element:
+        writes = record_writes(element)
+        with element.transaction():
+            element.save_running_config()
+        assert writes == ["copy running-config startup-config", ""]